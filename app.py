@@ -1,6 +1,41 @@
 from src.main import app
 
-if __name__ == "__main__":
+def main():
+    """启动API服务，workers大于1时以多进程模式运行"""
+    import argparse
+    import multiprocessing
+    import os
+    import secrets
     import uvicorn
-    from src.config.settings import API_HOST, API_PORT, API_RELOAD
-    uvicorn.run("app:app", host=API_HOST, port=API_PORT, reload=API_RELOAD) 
\ No newline at end of file
+    from src.config.settings import API_HOST, API_PORT, API_RELOAD, API_WORKERS
+    from src.utils.index_writer import run_index_writer
+
+    parser = argparse.ArgumentParser(description='音乐播放器API服务')
+    parser.add_argument('--port', type=int, default=None, help='API端口')
+    parser.add_argument('--workers', type=int, default=None, help='HTTP工作进程数')
+    args, _ = parser.parse_known_args()
+
+    port = args.port or API_PORT
+    workers = args.workers or API_WORKERS
+
+    if workers <= 1:
+        uvicorn.run("app:app", host=API_HOST, port=port, reload=API_RELOAD)
+        return
+
+    # 多进程模式：先启动唯一的扫描进程，它维护共享索引并持有播放器
+    authkey = secrets.token_bytes(16)
+    parent_conn, child_conn = multiprocessing.Pipe()
+    writer = multiprocessing.Process(target=run_index_writer, args=(child_conn, authkey), daemon=True)
+    writer.start()
+    player_host, player_port = parent_conn.recv()
+
+    # HTTP工作进程只读访问索引，通过代理控制播放器
+    os.environ["MUSIC_INDEX_MODE"] = "reader"
+    os.environ["MUSIC_PLAYER_ADDRESS"] = f"{player_host}:{player_port}"
+    os.environ["MUSIC_PLAYER_AUTHKEY"] = authkey.hex()
+
+    print(f"以多进程模式启动，工作进程数: {workers}，扫描进程ID: {writer.pid}")
+    uvicorn.run("app:app", host=API_HOST, port=port, workers=workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+启动性能基准
+
+测量两项指标并与预算比较，超出预算时以非零状态退出，可用于检查启动性能是否退化：
+1. 导入src.main的耗时（python -X importtime，取多次运行的最小值），并列出最慢的模块
+2. 从启动uvicorn进程到首个HTTP响应的耗时
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from src.utils.port_utils import find_free_port
+
+# 默认预算（毫秒）
+IMPORT_BUDGET_MS = 800
+FIRST_RESPONSE_BUDGET_MS = 3000
+
+def parse_importtime(stderr: str):
+    """解析-X importtime的输出，返回[(模块, 自身耗时, 累计耗时)]，单位微秒"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 表头
+        modules.append((parts[2].strip(), self_us, cumulative_us))
+    return modules
+
+def measure_import(runs: int):
+    """多次导入src.main，返回耗时最少的一次的模块列表"""
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import src.main"],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            print(result.stderr)
+            raise RuntimeError("导入src.main失败")
+        modules = parse_importtime(result.stderr)
+        total = next(cumulative for name, _, cumulative in modules if name == "src.main")
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+def measure_first_response(timeout: float) -> float:
+    """启动API服务并轮询根路径，返回首个响应的耗时（毫秒）"""
+    port = find_free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"API服务意外退出，退出代码: {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                    return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("等待API服务响应超时")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='API服务启动性能基准')
+    parser.add_argument('--runs', type=int, default=3, help='导入测量次数')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_MS, help='导入耗时预算（毫秒）')
+    parser.add_argument('--response-budget', type=float, default=FIRST_RESPONSE_BUDGET_MS, help='首个响应耗时预算（毫秒）')
+    parser.add_argument('--top', type=int, default=15, help='列出最慢的模块数量')
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    total_us, modules = measure_import(args.runs)
+    import_ms = total_us / 1000
+    print(f"导入src.main: {import_ms:.1f} ms（{args.runs}次中最快）")
+    print("最慢的模块（累计耗时）:")
+    for name, self_us, cumulative_us in sorted(modules, key=lambda m: m[2], reverse=True)[1:args.top + 1]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (自身 {self_us / 1000:6.1f} ms)  {name}")
+
+    response_ms = measure_first_response(timeout=max(30.0, args.response_budget / 1000 * 5))
+    print(f"首个响应: {response_ms:.1f} ms")
+
+    failures = []
+    if import_ms > args.import_budget:
+        failures.append(f"导入耗时 {import_ms:.1f} ms 超出预算 {args.import_budget:.0f} ms")
+    if response_ms > args.response_budget:
+        failures.append(f"首个响应耗时 {response_ms:.1f} ms 超出预算 {args.response_budget:.0f} ms")
+
+    for failure in failures:
+        print(f"失败: {failure}")
+    if not failures:
+        print("启动性能在预算之内")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,9 @@ const api = axios.create({
   timeout: 10000
 });
 
+// 当前页面的客户端ID，服务端据此取消被新搜索取代的请求
+const clientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+
 // 歌曲接口
 export interface Song {
   id: string;           // MD5 ID
@@ -13,8 +16,10 @@ export interface Song {
   path: string;
   size: number;
   add_time: number;
+  mtime?: number;       // 文件修改时间
   source?: string;      // 音乐来源（library）
   full_path?: string;   // 完整文件路径（仅在后端使用）
+  lyrics_path?: string; // 同名的.lrc歌词文件
   title?: string;       // 歌曲标题（元数据）
   artist?: string;      // 艺术家（元数据）
   album?: string;       // 专辑（元数据）
@@ -41,6 +46,15 @@ export interface SearchResult {
   query: string;
 }
 
+// 歌曲变更接口
+export interface SongChanges {
+  version: number;
+  full_resync: boolean;  // 版本过旧，需要全量同步
+  added: Song[];
+  removed: string[];
+  updated: Song[];
+}
+
 // 播放状态接口
 export interface PlaybackStatus {
   active: boolean;
@@ -50,8 +64,78 @@ export interface PlaybackStatus {
   duration: number;
   volume: number;
   loop: boolean;
+  queue_length?: number;  // 播放队列中等待的歌曲数
+}
+
+// 所有播放区域的状态接口
+export interface ZonesStatus {
+  zones: Record<string, PlaybackStatus>;  // 区域名 -> 播放状态
+  updated_at: number;
+}
+
+// 歌词接口
+export interface Lyrics {
+  id: string;
+  source: 'sidecar' | 'embedded';
+  synced: boolean;      // 是否为同步歌词
+  lines: { time: number | null; text: string }[];  // time为开始时间（秒）
+}
+
+// 波形接口
+export interface Waveform {
+  points: number;
+  scale: number;        // 取值范围 -scale~scale
+  min: number[];
+  max: number[];
+}
+
+// 播放队列项接口
+export interface QueueItem {
+  uid: string;          // 队列项唯一标识
+  id: string;
+  name: string;
+}
+
+// 智能播放列表规则接口
+export interface PlaylistRule {
+  query?: string;
+  artist?: string;
+  album?: string;
+  genre?: string;
+  year?: string;
+  min_duration?: number;
+  max_duration?: number;
+}
+
+// 播放列表接口
+export interface Playlist {
+  id: number;
+  name: string;
+  smart: boolean;       // 是否为智能播放列表
+  rule: PlaylistRule | null;
+  created_at: number;
+  updated_at: number;
+  count?: number;
+  items?: Song[];
+}
+
+// 播放统计接口
+export interface PlayStat extends Song {
+  play_count: number;
+  last_played: number;
 }
 
+// 分类浏览项接口
+export interface BrowseItem {
+  key: string;
+  name: string | null;  // 未知分类为null
+  track_count: number;
+  total_duration: number;
+  artist?: string | null;  // 专辑的艺术家
+}
+
+export type BrowseFacet = 'artists' | 'albums' | 'genres' | 'years';
+
 // 配置接口
 export interface Config {
   music_library_dirs: string[];
@@ -68,6 +152,22 @@ export interface ScanStatus {
   has_result: boolean;
 }
 
+// 上传会话接口
+export interface UploadSession {
+  id: string;
+  library: string;
+  path: string;         // 音乐库中的相对路径
+  size: number;
+  sha256: string;
+  offset: number;       // 已接收的字节数，续传时从这里开始
+  status: 'uploading' | 'stored' | 'indexed' | 'failed';
+  file_id: string | null;  // 加入索引后的曲目ID
+  error: string | null;
+}
+
+// 上传时每块的大小
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024;
+
 // API服务
 export const apiService = {
   // 获取所有歌曲
@@ -78,6 +178,58 @@ export const apiService = {
     return response.data;
   },
 
+  // 获取所有歌曲及当前音乐库版本号
+  getSongsWithVersion: async (includeMetadata: boolean = false): Promise<{ songs: Song[]; version: number | null }> => {
+    const response = await api.get('/api/songs', {
+      params: { include_metadata: includeMetadata }
+    });
+    const version = response.headers['x-library-version'];
+    return { songs: response.data, version: version ? Number(version) : null };
+  },
+
+  // 流式获取所有歌曲，后端尚未扫描完成时也能逐批收到已读取的歌曲，返回音乐库版本号
+  streamSongs: async (includeMetadata: boolean, onBatch: (songs: Song[]) => void): Promise<number | null> => {
+    const response = await fetch(`${api.defaults.baseURL}/api/songs/stream?include_metadata=${includeMetadata}`);
+    if (!response.ok || !response.body) {
+      throw new Error(`获取歌曲列表失败: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let version: number | null = null;
+    const handleLine = (line: string) => {
+      if (!line.trim()) return;
+      const record = JSON.parse(line);
+      if (record.type === 'batch') {
+        onBatch(record.items);
+      } else if (record.type === 'done') {
+        version = record.version;
+      } else if (record.type === 'error') {
+        throw new Error(record.message);
+      }
+    };
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() || '';
+      lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+    return version;
+  },
+
+  // 获取指定版本之后的歌曲变更
+  getSongChanges: async (since: number, includeMetadata: boolean = false): Promise<SongChanges> => {
+    const response = await api.get('/api/songs/changes', {
+      params: { since, include_metadata: includeMetadata }
+    });
+    return response.data;
+  },
+
   // 搜索歌曲
   searchSongs: async (
     query: string,
@@ -88,7 +240,8 @@ export const apiService = {
       genre?: string;
       minDuration?: number;
       maxDuration?: number;
-    }
+    },
+    signal?: AbortSignal
   ): Promise<SearchResult> => {
     const params: any = { q: query, limit };
     
@@ -100,7 +253,11 @@ export const apiService = {
       if (filters.maxDuration !== undefined) params.max_duration = filters.maxDuration;
     }
     
-    const response = await api.get('/api/songs/search', { params });
+    const response = await api.get('/api/songs/search', {
+      params,
+      signal,
+      headers: { 'X-Client-Id': clientId }
+    });
     return response.data;
   },
 
@@ -110,6 +267,32 @@ export const apiService = {
     return response.data;
   },
 
+  // 批量获取歌曲元数据（一次最多5000首），返回 ID -> 元数据，找不到的ID在missing中
+  getSongsMetadataBatch: async (songIds: string[]): Promise<{ items: Record<string, any>; missing: string[] }> => {
+    const response = await api.post('/api/songs/metadata:batch', { ids: songIds });
+    return response.data;
+  },
+
+  // 获取歌曲歌词
+  getLyrics: async (songId: string): Promise<Lyrics> => {
+    const response = await api.get(`/api/songs/${songId}/lyrics`);
+    return response.data;
+  },
+
+  // 按一句歌词搜索歌曲
+  searchLyrics: async (query: string, limit: number = 50): Promise<SearchResult> => {
+    const response = await api.get('/api/songs/lyrics/search', {
+      params: { q: query, limit }
+    });
+    return response.data;
+  },
+
+  // 获取歌曲波形
+  getWaveform: async (songId: string, points: number = 512): Promise<Waveform> => {
+    const response = await api.get(`/api/songs/${songId}/waveform`, { params: { points }, timeout: 60000 });
+    return response.data;
+  },
+
   // 播放歌曲
   playSong: async (songId: string): Promise<{ status: string; song: string; duration: number }> => {
     const response = await api.post(`/api/play/${songId}`);
@@ -152,11 +335,60 @@ export const apiService = {
     return response.data;
   },
 
+  // 获取播放队列
+  getQueue: async (): Promise<{ current_song: string | null; items: QueueItem[] }> => {
+    const response = await api.get('/api/queue');
+    return response.data;
+  },
+
+  // 添加歌曲到播放队列
+  enqueueSongs: async (ids: string[], position?: number): Promise<{ status: string; items: QueueItem[]; queue_length: number }> => {
+    const response = await api.post('/api/queue', { ids, position });
+    return response.data;
+  },
+
+  // 调整队列顺序
+  moveInQueue: async (from: number, to: number): Promise<{ status: string; items: QueueItem[] }> => {
+    const response = await api.post('/api/queue/move', { from, to });
+    return response.data;
+  },
+
+  // 从队列中移除歌曲
+  removeFromQueue: async (index: number): Promise<{ status: string; item: QueueItem }> => {
+    const response = await api.delete(`/api/queue/${index}`);
+    return response.data;
+  },
+
+  // 跳到队列中的下一首
+  playNextInQueue: async (): Promise<{ status: string; song: string | null; duration?: number }> => {
+    const response = await api.post('/api/queue/next');
+    return response.data;
+  },
+
   // 获取播放状态
   getStatus: async (): Promise<PlaybackStatus> => {
     const response = await api.get('/api/status');
     return response.data;
   },
+
+  // 获取指定播放区域的状态（其他播放控制接口同样可以通过 /api/zones/{zone}/... 作用于指定区域）
+  getZoneStatus: async (zone: string): Promise<PlaybackStatus> => {
+    const response = await api.get(`/api/zones/${encodeURIComponent(zone)}/status`);
+    return response.data;
+  },
+
+  // 一次获取所有播放区域的状态
+  getZones: async (): Promise<ZonesStatus> => {
+    const response = await api.get('/api/zones');
+    return response.data;
+  },
+
+  // 订阅所有播放区域的状态变化，返回取消订阅的函数
+  subscribeZones: (onStatus: (status: ZonesStatus) => void): (() => void) => {
+    const source = new EventSource(`${api.defaults.baseURL}/api/zones/events`);
+    source.onmessage = (event) => onStatus(JSON.parse(event.data));
+    return () => source.close();
+  },
   
   // 获取音乐库信息
   getLibraryInfo: async (): Promise<{ libraries: string[]; count: number }> => {
@@ -184,6 +416,115 @@ export const apiService = {
     return response.data;
   },
   
+  // 分块上传音乐文件到指定音乐库，传入uploadId时继续之前中断的上传；完成后服务端只把这个文件加入索引
+  uploadSong: async (
+    file: File,
+    library: string,
+    path: string,
+    onProgress?: (uploaded: number, total: number) => void,
+    uploadId?: string
+  ): Promise<UploadSession> => {
+    let session: UploadSession;
+    if (uploadId) {
+      session = (await api.get(`/api/uploads/${uploadId}`)).data;
+    } else {
+      const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+      const sha256 = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+      session = (await api.post('/api/uploads', { library, path, size: file.size, sha256 })).data;
+    }
+
+    let offset = session.offset;
+    while (offset < file.size) {
+      try {
+        const response = await api.put(`/api/uploads/${session.id}`, file.slice(offset, offset + UPLOAD_CHUNK_SIZE), {
+          params: { offset },
+          headers: { 'Content-Type': 'application/octet-stream' },
+          timeout: 0
+        });
+        offset = response.data.offset;
+      } catch (error: any) {
+        // 偏移量不一致时按服务端已接收的位置继续
+        if (error.response?.status !== 409 || typeof error.response.data?.offset !== 'number') {
+          throw error;
+        }
+        offset = error.response.data.offset;
+      }
+      onProgress?.(offset, file.size);
+    }
+
+    const response = await api.post(`/api/uploads/${session.id}/complete`, null, { timeout: 0 });
+    return response.data;
+  },
+
+  // 查询上传状态（status为indexed时file_id可用于播放）
+  getUpload: async (uploadId: string): Promise<UploadSession> => {
+    const response = await api.get(`/api/uploads/${uploadId}`);
+    return response.data;
+  },
+
+  // 预读列表中可见歌曲的开头部分
+  prefetchSongs: async (ids: string[]): Promise<{ success: boolean; count: number }> => {
+    const response = await api.post('/api/library/prefetch', { ids });
+    return response.data;
+  },
+  
+  // 获取所有播放列表
+  getPlaylists: async (): Promise<Playlist[]> => {
+    const response = await api.get('/api/playlists');
+    return response.data;
+  },
+  
+  // 获取播放列表及其曲目
+  getPlaylist: async (playlistId: number): Promise<Playlist> => {
+    const response = await api.get(`/api/playlists/${playlistId}`);
+    return response.data;
+  },
+  
+  // 创建播放列表（提供rule时为智能播放列表）
+  createPlaylist: async (name: string, ids: string[] = [], rule?: PlaylistRule): Promise<Playlist> => {
+    const response = await api.post('/api/playlists', { name, ids, rule });
+    return response.data;
+  },
+  
+  // 删除播放列表
+  deletePlaylist: async (playlistId: number): Promise<{ success: boolean }> => {
+    const response = await api.delete(`/api/playlists/${playlistId}`);
+    return response.data;
+  },
+  
+  // 添加歌曲到播放列表
+  addToPlaylist: async (playlistId: number, ids: string[], position?: number): Promise<{ success: boolean; count: number }> => {
+    const response = await api.post(`/api/playlists/${playlistId}/items`, { ids, position });
+    return response.data;
+  },
+  
+  // 获取最常播放的歌曲
+  getMostPlayed: async (limit: number = 50): Promise<PlayStat[]> => {
+    const response = await api.get('/api/stats/most-played', { params: { limit } });
+    return response.data;
+  },
+  
+  // 获取最近播放的歌曲
+  getRecentlyPlayed: async (limit: number = 50): Promise<PlayStat[]> => {
+    const response = await api.get('/api/stats/recently-played', { params: { limit } });
+    return response.data;
+  },
+  
+  // 按艺术家、专辑、流派或年份浏览
+  browse: async (
+    facet: BrowseFacet,
+    params: { sort?: 'name' | 'count' | 'duration'; limit?: number; offset?: number; artist?: string } = {}
+  ): Promise<{ items: BrowseItem[]; total: number }> => {
+    const response = await api.get(`/api/browse/${facet}`, { params });
+    return response.data;
+  },
+  
+  // 获取某个分类项下的歌曲
+  browseTracks: async (facet: BrowseFacet, key: string): Promise<{ items: Song[]; key: string }> => {
+    const response = await api.get(`/api/browse/${facet}/tracks`, { params: { key } });
+    return response.data;
+  },
+  
   // 清除缓存
   clearCache: async (): Promise<{ success: boolean; message: string }> => {
     const response = await api.post('/api/library/clear-cache');
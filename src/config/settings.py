@@ -14,7 +14,52 @@ MUSIC_LIBRARY_DIRS = get_current_music_libraries()
 # 支持的音频格式
 SUPPORTED_FORMATS = get_config_value("supported_formats", ['.mp3', '.wav', '.ogg', '.flac'])
 
+# 歌词文件扩展名（与音频文件同名、位于同一目录）
+LYRICS_SIDECAR_EXT = ".lrc"
+
 # API设置
 API_HOST = get_config_value("api_host", "0.0.0.0")
 API_PORT = get_config_value("api_port", 8000)
-API_RELOAD = get_config_value("api_reload", True) 
\ No newline at end of file
+API_RELOAD = get_config_value("api_reload", True)
+API_WORKERS = get_config_value("api_workers", 1)
+
+# 索引模式：writer 表示本进程负责扫描并写入索引；reader 表示多进程部署中的HTTP工作进程，只读访问索引
+INDEX_MODE = os.environ.get("MUSIC_INDEX_MODE", "writer")
+
+# 响应压缩设置（小于该字节数的响应不压缩）
+COMPRESSION_MIN_SIZE = get_config_value("compression_min_size", 1024)
+
+# 本地预读缓存设置（网络存储上的音乐库使用，容量为0时禁用）
+READ_CACHE_DIR = get_config_value("read_cache_dir", os.path.join(BASE_DIR, "read_cache"))
+READ_CACHE_SIZE_MB = get_config_value("read_cache_size_mb", 0)
+PREFETCH_TRACKS = get_config_value("prefetch_tracks", 2)  # 预读播放队列中的后续曲目数
+PREFETCH_HEAD_MB = get_config_value("prefetch_head_mb", 4)  # 列表中可见曲目预读的开头大小
+
+# 响度均衡设置
+REPLAYGAIN_ENABLED = get_config_value("replaygain_enabled", True)
+REPLAYGAIN_TARGET_LUFS = get_config_value("replaygain_target_lufs", -18.0)
+ANALYSIS_WORKERS = get_config_value("analysis_workers", max(1, (os.cpu_count() or 2) - 1))
+
+# 批量获取元数据时并行读取文件的线程数
+METADATA_WORKERS = get_config_value("metadata_workers", 8)
+
+# 扫描调度设置：同时扫描的音乐库目录数（各目录的扫描策略见scan_scheduler）
+SCAN_WORKERS = get_config_value("scan_workers", 2)
+
+# 文件流限制：全局和每个客户端同时传输的流数、为播放保留的名额、带宽（KB/s，0表示不限制）、排队超时（秒）
+# 这些限制按进程计算，api_workers大于1时服务器整体的上限是设置值乘以工作进程数
+STREAM_MAX_ACTIVE = get_config_value("stream_max_active", 32)
+STREAM_MAX_PER_CLIENT = get_config_value("stream_max_per_client", 4)
+STREAM_RESERVED_PLAYBACK = get_config_value("stream_reserved_playback", 4)
+STREAM_CLIENT_RATE_KB = get_config_value("stream_client_rate_kb", 0)
+STREAM_BULK_RATE_KB = get_config_value("stream_bulk_rate_kb", 0)
+STREAM_QUEUE_TIMEOUT = get_config_value("stream_queue_timeout", 30)
+
+# 上传设置：未完成的上传保存在upload_dir，单个文件的大小上限（MB），上传会话的保留时间（秒）
+UPLOAD_DIR = get_config_value("upload_dir", os.path.join(BASE_DIR, "uploads"))
+UPLOAD_MAX_SIZE_MB = get_config_value("upload_max_size_mb", 1024)
+UPLOAD_SESSION_TTL = get_config_value("upload_session_ttl", 24 * 3600)
+
+# 播放区域：每个区域有独立的播放器、队列和音量（default区域总是存在），合并状态的刷新间隔（秒）
+PLAYER_ZONES = get_config_value("player_zones", ["default"])
+ZONE_STATUS_INTERVAL = get_config_value("zone_status_interval", 1.0)
@@ -1,6 +1,8 @@
 import os
+import copy
 import json
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 
 # 默认配置文件路径
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config.json")
@@ -14,29 +16,58 @@ DEFAULT_CONFIG = {
     "api_reload": True
 }
 
+# 已解析的配置及对应的配置文件状态 (mtime_ns, size)，文件未变化时不重新读取
+_cached_config: Optional[Dict[str, Any]] = None
+_cached_stat: Optional[Tuple[int, int]] = None
+_config_lock = threading.Lock()
+
+def _config_file_stat() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_config() -> Dict[str, Any]:
+    """读取配置（内部使用，调用方不能修改返回的字典）"""
+    global _cached_config, _cached_stat
+    
+    stat = _config_file_stat()
+    if stat is not None and stat == _cached_stat and _cached_config is not None:
+        return _cached_config
+    
+    with _config_lock:
+        if stat is None:
+            save_config(DEFAULT_CONFIG)
+            return DEFAULT_CONFIG
+        
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+                # 确保所有必要的配置项都存在
+                for key, value in DEFAULT_CONFIG.items():
+                    if key not in config:
+                        config[key] = value
+        except Exception as e:
+            print(f"加载配置出错: {e}")
+            return DEFAULT_CONFIG
+        
+        _cached_config = config
+        _cached_stat = stat
+        return config
+
 def load_config() -> Dict[str, Any]:
     """从JSON文件加载配置，如果不存在则创建默认配置文件"""
-    if not os.path.exists(CONFIG_FILE):
-        save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
-    
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            # 确保所有必要的配置项都存在
-            for key, value in DEFAULT_CONFIG.items():
-                if key not in config:
-                    config[key] = value
-            return config
-    except Exception as e:
-        print(f"加载配置出错: {e}")
-        return DEFAULT_CONFIG
+    return copy.deepcopy(_read_config())
 
 def save_config(config: Dict[str, Any]) -> bool:
     """保存配置到JSON文件"""
+    global _cached_stat
     try:
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(config, f, ensure_ascii=False, indent=4)
+        # 同一时间戳内多次写入时mtime可能不变，保存后总是重新读取
+        _cached_stat = None
         return True
     except Exception as e:
         print(f"保存配置出错: {e}")
@@ -50,10 +81,8 @@ def update_music_libraries(library_dirs: List[str]) -> bool:
 
 def get_music_libraries() -> List[str]:
     """获取音乐库目录列表"""
-    config = load_config()
-    return config.get("music_library_dirs", [])
+    return list(_read_config().get("music_library_dirs", []))
 
 def get_config_value(key: str, default=None):
     """获取指定配置项的值"""
-    config = load_config()
-    return config.get(key, default) 
\ No newline at end of file
+    return copy.deepcopy(_read_config().get(key, default)) 
\ No newline at end of file
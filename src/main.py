@@ -1,16 +1,25 @@
-import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from fastapi import HTTPException
 
-from src.config.settings import API_HOST, API_PORT, API_RELOAD, get_current_music_libraries
+from src.config.settings import API_HOST, API_PORT, API_RELOAD, COMPRESSION_MIN_SIZE, INDEX_MODE
 from src.routes import api_router
-from src.utils.file_utils import decode_filename
+from src.utils.compression import CompressionMiddleware
+from src.utils.stream_governor import stream_library_file
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时加载上次保存的音乐库快照并在后台重新扫描，重启后无需等待扫描即可响应；之后按配置定期重新扫描各目录"""
+    # 多进程部署时由扫描进程负责，HTTP工作进程直接读取索引
+    if INDEX_MODE == "writer":
+        from src.utils.async_scanner import scanner
+        scanner.warm_start()
+        scanner.run_schedule()
+    yield
 
 # 创建FastAPI应用
-app = FastAPI(title="音乐播放器API")
+app = FastAPI(title="音乐播放器API", lifespan=lifespan)
 
 # 允许跨域请求
 app.add_middleware(
@@ -19,28 +28,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允许所有方法
     allow_headers=["*"],  # 允许所有头
+    expose_headers=["ETag", "X-Library-Version"],  # 允许前端读取版本相关响应头
+)
+
+# 压缩较大的JSON响应，音频文件本身已压缩，直接跳过
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    excluded_prefixes=("/library/",)
 )
 
 # 为每个外部音乐库添加路由
 @app.get("/library/{library_name}/{path:path}")
-async def get_library_file(library_name: str, path: str):
-    """访问外部音乐库中的文件"""
-    # URL解码
-    library_name = decode_filename(library_name)
-    path = decode_filename(path)
-    
-    # 获取最新的音乐库目录列表
-    music_library_dirs = get_current_music_libraries()
-    
-    # 查找匹配的音乐库目录
-    for lib_dir in music_library_dirs:
-        if os.path.basename(lib_dir) == library_name:
-            file_path = os.path.join(lib_dir, path)
-            if os.path.exists(file_path) and os.path.isfile(file_path):
-                return FileResponse(file_path)
-    
-    # 未找到文件
-    raise HTTPException(status_code=404, detail="文件未找到")
+async def get_library_file(request: Request, library_name: str, path: str):
+    """访问外部音乐库中的文件（受并发数和带宽限制）"""
+    return await stream_library_file(request, library_name, path)
 
 # 包含API路由
 app.include_router(api_router)
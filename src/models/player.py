@@ -1,70 +1,377 @@
-from just_playback import Playback
-from typing import Optional
+import os
+import threading
+import time
+import uuid
+from multiprocessing.connection import Client, Connection, Listener
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from src.config.settings import PREFETCH_TRACKS, REPLAYGAIN_ENABLED
+from src.utils.library_index import library_index
+from src.utils.playlists import playlist_store
+from src.utils.read_cache import read_cache
+from src.utils.scan_scheduler import register_playback_probe
+
+if TYPE_CHECKING:
+    from just_playback import Playback
+
+# 默认播放区域，不带区域的播放接口和全局player都对应它
+DEFAULT_ZONE = "default"
+
+def _new_playback() -> "Playback":
+    """创建Playback实例（首次使用时才导入just_playback并初始化音频设备）"""
+    from just_playback import Playback
+    return Playback()
 
 class MusicPlayer:
     """音乐播放器模型类，封装了just_playback库的功能"""
     
+    # 播放期间检查当前曲目是否播放结束的间隔（秒），决定了切换到下一首时的最大间隙；停止或暂停时监视线程挂起
+    MONITOR_INTERVAL = 0.01
+    
+    # 不需要持有锁的只读方法和属性，多进程部署时播放进程直接执行，不等待正在进行的加载
+    LOCK_FREE_METHODS = ("get_status", "get_queue")
+    LOCK_FREE_ATTRIBUTES = ("current_song", "duration")
+    
     def __init__(self):
-        self.playback = Playback()
+        self._playback: Optional["Playback"] = None
         self.current_song: Optional[str] = None
-        self.playlist = []
+        self.current_path: Optional[str] = None  # 当前曲目的文件路径，扫描同一设备上的目录时据此降速
+        self.current_entry: Optional[Dict[str, Any]] = None
+        self.playlist: List[Dict[str, Any]] = []  # 播放队列
         self.is_playing = False
+        
+        # 用户设置的音量和当前曲目的响度均衡增益（线性），实际音量为两者之积
+        self._user_volume = 1.0
+        self._track_gain = 1.0
+        
+        # 预加载的下一首：(队列项uid, Playback实例)
+        self._preloaded: Optional[Tuple[str, "Playback"]] = None
+        self._preload_thread: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+        self._monitor_thread: Optional[threading.Thread] = None
+        self._monitor_wake = threading.Event()
+        
+        # 没有预加载时在锁外加载下一首：正在加载的切换序号，停止或加载其他文件后旧的切换作废
+        self._switch_seq = 0
+        self._switching = False
+    
+    @property
+    def playback(self) -> "Playback":
+        """当前的Playback实例，首次访问时才创建"""
+        if self._playback is None:
+            with self._lock:
+                if self._playback is None:
+                    self._playback = _new_playback()
+        return self._playback
+    
+    @playback.setter
+    def playback(self, value: "Playback") -> None:
+        self._playback = value
     
     def load_file(self, file_path: str) -> None:
-        """加载音乐文件"""
-        self.playback.load_file(file_path)
+        """加载音乐文件（优先读取本地预读缓存），并应用该曲目的响度均衡增益"""
+        with self._lock:
+            self._cancel_switch()
+            self.playback.load_file(read_cache.resolve(file_path))
+            self.current_path = file_path
+            self.current_entry = None
+            self._track_gain = self._gain_for(file_path)
+            self.playback.set_volume(self._effective_volume(self._track_gain))
     
     def play(self) -> None:
         """播放当前加载的文件"""
-        self.playback.play()
-        self.is_playing = True
+        with self._lock:
+            self.playback.play()
+            # just_playback在play()时会恢复上一次的音量，需要重新应用增益
+            self.playback.set_volume(self._effective_volume(self._track_gain))
+            self._set_playing()
+        self._ensure_monitor()
+        self._schedule_preload()
     
     def pause(self) -> None:
         """暂停播放"""
-        if self.playback.playing:
-            self.playback.pause()
-            self.is_playing = False
+        with self._lock:
+            if self.playback.playing:
+                self.playback.pause()
+                self.is_playing = False
     
     def resume(self) -> None:
         """恢复播放"""
-        if self.playback.paused:
-            self.playback.resume()
-            self.is_playing = True
+        with self._lock:
+            if self.playback.paused:
+                self.playback.resume()
+                self._set_playing()
     
     def stop(self) -> None:
         """停止播放"""
-        if self.playback.active:
-            self.playback.stop()
+        with self._lock:
+            self._cancel_switch()
+            # 正在切换曲目时旧实例已经结束，同样需要标记为停止
             self.is_playing = False
-            self.current_song = None
+            if self.playback.active:
+                self.playback.stop()
+                self.current_song = None
+                self.current_path = None
+                self.current_entry = None
     
     def seek(self, position: float) -> None:
         """调整播放位置"""
-        if self.playback.active:
-            self.playback.seek(position)
+        with self._lock:
+            if self.playback.active:
+                self.playback.seek(position)
     
     def set_volume(self, volume: float) -> None:
         """设置音量"""
-        self.playback.set_volume(volume)
+        with self._lock:
+            self._user_volume = volume
+            self.playback.set_volume(self._effective_volume(self._track_gain))
     
     def set_loop(self, loop: bool) -> None:
         """设置循环播放"""
-        self.playback.loop_at_end(loop)
+        with self._lock:
+            self.playback.loop_at_end(loop)
+    
+    def enqueue(self, entries: List[Dict[str, Any]], position: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        添加歌曲到播放队列
+        
+        Args:
+            entries: 队列项列表，每项包含 id、name、file_path
+            position: 插入位置，默认追加到末尾
+            
+        Returns:
+            添加后的队列项（带uid）
+        """
+        new_entries = [dict(entry, uid=uuid.uuid4().hex) for entry in entries]
+        with self._lock:
+            if position is None or position >= len(self.playlist):
+                self.playlist.extend(new_entries)
+            else:
+                position = max(position, 0)
+                self.playlist[position:position] = new_entries
+        self._schedule_preload()
+        return new_entries
+    
+    def move_in_queue(self, from_index: int, to_index: int) -> None:
+        """调整队列中歌曲的位置"""
+        with self._lock:
+            if not 0 <= from_index < len(self.playlist):
+                raise IndexError("队列位置超出范围")
+            entry = self.playlist.pop(from_index)
+            self.playlist.insert(max(0, min(to_index, len(self.playlist))), entry)
+        self._schedule_preload()
+    
+    def remove_from_queue(self, index: int) -> Dict[str, Any]:
+        """从队列中移除歌曲"""
+        with self._lock:
+            if not 0 <= index < len(self.playlist):
+                raise IndexError("队列位置超出范围")
+            entry = self.playlist.pop(index)
+        self._schedule_preload()
+        return entry
+    
+    def clear_queue(self) -> None:
+        """清空播放队列"""
+        with self._lock:
+            self.playlist = []
+            self._discard_preloaded()
+    
+    def get_queue(self) -> List[Dict[str, Any]]:
+        """获取播放队列（不加锁，加载文件期间也能立即返回）"""
+        return [dict(entry) for entry in list(self.playlist)]
+    
+    def skip(self) -> Optional[Dict[str, Any]]:
+        """
+        跳到队列中的下一首，不重新加载当前曲目
+        
+        Returns:
+            开始播放的队列项；队列为空时停止播放并返回None
+        """
+        with self._lock:
+            if not self.playlist:
+                self.stop()
+                return None
+            pending = self._begin_advance()
+        return self._finish_advance(*pending)
+    
+    def _begin_advance(self) -> Tuple[int, Dict[str, Any], Optional["Playback"]]:
+        """从队列中取出下一首，返回 (切换序号, 队列项, 预加载的Playback实例或None)（调用方需持有锁）"""
+        entry = self.playlist.pop(0)
+        self._switch_seq += 1
+        self._switching = True
+        
+        if self._preloaded is not None and self._preloaded[0] == entry["uid"]:
+            next_playback = self._preloaded[1]
+            self._preloaded = None
+            return self._switch_seq, entry, next_playback
+        self._discard_preloaded()
+        return self._switch_seq, entry, None
+    
+    def _finish_advance(self, seq: int, entry: Dict[str, Any], next_playback: Optional["Playback"]) -> Optional[Dict[str, Any]]:
+        """
+        开始播放_begin_advance取出的曲目（调用方不能持有锁）
+        
+        没有预加载（或预加载的不是这一首）时在锁外现场加载，加载期间不阻塞其他播放控制
+        
+        Returns:
+            开始播放的队列项；加载期间停止了播放或加载了其他文件时返回None
+        """
+        try:
+            if next_playback is None:
+                next_playback = _new_playback()
+                next_playback.load_file(read_cache.resolve(entry["file_path"]))
+            gain = self._gain_for(entry["file_path"])
+        except Exception:
+            with self._lock:
+                if seq == self._switch_seq:
+                    self._switching = False
+            raise
+        
+        with self._lock:
+            if seq != self._switch_seq:
+                return None
+            self._switching = False
+            
+            self._track_gain = gain
+            next_playback.loop_at_end(self.playback.loops_at_end)
+            next_playback.play()
+            next_playback.set_volume(self._effective_volume(self._track_gain))
+            
+            # 先启动下一首再停止旧实例，尽量缩短切换间隙
+            old_playback = self.playback
+            self.playback = next_playback
+            if old_playback.active:
+                old_playback.stop()
+            
+            self.current_song = entry["name"]
+            self.current_path = entry["file_path"]
+            self.current_entry = entry
+            self._set_playing()
+        self._schedule_preload()
+        
+        # 记录播放历史
+        try:
+            playlist_store.log_play(entry["id"])
+        except Exception as e:
+            print(f"记录播放历史时出错: {str(e)}")
+        return entry
+    
+    @staticmethod
+    def _gain_for(file_path: str) -> float:
+        """读取曲目的响度均衡增益（线性），未分析或未启用时为1"""
+        if not REPLAYGAIN_ENABLED:
+            return 1.0
+        try:
+            gain_db = library_index.get_gain_for_path(file_path)
+        except Exception as e:
+            print(f"读取响度增益时出错: {file_path}, 错误: {str(e)}")
+            return 1.0
+        return 10 ** (gain_db / 20) if gain_db is not None else 1.0
+    
+    def _effective_volume(self, gain: float) -> float:
+        """实际音量，不超过1"""
+        return min(1.0, self._user_volume * gain)
+    
+    def _set_playing(self) -> None:
+        """标记为正在播放并唤醒监视线程（调用方需持有锁）"""
+        self.is_playing = True
+        self._monitor_wake.set()
+    
+    def _cancel_switch(self) -> None:
+        """作废正在锁外加载的切换（调用方需持有锁）"""
+        self._switch_seq += 1
+        self._switching = False
+    
+    def _discard_preloaded(self) -> None:
+        """丢弃已预加载的下一首（调用方需持有锁）"""
+        self._preloaded = None
+    
+    def _schedule_preload(self) -> None:
+        """在后台预加载队列中的下一首"""
+        with self._lock:
+            if not self.playlist:
+                self._discard_preloaded()
+                return
+            
+            # 把队列中的后续曲目复制到本地缓存
+            read_cache.prefetch([entry["file_path"] for entry in self.playlist[:PREFETCH_TRACKS]])
+            
+            head = self.playlist[0]
+            if self._preloaded is not None and self._preloaded[0] == head["uid"]:
+                return
+            self._discard_preloaded()
+            if self._preload_thread is not None and self._preload_thread.is_alive():
+                # 正在预加载，完成后会重新检查队列头
+                return
+            self._preload_thread = threading.Thread(target=self._preload, args=(head,), daemon=True)
+            self._preload_thread.start()
+    
+    def _preload(self, entry: Dict[str, Any]) -> None:
+        """预加载线程函数：在锁外加载文件，避免阻塞播放控制"""
+        try:
+            next_playback = _new_playback()
+            next_playback.load_file(read_cache.resolve(entry["file_path"]))
+        except Exception as e:
+            print(f"预加载下一首时出错: {entry.get('name')}, 错误: {str(e)}")
+            return
+        
+        with self._lock:
+            if self.playlist and self.playlist[0]["uid"] == entry["uid"]:
+                self._preloaded = (entry["uid"], next_playback)
+                return
+        
+        # 预加载期间队列发生了变化
+        self._schedule_preload()
+    
+    def _ensure_monitor(self) -> None:
+        """启动播放结束监视线程"""
+        if self._monitor_thread is None or not self._monitor_thread.is_alive():
+            self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+            self._monitor_thread.start()
+    
+    def _monitor(self) -> None:
+        """当前曲目播放结束时立即切换到已预加载的下一首；停止或暂停期间挂起，不再轮询"""
+        while True:
+            self._monitor_wake.wait()
+            time.sleep(self.MONITOR_INTERVAL)
+            pending = None
+            with self._lock:
+                if not self.is_playing:
+                    # 重新开始播放时由_set_playing唤醒
+                    self._monitor_wake.clear()
+                    continue
+                if self._switching or self.playback.loops_at_end or self.playback.active:
+                    continue
+                
+                # 当前曲目自然播放结束
+                if self.playlist:
+                    pending = self._begin_advance()
+                else:
+                    self.is_playing = False
+            
+            if pending is not None:
+                try:
+                    self._finish_advance(*pending)
+                except Exception as e:
+                    print(f"切换到下一首时出错: {str(e)}")
+                    with self._lock:
+                        if pending[0] == self._switch_seq:
+                            self.is_playing = False
     
     @property
     def active(self) -> bool:
         """播放器是否处于活动状态"""
-        return self.playback.active
+        return self._playback is not None and self._playback.active
     
     @property
     def playing(self) -> bool:
         """是否正在播放"""
-        return self.playback.playing
+        return self._playback is not None and self._playback.playing
     
     @property
     def paused(self) -> bool:
         """是否暂停"""
-        return self.playback.paused
+        return self._playback is not None and self._playback.paused
     
     @property
     def position(self) -> float:
@@ -78,13 +385,13 @@ class MusicPlayer:
     
     @property
     def volume(self) -> float:
-        """当前音量"""
-        return self.playback.volume
+        """当前音量（用户设置的音量，不含响度均衡增益）"""
+        return self._user_volume
     
     @property
     def loops_at_end(self) -> bool:
         """是否循环播放"""
-        return self.playback.loops_at_end
+        return self._playback is not None and self._playback.loops_at_end
     
     def get_status(self) -> dict:
         """获取当前播放状态"""
@@ -96,7 +403,8 @@ class MusicPlayer:
                 "position": 0,
                 "duration": 0,
                 "volume": self.volume,
-                "loop": self.loops_at_end
+                "loop": self.loops_at_end,
+                "queue_length": len(self.playlist)
             }
         
         return {
@@ -106,8 +414,127 @@ class MusicPlayer:
             "position": self.position,
             "duration": self.duration,
             "volume": self.volume,
-            "loop": self.loops_at_end
+            "loop": self.loops_at_end,
+            "queue_length": len(self.playlist)
         }
 
-# 创建全局播放器实例
-player = MusicPlayer() 
\ No newline at end of file
+class RemotePlayer:
+    """
+    播放器代理
+    
+    多进程部署时每个HTTP工作进程都会导入本模块，但实际的播放器只能在一个进程中。
+    代理把属性读写和方法调用转发给扫描进程中对应区域的MusicPlayer实例，每个区域使用各自的连接。
+    """
+    
+    def __init__(self, address: tuple, authkey: bytes, zone: Optional[str] = DEFAULT_ZONE):
+        object.__setattr__(self, "_address", address)
+        object.__setattr__(self, "_authkey", authkey)
+        object.__setattr__(self, "_zone", zone)
+        object.__setattr__(self, "_conn", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+    
+    def _request(self, *message) -> Any:
+        """发送请求并等待结果"""
+        with self._lock:
+            try:
+                if self._conn is None:
+                    object.__setattr__(self, "_conn", Client(self._address, authkey=self._authkey))
+                self._conn.send((self._zone, *message))
+                ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                # 连接断开，下次请求时重新连接
+                object.__setattr__(self, "_conn", None)
+                raise
+        
+        if not ok:
+            raise result
+        return result
+    
+    def get_zone_statuses(self) -> Dict[str, dict]:
+        """一次请求获取播放进程中所有区域的状态"""
+        return self._request("status_all", None)
+    
+    def __getattr__(self, name: str) -> Any:
+        if callable(getattr(MusicPlayer, name, None)):
+            return lambda *args: self._request("call", name, args)
+        return self._request("get", name)
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        self._request("set", name, value)
+
+def serve_player(listener: Listener, players: Dict[str, MusicPlayer]) -> None:
+    """在播放进程中接受RemotePlayer连接，每个连接一个线程"""
+    # 每个区域一把锁，串行化对同一播放器的访问，一个区域加载文件时不影响其他区域
+    locks = {zone: threading.Lock() for zone in players}
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            print(f"接受播放器连接时出错: {str(e)}")
+            continue
+        threading.Thread(target=_handle_player_connection, args=(conn, players, locks), daemon=True).start()
+
+def _handle_player_connection(conn: Connection, players: Dict[str, MusicPlayer], locks: Dict[str, threading.Lock]) -> None:
+    """处理单个RemotePlayer连接上的请求"""
+    with conn:
+        while True:
+            try:
+                zone, op, name, *args = conn.recv()
+            except (EOFError, OSError):
+                break
+            
+            try:
+                if op == "status_all":
+                    # 读取状态不加锁，不会等待正在加载文件的区域
+                    result = {zone_name: target.get_status() for zone_name, target in players.items()}
+                    conn.send((True, result))
+                    continue
+                
+                if zone not in players:
+                    raise KeyError(f"播放区域不存在: {zone}")
+                if name.startswith("_"):
+                    raise AttributeError(f"不允许访问私有属性: {name}")
+                target = players[zone]
+                if op == "call" and name in MusicPlayer.LOCK_FREE_METHODS:
+                    result = getattr(target, name)(*args[0])
+                elif op == "get" and name in MusicPlayer.LOCK_FREE_ATTRIBUTES:
+                    result = getattr(target, name)
+                else:
+                    with locks[zone]:
+                        if op == "get":
+                            result = getattr(target, name)
+                        elif op == "set":
+                            setattr(target, name, args[0])
+                            result = None
+                        else:
+                            result = getattr(target, name)(*args[0])
+                conn.send((True, result))
+            except Exception as e:
+                conn.send((False, e))
+
+def get_remote_address() -> Optional[Tuple[tuple, bytes]]:
+    """多进程部署时（设置了MUSIC_PLAYER_ADDRESS）播放进程的地址和认证密钥，否则返回None"""
+    player_address = os.environ.get("MUSIC_PLAYER_ADDRESS")
+    if not player_address:
+        return None
+    host, port = player_address.rsplit(":", 1)
+    return (host, int(port)), bytes.fromhex(os.environ.get("MUSIC_PLAYER_AUTHKEY", ""))
+
+def create_player(zone: str = DEFAULT_ZONE):
+    """
+    创建一个区域的播放器
+    
+    多进程部署时返回代理，访问播放进程中同名区域的播放器；否则创建本进程中的MusicPlayer
+    """
+    remote = get_remote_address()
+    if remote is not None:
+        return RemotePlayer(*remote, zone=zone)
+    
+    local_player = MusicPlayer()
+    register_playback_probe(
+        lambda: [local_player.current_path] if local_player.current_path and local_player.playing else []
+    )
+    return local_player
+
+# 创建全局播放器实例（default区域）
+player = create_player(DEFAULT_ZONE)
@@ -0,0 +1,100 @@
+"""
+播放控制命令队列
+
+每个播放区域的播放控制都提交到该区域的队列，由它专用的音频线程按顺序执行，
+避免加载大文件等耗时操作阻塞事件循环，也避免并发请求之间的竞争。
+"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+class _Command:
+    """队列中的一条命令"""
+
+    __slots__ = ("func", "args", "coalesce_key", "future")
+
+    def __init__(self, func: Callable, args: tuple, coalesce_key: Optional[Hashable]):
+        self.func = func
+        self.args = args
+        self.coalesce_key = coalesce_key
+        self.future: Future = Future()
+
+class PlayerCommandQueue:
+    """播放控制命令队列，由一个专用的音频线程消费"""
+
+    def __init__(self, thread_name: str = "audio-owner"):
+        self.thread_name = thread_name
+        self._pending: Deque[_Command] = deque()
+        self._coalescable: Dict[Hashable, _Command] = {}  # 尚未执行、可合并的命令
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, func: Callable, *args, coalesce_key: Optional[Hashable] = None) -> Future:
+        """
+        提交命令
+
+        Args:
+            func: 在音频线程中执行的函数
+            args: 函数参数
+            coalesce_key: 合并键。队列末尾是相同键且尚未执行的命令时，只更新其参数，
+                多次提交共享同一个结果（例如快速拖动进度条时只执行最后一次seek）；
+                中间隔着其他命令时不合并，保证执行顺序与提交顺序一致
+
+        Returns:
+            命令执行结果的Future
+        """
+        with self._cond:
+            if coalesce_key is not None:
+                command = self._coalescable.get(coalesce_key)
+                if command is not None and self._pending and self._pending[-1] is command:
+                    command.func = func
+                    command.args = args
+                    return command.future
+
+            command = _Command(func, args, coalesce_key)
+            self._pending.append(command)
+            if coalesce_key is not None:
+                self._coalescable[coalesce_key] = command
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+
+            self._cond.notify()
+            return command.future
+
+    async def run(self, func: Callable, *args, coalesce_key: Optional[Hashable] = None) -> Any:
+        """提交命令并在事件循环中等待结果"""
+        return await asyncio.wrap_future(self.submit(func, *args, coalesce_key=coalesce_key))
+
+    def pending_count(self) -> int:
+        """等待执行的命令数"""
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self) -> None:
+        """音频线程：按顺序执行命令"""
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                command = self._pending.popleft()
+                if command.coalesce_key is not None and self._coalescable.get(command.coalesce_key) is command:
+                    del self._coalescable[command.coalesce_key]
+
+            if not command.future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = command.func(*command.args)
+            except BaseException as e:
+                command.future.set_exception(e)
+            else:
+                command.future.set_result(result)
+
+
+# 创建全局命令队列（default区域）
+player_commands = PlayerCommandQueue()
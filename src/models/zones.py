@@ -0,0 +1,111 @@
+"""
+播放区域
+
+一台服务器可以驱动多个房间或输出，每个区域有独立的MusicPlayer（播放队列、音量和状态），
+以及自己的命令队列和音频线程，一个区域加载大文件时不会阻塞其他区域的播放控制。
+
+区域在config.json的player_zones中配置：
+
+    "player_zones": ["default", "kitchen", "bedroom"]
+
+default区域就是原来的全局player，/api/play等不带区域的接口都作用于它。
+多进程部署时所有区域的播放器都在扫描进程中，HTTP工作进程通过各区域的RemotePlayer访问。
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from src.config.settings import PLAYER_ZONES, ZONE_STATUS_INTERVAL
+from src.models.player import DEFAULT_ZONE, MusicPlayer, RemotePlayer, create_player, get_remote_address, player
+from src.models.player_commands import PlayerCommandQueue, player_commands
+
+class Zone:
+    """一个播放区域：播放器和它的命令队列"""
+
+    __slots__ = ("name", "player", "commands")
+
+    def __init__(self, name: str, zone_player: Any, commands: PlayerCommandQueue):
+        self.name = name
+        self.player = zone_player
+        self.commands = commands
+
+class ZoneManager:
+    """按名称管理各播放区域"""
+
+    def __init__(self, names: List[str]):
+        self._zones: Dict[str, Zone] = {DEFAULT_ZONE: Zone(DEFAULT_ZONE, player, player_commands)}
+        for name in names:
+            name = str(name)
+            if name not in self._zones:
+                self._zones[name] = Zone(name, create_player(name), PlayerCommandQueue(f"audio-{name}"))
+
+        # 多进程部署时，合并状态通过单独的连接一次取回，不与各区域的控制命令排队
+        remote = get_remote_address()
+        self._status_client: Optional[RemotePlayer] = RemotePlayer(*remote, zone=None) if remote is not None else None
+
+    def get(self, name: str) -> Optional[Zone]:
+        return self._zones.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._zones)
+
+    def local_players(self) -> Dict[str, MusicPlayer]:
+        """区域名 -> 本进程中的播放器（扫描进程提供给RemotePlayer使用）"""
+        return {name: zone.player for name, zone in self._zones.items() if isinstance(zone.player, MusicPlayer)}
+
+    def get_all_status(self) -> Dict[str, Dict[str, Any]]:
+        """所有区域的播放状态，读取时不等待各区域正在执行的命令"""
+        if self._status_client is not None:
+            statuses = self._status_client.get_zone_statuses()
+        else:
+            statuses = {name: zone.player.get_status() for name, zone in self._zones.items()}
+
+        for name, status in statuses.items():
+            zone = self._zones.get(name)
+            if zone is not None:
+                status["pending_commands"] = zone.commands.pending_count()
+        return statuses
+
+class ZoneStatusFeed:
+    """
+    所有区域的合并状态
+
+    结果缓存interval秒，同一时间的多个请求和推送连接共享同一次查询，
+    客户端数量增加不会增加对播放器的访问。
+    """
+
+    def __init__(self, manager: ZoneManager, interval: float):
+        self.manager = manager
+        self.interval = interval
+        self._status: Optional[Dict[str, Any]] = None
+        self._updated = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        获取合并状态
+
+        Returns:
+            - zones: 区域名 -> 播放状态
+            - updated_at: 查询时间
+        """
+        if self._status is not None and time.monotonic() - self._updated < self.interval:
+            return self._status
+
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self) -> Dict[str, Any]:
+        # 多进程部署时需要访问播放进程，在线程池中执行
+        zones = await run_in_threadpool(self.manager.get_all_status)
+        self._status = {"zones": zones, "updated_at": time.time()}
+        self._updated = time.monotonic()
+        return self._status
+
+# 创建全局实例
+zone_manager = ZoneManager(PLAYER_ZONES)
+zone_status_feed = ZoneStatusFeed(zone_manager, ZONE_STATUS_INTERVAL)
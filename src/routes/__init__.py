@@ -5,6 +5,10 @@ from src.routes.songs import router as songs_router
 from src.routes.playback import router as playback_router
 from src.routes.library import router as library_router
 from src.routes.settings import router as settings_router
+from src.routes.playlists import router as playlists_router
+from src.routes.browse import router as browse_router
+from src.routes.health import router as health_router
+from src.routes.uploads import router as uploads_router
 
 # 创建主路由
 api_router = APIRouter()
@@ -13,4 +17,8 @@ api_router = APIRouter()
 api_router.include_router(songs_router)
 api_router.include_router(playback_router)
 api_router.include_router(library_router)
-api_router.include_router(settings_router) 
\ No newline at end of file
+api_router.include_router(settings_router)
+api_router.include_router(playlists_router)
+api_router.include_router(browse_router)
+api_router.include_router(health_router)
+api_router.include_router(uploads_router)
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, Optional
+
+from src.utils.browse import browse_index
+from src.utils.file_utils import get_library_snapshot, get_library_version, get_music_by_id
+from src.utils.http_utils import build_etag, conditional_json
+
+router = APIRouter(prefix="/api/browse")
+
+# 路径中的复数形式 -> 分类
+_FACET_PATHS = {
+    "artists": "artist",
+    "albums": "album",
+    "genres": "genre",
+    "years": "year"
+}
+
+@router.get("/{facet_path}", response_model=Dict[str, Any])
+async def browse_facet(
+    request: Request,
+    facet_path: str,
+    sort: str = Query("name", description="排序方式：name、count或duration"),
+    limit: int = Query(500, description="最大返回数量", ge=1, le=5000),
+    offset: int = Query(0, description="起始位置", ge=0),
+    artist: Optional[str] = Query(None, description="只返回该艺术家的专辑（仅albums）")
+):
+    """
+    按艺术家、专辑、流派或年份浏览
+
+    返回:
+        - items: 分类项，包含key、name、track_count、total_duration（专辑还包含artist）
+        - total: 分类项总数
+    """
+    facet = _FACET_PATHS.get(facet_path)
+    if facet is None:
+        raise HTTPException(status_code=404, detail=f"不支持的分类: {facet_path}")
+
+    # 确保聚合数据对应最新的音乐库（浏览需要元数据）
+    await run_in_threadpool(get_library_snapshot, include_metadata=True)
+    version = get_library_version()
+
+    etag = build_etag("browse", facet, version, sort, limit, offset, artist)
+    return conditional_json(request, browse_index.list_facet(facet, sort, limit, offset, artist), etag)
+
+@router.get("/{facet_path}/tracks", response_model=Dict[str, Any])
+async def browse_facet_tracks(
+    request: Request,
+    facet_path: str,
+    key: str = Query(..., description="分类项的key"),
+    limit: int = Query(500, description="最大返回数量", ge=1, le=5000),
+    offset: int = Query(0, description="起始位置", ge=0)
+):
+    """获取某个分类项下的歌曲"""
+    facet = _FACET_PATHS.get(facet_path)
+    if facet is None:
+        raise HTTPException(status_code=404, detail=f"不支持的分类: {facet_path}")
+
+    await run_in_threadpool(get_library_snapshot, include_metadata=True)
+    version = get_library_version()
+
+    items = []
+    for track_id in browse_index.get_track_ids(facet, key, limit, offset):
+        music_info = get_music_by_id(track_id)
+        if music_info:
+            items.append(music_info)
+
+    etag = build_etag("browse-tracks", facet, key, version, limit, offset)
+    return conditional_json(request, {"items": items, "key": key}, etag)
@@ -0,0 +1,44 @@
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from typing import Dict, Any
+
+from src.config.settings import INDEX_MODE
+from src.utils.async_scanner import scanner
+from src.utils.file_utils import get_snapshot_status
+
+router = APIRouter(prefix="/api/health")
+
+# 进程启动时间
+_started_at = time.time()
+
+@router.get("/live", response_model=Dict[str, Any])
+async def liveness():
+    """存活检查：进程能够响应请求即返回200"""
+    return {
+        "status": "alive",
+        "mode": INDEX_MODE,
+        "uptime_seconds": round(time.time() - _started_at, 1)
+    }
+
+@router.get("/ready", response_model=Dict[str, Any])
+async def readiness():
+    """
+    就绪检查：已有可用的音乐库快照（从索引加载或扫描完成）时返回200，否则返回503
+    
+    返回:
+        - snapshot: 快照来源、版本、曲目数和距上次与磁盘核对的秒数（age_seconds）
+        - revalidation: 后台扫描是否在进行以及进度
+    """
+    snapshot = get_snapshot_status()
+    status = scanner.get_status()
+    content = {
+        "status": "ready" if snapshot["loaded"] else "starting",
+        "snapshot": snapshot,
+        "revalidation": {
+            "running": status["is_scanning"],
+            "last_scan_time": status["last_scan_time"],
+            "progress": status["progress"]
+        }
+    }
+    return JSONResponse(content=content, status_code=200 if snapshot["loaded"] else 503)
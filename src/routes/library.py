@@ -1,23 +1,33 @@
-from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import os
-from typing import List, Dict, Any
+import tempfile
+from typing import List, Dict, Any, Optional
 
-from src.config.settings import get_current_music_libraries
-from src.utils.file_utils import decode_filename, clear_cache
+from src.config.settings import INDEX_MODE
+from src.utils.file_utils import clear_cache, get_music_by_id
 from src.config.settings_manager import get_music_libraries, update_music_libraries
 from src.utils.async_scanner import scanner
+from src.utils.duplicates import get_duplicate_groups
+from src.utils.http_utils import build_etag, conditional_json
+from src.utils.library_index import library_index
+from src.utils.library_transfer import FORMATS, iter_export_records, encode_records, import_library_file, detect_format
+from src.utils.read_cache import read_cache
+from src.utils.stream_governor import stream_governor, stream_library_file
+from src.utils.scan_scheduler import get_schedule_status
 
 router = APIRouter(prefix="/api")
 
 @router.get("/library", response_model=Dict[str, Any])
-async def get_library_info():
+async def get_library_info(request: Request):
     """获取音乐库信息"""
     libraries = get_music_libraries()
-    return {
+    etag = build_etag("library", *libraries)
+    return conditional_json(request, {
         "libraries": libraries,
         "count": len(libraries)
-    }
+    }, etag)
 
 @router.post("/library", response_model=Dict[str, Any])
 async def update_library(library_data: Dict[str, List[str]]):
@@ -65,6 +75,136 @@ async def scan_library(
         "status": scanner.get_status()
     }
 
+@router.get("/library/scan/schedule", response_model=Dict[str, Any])
+async def get_scan_schedule():
+    """
+    获取各音乐库目录的扫描策略（config.json中的library_scan_policies）
+    
+    返回:
+        - libraries: 每个目录的policy（priority、files_per_sec、playback_files_per_sec、concurrency、interval）、
+          last_scanned_at（最近一次扫描完成的时间）和playback_throttled（是否因同一设备正在播放而降速）
+    """
+    return {"libraries": get_schedule_status(get_music_libraries())}
+
+@router.post("/library/analyze", response_model=Dict[str, Any])
+async def analyze_library():
+    """开始后台响度分析，结果用于播放时自动均衡音量"""
+    success = scanner.start_analysis()
+    
+    return {
+        "success": success,
+        "message": "开始响度分析" if success else "响度分析已在进行中",
+        "status": scanner.get_status()
+    }
+
+@router.post("/library/duplicates/detect", response_model=Dict[str, Any])
+async def detect_library_duplicates():
+    """开始后台重复曲目检测"""
+    success = scanner.start_duplicate_detection()
+    
+    return {
+        "success": success,
+        "message": "开始检测重复曲目" if success else "重复曲目检测已在进行中",
+        "status": scanner.get_status()
+    }
+
+@router.get("/library/duplicates", response_model=Dict[str, Any])
+async def get_library_duplicates():
+    """
+    获取重复曲目报告
+    
+    返回:
+        - detected_at: 最近一次检测的时间
+        - groups: 重复组，每组包含kind（exact为同一文件的副本，similar为不同编码的同一首歌）、
+          primary（建议保留的版本）和items
+        - redundant_files / redundant_size: 可删除的副本数量和总大小（MB）
+    """
+    report = get_duplicate_groups()
+    groups = []
+    redundant_files = 0
+    redundant_size = 0.0
+    for group in report["groups"]:
+        items = [music_info for music_info in map(get_music_by_id, group["ids"]) if music_info]
+        if len(items) < 2:
+            continue
+        
+        groups.append({
+            "kind": group["kind"],
+            "primary": group["primary"],
+            "items": [
+                {key: item.get(key) for key in ("id", "name", "path", "size", "full_path", "duration")}
+                for item in items
+            ]
+        })
+        redundant_files += len(items) - 1
+        redundant_size += sum(item["size"] for item in items if item["id"] != group["primary"])
+    
+    return {
+        "detected_at": report["detected_at"],
+        "groups": groups,
+        "redundant_files": redundant_files,
+        "redundant_size": round(redundant_size, 2),
+        "status": scanner.get_status()["duplicates"]
+    }
+
+@router.get("/library/export")
+async def export_library(
+    format: str = Query("ndjson", description="导出格式：ndjson或binary（4字节长度前缀）")
+):
+    """
+    流式导出音乐库索引（曲目、路径与stat签名、ID别名、响度分析、音频指纹）
+    
+    第一条记录为header，之后每条记录的type为track、alias、analysis或fingerprint
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {format}")
+    
+    extension = "ndjson" if format == "ndjson" else "bin"
+    return StreamingResponse(
+        encode_records(iter_export_records(), format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="library_export.{extension}"'}
+    )
+
+@router.post("/library/import", response_model=Dict[str, Any])
+async def import_library(
+    request: Request,
+    format: Optional[str] = Query(None, description="导入格式：ndjson或binary，默认根据Content-Type判断")
+):
+    """
+    导入由/api/library/export导出的数据
+    
+    请求体先写入临时文件再分批写入索引，完成后后台重新扫描，只需核对stat签名。
+    多进程部署时由扫描进程执行导入，接口立即返回queued。
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {fmt}")
+    
+    fd, path = tempfile.mkstemp(prefix="library_import_", suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                f.write(chunk)
+        
+        if INDEX_MODE == "reader":
+            # 交给扫描进程导入，临时文件由扫描进程删除
+            library_index.enqueue_job("import", path=path, format=fmt)
+            path = None
+            return {"success": True, "queued": True}
+        
+        counts = await run_in_threadpool(import_library_file, path, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"导入数据无效: {str(e)}")
+    except Exception as e:
+        print(f"导入音乐库时出错: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"导入音乐库失败: {str(e)}")
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+    
+    return {"success": True, "queued": False, "imported": counts}
+
 @router.get("/library/scan/status", response_model=Dict[str, Any])
 async def get_scan_status():
     """获取音乐库扫描状态"""
@@ -76,32 +216,39 @@ async def clear_library_cache():
     clear_cache()
     return {"success": True, "message": "缓存已清除"}
 
+@router.post("/library/prefetch", response_model=Dict[str, Any])
+async def prefetch_songs(prefetch_data: Dict[str, List[str]]):
+    """预读列表中可见歌曲的开头部分，降低网络存储上首次播放的延迟"""
+    ids = prefetch_data.get("ids") or []
+    file_paths = []
+    for file_id in ids:
+        music_info = get_music_by_id(file_id)
+        if music_info:
+            file_paths.append(music_info["full_path"])
+    
+    read_cache.prefetch_head(file_paths)
+    return {"success": True, "count": len(file_paths)}
+
+@router.get("/library/read-cache", response_model=Dict[str, Any])
+async def get_read_cache_status():
+    """获取本地预读缓存状态"""
+    return read_cache.get_status()
+
+@router.get("/library/streams", response_model=Dict[str, Any])
+async def get_stream_metrics():
+    """
+    获取文件流的传输和排队情况（只是处理本次请求的工作进程的数据，限制也按进程计算）
+    
+    返回:
+        - limits: 并发数、保留给播放的名额、带宽和排队超时设置
+        - active / active_playback: 正在传输的流数（其中播放请求的数量）
+        - queued / queued_playback: 排队中的请求数
+        - streams: 每个正在传输的流的客户端、是否为播放、已发送字节数和持续时间
+        - served / rejected / bytes_sent / average_wait_ms: 累计统计
+    """
+    return stream_governor.get_metrics()
+
 @router.get("/library/{library_name}/{path:path}")
-async def get_library_file(library_name: str, path: str):
-    """提供对外部音乐库文件的访问"""
-    # 解码库名和路径
-    decoded_library = decode_filename(library_name)
-    decoded_path = decode_filename(path)
-    
-    # 获取最新的音乐库目录列表
-    music_library_dirs = get_current_music_libraries()
-    
-    # 查找匹配的库目录
-    matching_library = None
-    for library_dir in music_library_dirs:
-        if os.path.basename(library_dir) == decoded_library:
-            matching_library = library_dir
-            break
-    
-    if not matching_library:
-        raise HTTPException(status_code=404, detail=f"未找到音乐库: {decoded_library}")
-    
-    # 构建完整文件路径
-    file_path = os.path.join(matching_library, decoded_path)
-    
-    # 检查文件是否存在
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-        raise HTTPException(status_code=404, detail=f"文件不存在: {decoded_path}")
-    
-    # 返回文件
-    return FileResponse(file_path) 
\ No newline at end of file
+async def get_library_file(request: Request, library_name: str, path: str):
+    """提供对外部音乐库文件的访问（受并发数和带宽限制，播放请求优先）"""
+    return await stream_library_file(request, library_name, path)
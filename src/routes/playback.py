@@ -1,14 +1,78 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Path
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Path, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Dict, Any
 
-from src.models.player import player
+from src.models.player import DEFAULT_ZONE
+from src.models.zones import Zone, zone_manager, zone_status_feed
 from src.utils.file_utils import get_file_path, file_exists, decode_filename, get_music_by_id
+from src.utils.playlists import playlist_store
 
 router = APIRouter(prefix="/api")
 
+# 播放控制接口同时注册为 /api/xxx（default区域，也可以用zone查询参数指定）和 /api/zones/{zone}/xxx
+
+# 推送连接在没有状态变化时发送注释行的间隔（秒），避免被代理断开
+_KEEPALIVE_INTERVAL = 15
+
+def _get_zone(zone: str) -> Zone:
+    found = zone_manager.get(zone)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"播放区域不存在: {zone}")
+    return found
+
+@router.get("/zones")
+async def get_zones():
+    """
+    获取所有播放区域的状态（多个客户端共享同一次查询，结果最多缓存zone_status_interval秒）
+    
+    返回:
+        - zones: 区域名 -> 播放状态（与/api/zones/{zone}/status相同）
+        - updated_at: 查询时间
+    """
+    return await zone_status_feed.get()
+
+@router.get("/zones/events")
+async def zone_events(request: Request):
+    """以Server-Sent Events推送所有区域的合并状态，只在状态变化时发送"""
+    return StreamingResponse(
+        _iter_zone_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _iter_zone_events(request: Request):
+    last_zones = None
+    last_sent = 0.0
+    loop = asyncio.get_running_loop()
+    while not await request.is_disconnected():
+        status = await zone_status_feed.get()
+        if status["zones"] != last_zones:
+            last_zones = status["zones"]
+            last_sent = loop.time()
+            yield f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+        elif loop.time() - last_sent >= _KEEPALIVE_INTERVAL:
+            last_sent = loop.time()
+            yield ": keepalive\n\n"
+        await asyncio.sleep(zone_status_feed.interval)
+
 @router.post("/play/{file_id}")
-async def play_song(file_id: str = Path(..., description="音乐文件ID或文件名"), background_tasks: BackgroundTasks = None):
+@router.post("/zones/{zone}/play/{file_id}")
+async def play_song(
+    file_id: str = Path(..., description="音乐文件ID或文件名"),
+    zone: str = DEFAULT_ZONE,
+    background_tasks: BackgroundTasks = None
+):
     """播放指定歌曲"""
+    target = _get_zone(zone)
+    # 查找、停止、加载、播放都在该区域的音频线程中完成，不阻塞事件循环和其他区域
+    return await target.commands.run(_play_file, target.player, file_id)
+
+def _play_file(player, file_id: str) -> Dict[str, Any]:
+    """播放命令"""
     # 获取文件路径
     file_path = get_file_path(file_id)
     
@@ -29,6 +93,13 @@ async def play_song(file_id: str = Path(..., description="音乐文件ID或文
     player.play()
     player.current_song = song_name
     
+    # 记录播放历史
+    if music_info:
+        try:
+            playlist_store.log_play(music_info["id"])
+        except Exception as e:
+            print(f"记录播放历史时出错: {str(e)}")
+    
     return {
         "status": "playing",
         "song": song_name,
@@ -36,8 +107,14 @@ async def play_song(file_id: str = Path(..., description="音乐文件ID或文
     }
 
 @router.post("/pause")
-async def pause_song():
+@router.post("/zones/{zone}/pause")
+async def pause_song(zone: str = DEFAULT_ZONE):
     """暂停播放"""
+    target = _get_zone(zone)
+    return await target.commands.run(_pause, target.player)
+
+def _pause(player) -> Dict[str, Any]:
+    """暂停命令"""
     if not player.active:
         raise HTTPException(status_code=400, detail="没有正在播放的歌曲")
     
@@ -48,8 +125,14 @@ async def pause_song():
         raise HTTPException(status_code=400, detail="歌曲已经处于暂停状态")
 
 @router.post("/resume")
-async def resume_song():
+@router.post("/zones/{zone}/resume")
+async def resume_song(zone: str = DEFAULT_ZONE):
     """恢复播放"""
+    target = _get_zone(zone)
+    return await target.commands.run(_resume, target.player)
+
+def _resume(player) -> Dict[str, Any]:
+    """恢复命令"""
     if not player.active:
         raise HTTPException(status_code=400, detail="没有正在播放的歌曲")
     
@@ -60,8 +143,14 @@ async def resume_song():
         raise HTTPException(status_code=400, detail="歌曲已经处于播放状态")
 
 @router.post("/stop")
-async def stop_song():
+@router.post("/zones/{zone}/stop")
+async def stop_song(zone: str = DEFAULT_ZONE):
     """停止播放"""
+    target = _get_zone(zone)
+    return await target.commands.run(_stop, target.player)
+
+def _stop(player) -> Dict[str, Any]:
+    """停止命令"""
     if not player.active:
         raise HTTPException(status_code=400, detail="没有正在播放的歌曲")
     
@@ -69,33 +158,151 @@ async def stop_song():
     return {"status": "stopped"}
 
 @router.post("/seek")
-async def seek_position(position_data: dict):
+@router.post("/zones/{zone}/seek")
+async def seek_position(position_data: dict, zone: str = DEFAULT_ZONE):
     """调整播放位置"""
+    target = _get_zone(zone)
+    position = float(position_data.get('position', 0))
+    # 连续拖动进度条时，尚未执行的seek合并为最后一次
+    return await target.commands.run(_seek, target.player, position, coalesce_key="seek")
+
+def _seek(player, position: float) -> Dict[str, Any]:
+    """调整播放位置命令"""
     if not player.active:
         raise HTTPException(status_code=400, detail="没有正在播放的歌曲")
     
-    position = float(position_data.get('position', 0))
     player.seek(position)
     return {"status": "seek", "position": position}
 
 @router.post("/volume")
-async def set_volume(volume_data: dict):
+@router.post("/zones/{zone}/volume")
+async def set_volume(volume_data: dict, zone: str = DEFAULT_ZONE):
     """设置音量"""
+    target = _get_zone(zone)
     volume = float(volume_data.get('volume', 0))
     if volume < 0 or volume > 1:
         raise HTTPException(status_code=400, detail="音量必须在0-1范围内")
     
+    return await target.commands.run(_set_volume, target.player, volume, coalesce_key="volume")
+
+def _set_volume(player, volume: float) -> Dict[str, Any]:
+    """设置音量命令"""
     player.set_volume(volume)
     return {"status": "volume_set", "volume": volume}
 
 @router.post("/loop")
-async def set_loop(loop_data: dict):
+@router.post("/zones/{zone}/loop")
+async def set_loop(loop_data: dict, zone: str = DEFAULT_ZONE):
     """设置循环播放"""
+    target = _get_zone(zone)
     loop = bool(loop_data.get('loop', False))
+    return await target.commands.run(_set_loop, target.player, loop, coalesce_key="loop")
+
+def _set_loop(player, loop: bool) -> Dict[str, Any]:
+    """设置循环播放命令"""
     player.set_loop(loop)
     return {"status": "loop_set", "loop": loop}
 
 @router.get("/status")
-async def get_status():
+@router.get("/zones/{zone}/status")
+async def get_status(zone: str = DEFAULT_ZONE):
     """获取当前播放状态"""
-    return player.get_status() 
\ No newline at end of file
+    target = _get_zone(zone)
+    # 多进程部署时读取状态需要访问播放进程，在线程池中执行，不阻塞事件循环
+    status = await run_in_threadpool(target.player.get_status)
+    status["pending_commands"] = target.commands.pending_count()
+    return status
+
+def _queue_entry(file_id: str) -> Dict[str, Any]:
+    """根据歌曲ID构建播放队列项"""
+    music_info = get_music_by_id(file_id)
+    if not music_info or not file_exists(file_id):
+        raise HTTPException(status_code=404, detail=f"文件不存在: {file_id}")
+    return {
+        "id": music_info["id"],
+        "name": music_info["name"],
+        "file_path": music_info["full_path"]
+    }
+
+@router.get("/queue")
+@router.get("/zones/{zone}/queue")
+async def get_queue(zone: str = DEFAULT_ZONE):
+    """获取播放队列"""
+    return await run_in_threadpool(_queue_state, _get_zone(zone).player)
+
+def _queue_state(player) -> Dict[str, Any]:
+    """当前曲目和播放队列（只读取不需要加锁的属性，不等待正在执行的命令）"""
+    return {
+        "current_song": player.current_song,
+        "items": player.get_queue()
+    }
+
+@router.post("/queue")
+@router.post("/zones/{zone}/queue")
+async def enqueue_songs(queue_data: dict, zone: str = DEFAULT_ZONE):
+    """添加歌曲到播放队列，可通过position指定插入位置"""
+    target = _get_zone(zone)
+    ids = queue_data.get('ids') or []
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(status_code=400, detail="ids必须是非空数组")
+    
+    position = queue_data.get('position')
+    entries = [_queue_entry(file_id) for file_id in ids]
+    return await target.commands.run(_enqueue, target.player, entries, int(position) if position is not None else None)
+
+def _enqueue(player, entries, position) -> Dict[str, Any]:
+    """添加到队列命令"""
+    added = player.enqueue(entries, position)
+    return {"status": "queued", "items": added, "queue_length": len(player.get_queue())}
+
+@router.post("/queue/move")
+@router.post("/zones/{zone}/queue/move")
+async def move_in_queue(move_data: dict, zone: str = DEFAULT_ZONE):
+    """调整队列中歌曲的顺序"""
+    target = _get_zone(zone)
+    try:
+        return await target.commands.run(_move_in_queue, target.player, int(move_data.get('from', 0)), int(move_data.get('to', 0)))
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _move_in_queue(player, from_index: int, to_index: int) -> Dict[str, Any]:
+    """调整队列顺序命令"""
+    player.move_in_queue(from_index, to_index)
+    return {"status": "moved", "items": player.get_queue()}
+
+@router.delete("/queue/{index}")
+@router.delete("/zones/{zone}/queue/{index}")
+async def remove_from_queue(index: int = Path(..., description="队列位置"), zone: str = DEFAULT_ZONE):
+    """从播放队列中移除歌曲"""
+    target = _get_zone(zone)
+    try:
+        entry = await target.commands.run(target.player.remove_from_queue, index)
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "removed", "item": entry}
+
+@router.delete("/queue")
+@router.delete("/zones/{zone}/queue")
+async def clear_queue(zone: str = DEFAULT_ZONE):
+    """清空播放队列"""
+    target = _get_zone(zone)
+    await target.commands.run(target.player.clear_queue)
+    return {"status": "cleared"}
+
+@router.post("/queue/next")
+@router.post("/zones/{zone}/queue/next")
+async def play_next_in_queue(zone: str = DEFAULT_ZONE):
+    """跳到队列中的下一首"""
+    target = _get_zone(zone)
+    return await target.commands.run(_skip, target.player)
+
+def _skip(player) -> Dict[str, Any]:
+    """下一首命令"""
+    entry = player.skip()
+    if entry is None:
+        return {"status": "stopped", "song": None}
+    return {
+        "status": "playing",
+        "song": entry["name"],
+        "duration": player.duration
+    }
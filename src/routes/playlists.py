@@ -0,0 +1,190 @@
+from fastapi import APIRouter, HTTPException, Query, Path
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional
+
+from src.utils.file_utils import get_music_by_id
+from src.utils.library_index import library_index
+from src.utils.playlists import playlist_store, normalize_rule
+
+router = APIRouter(prefix="/api")
+
+def _resolve_tracks(track_ids: List[str]) -> List[Dict[str, Any]]:
+    """把曲目ID解析为音乐文件信息，跳过已不在音乐库中的曲目"""
+    tracks = []
+    for track_id in track_ids:
+        music_info = get_music_by_id(track_id)
+        if music_info:
+            tracks.append(music_info)
+    return tracks
+
+def _get_playlist_or_404(playlist_id: int) -> Dict[str, Any]:
+    playlist = playlist_store.get_playlist(playlist_id)
+    if not playlist:
+        raise HTTPException(status_code=404, detail="播放列表不存在")
+    return playlist
+
+@router.get("/playlists", response_model=List[Dict[str, Any]])
+async def get_playlists():
+    """获取所有播放列表"""
+    return playlist_store.list_playlists()
+
+@router.post("/playlists", response_model=Dict[str, Any])
+async def create_playlist(playlist_data: dict):
+    """
+    创建播放列表
+
+    请求体:
+        - name: 名称
+        - ids: 普通播放列表的曲目ID
+        - rule: 智能播放列表的筛选规则（query、artist、album、genre、year、min_duration、max_duration）
+    """
+    name = (playlist_data.get("name") or "").strip()
+    if not name:
+        raise HTTPException(status_code=400, detail="缺少name字段")
+
+    rule = playlist_data.get("rule")
+    if rule is not None:
+        if not isinstance(rule, dict):
+            raise HTTPException(status_code=400, detail="rule必须是一个对象")
+        rule = normalize_rule(rule)
+
+    ids = playlist_data.get("ids") or []
+    if not isinstance(ids, list):
+        raise HTTPException(status_code=400, detail="ids必须是一个数组")
+
+    try:
+        # 智能播放列表需要遍历整个音乐库，在线程池中执行
+        playlist_id = await run_in_threadpool(playlist_store.create_playlist, name, ids, rule)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return playlist_store.get_playlist(playlist_id)
+
+@router.get("/playlists/{playlist_id}", response_model=Dict[str, Any])
+async def get_playlist(
+    playlist_id: int = Path(..., description="播放列表ID"),
+    limit: int = Query(500, description="最大返回数量", ge=1, le=5000),
+    offset: int = Query(0, description="起始位置", ge=0)
+):
+    """获取播放列表及其曲目"""
+    playlist = _get_playlist_or_404(playlist_id)
+    track_ids = playlist_store.get_track_ids(playlist_id, playlist["smart"], limit, offset)
+    playlist["items"] = _resolve_tracks(track_ids)
+    return playlist
+
+@router.put("/playlists/{playlist_id}", response_model=Dict[str, Any])
+async def update_playlist(playlist_data: dict, playlist_id: int = Path(..., description="播放列表ID")):
+    """重命名播放列表，或修改智能播放列表的规则"""
+    playlist = _get_playlist_or_404(playlist_id)
+
+    name = playlist_data.get("name")
+    if name is not None:
+        name = name.strip()
+        if not name:
+            raise HTTPException(status_code=400, detail="name不能为空")
+
+    rule = playlist_data.get("rule")
+    if rule is not None:
+        if not playlist["smart"] or not isinstance(rule, dict):
+            raise HTTPException(status_code=400, detail="只能修改智能播放列表的规则")
+        rule = normalize_rule(rule)
+
+    try:
+        await run_in_threadpool(playlist_store.update_playlist, playlist_id, name, rule)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return playlist_store.get_playlist(playlist_id)
+
+@router.delete("/playlists/{playlist_id}", response_model=Dict[str, Any])
+async def delete_playlist(playlist_id: int = Path(..., description="播放列表ID")):
+    """删除播放列表"""
+    _get_playlist_or_404(playlist_id)
+    playlist_store.delete_playlist(playlist_id)
+    return {"success": True}
+
+def _get_editable_items(playlist_id: int) -> List[str]:
+    """读取普通播放列表的全部曲目ID，智能播放列表不能手动编辑"""
+    playlist = _get_playlist_or_404(playlist_id)
+    if playlist["smart"]:
+        raise HTTPException(status_code=400, detail="智能播放列表不能手动编辑")
+    return playlist_store.get_track_ids(playlist_id, False)
+
+@router.post("/playlists/{playlist_id}/items", response_model=Dict[str, Any])
+async def add_playlist_items(item_data: dict, playlist_id: int = Path(..., description="播放列表ID")):
+    """添加曲目到播放列表，可通过position指定插入位置"""
+    ids = item_data.get("ids") or []
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(status_code=400, detail="ids必须是非空数组")
+
+    track_ids = _get_editable_items(playlist_id)
+    position = item_data.get("position")
+    position = len(track_ids) if position is None else max(0, min(int(position), len(track_ids)))
+    track_ids[position:position] = ids
+    playlist_store.set_items(playlist_id, track_ids)
+    return {"success": True, "count": len(track_ids)}
+
+@router.post("/playlists/{playlist_id}/items/move", response_model=Dict[str, Any])
+async def move_playlist_item(move_data: dict, playlist_id: int = Path(..., description="播放列表ID")):
+    """调整播放列表中曲目的顺序"""
+    track_ids = _get_editable_items(playlist_id)
+    from_index = int(move_data.get("from", 0))
+    to_index = int(move_data.get("to", 0))
+    if not (0 <= from_index < len(track_ids) and 0 <= to_index < len(track_ids)):
+        raise HTTPException(status_code=400, detail="位置超出范围")
+
+    track_ids.insert(to_index, track_ids.pop(from_index))
+    playlist_store.set_items(playlist_id, track_ids)
+    return {"success": True}
+
+@router.delete("/playlists/{playlist_id}/items/{position}", response_model=Dict[str, Any])
+async def remove_playlist_item(
+    playlist_id: int = Path(..., description="播放列表ID"),
+    position: int = Path(..., description="曲目位置")
+):
+    """从播放列表中移除曲目"""
+    track_ids = _get_editable_items(playlist_id)
+    if not 0 <= position < len(track_ids):
+        raise HTTPException(status_code=400, detail="位置超出范围")
+
+    removed = track_ids.pop(position)
+    playlist_store.set_items(playlist_id, track_ids)
+    return {"success": True, "removed": removed}
+
+@router.get("/history", response_model=Dict[str, Any])
+async def get_play_history(
+    limit: int = Query(50, description="最大返回数量", ge=1, le=1000),
+    before: Optional[float] = Query(None, description="只返回该时间之前的记录，用于翻页")
+):
+    """获取播放记录（按时间倒序）"""
+    entries = playlist_store.get_history(limit, before)
+    for entry in entries:
+        entry["track"] = get_music_by_id(entry["track_id"])
+    return {
+        "items": entries,
+        "next_before": entries[-1]["played_at"] if len(entries) == limit else None
+    }
+
+@router.get("/stats/most-played", response_model=List[Dict[str, Any]])
+async def get_most_played(limit: int = Query(50, description="最大返回数量", ge=1, le=1000)):
+    """获取播放次数最多的曲目"""
+    return _with_tracks(playlist_store.most_played(limit))
+
+@router.get("/stats/recently-played", response_model=List[Dict[str, Any]])
+async def get_recently_played(limit: int = Query(50, description="最大返回数量", ge=1, le=1000)):
+    """获取最近播放的曲目"""
+    return _with_tracks(playlist_store.recently_played(limit))
+
+@router.get("/stats/recently-added", response_model=List[Dict[str, Any]])
+async def get_recently_added(limit: int = Query(50, description="最大返回数量", ge=1, le=1000)):
+    """获取最近添加的曲目"""
+    return library_index.load_recent(limit)
+
+def _with_tracks(stats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """为统计结果附加曲目信息，跳过已不在音乐库中的曲目"""
+    result = []
+    for entry in stats:
+        music_info = get_music_by_id(entry["track_id"])
+        if music_info:
+            result.append(dict(music_info, play_count=entry["play_count"], last_played=entry["last_played"]))
+    return result
@@ -1,19 +1,180 @@
-from fastapi import APIRouter, Query, Path, HTTPException
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Query, Path, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+import json
 import os
 
-from src.utils.file_utils import get_all_music_files, get_file_path, file_exists
-from src.utils.metadata_utils import extract_metadata
-from src.utils.search_utils import search_music, filter_music
+from src.utils.file_utils import (
+    get_all_music_files,
+    get_file_path,
+    file_exists,
+    resolve_file_id,
+    get_library_version,
+    get_changes_since,
+    get_library_snapshot,
+    get_scan_feed,
+    get_music_by_id,
+    get_music_by_ids,
+    peek_library_snapshot,
+    SCAN_BATCH_SIZE
+)
+from src.config.settings import INDEX_MODE, METADATA_WORKERS
+from src.utils.async_scanner import scanner
+from src.utils.http_utils import build_etag, conditional_json
+from src.utils.duplicates import get_duplicate_groups, collapse_duplicates
+from src.utils.fuzzy_search import fuzzy_searcher
+from src.utils.library_index import library_index
+from src.utils.lyrics import lyrics_index
+from src.utils.waveform import load_waveform, sample_pyramid
+from src.utils.metadata_utils import get_cached_metadata, extract_metadata_batch
+from src.utils.search_utils import search_music, filter_music, begin_client_search, end_client_search, SearchCancelled
 
 router = APIRouter(prefix="/api")
 
+# 批量获取元数据时每次请求最多的ID数
+MAX_METADATA_BATCH = 5000
+
 @router.get("/songs", response_model=List[Dict[str, Any]])
 async def get_songs(
+    request: Request,
+    include_metadata: bool = Query(False, description="是否包含音乐元数据"),
+    collapse_duplicates_: bool = Query(False, alias="collapse_duplicates", description="是否折叠重复曲目")
+):
+    """
+    获取所有歌曲列表
+    
+    只读工作进程中，扫描进程尚未写入含元数据的索引时返回202（不带ETag），客户端稍后重试
+    """
+    # 还没有快照或缺少元数据时需要扫描，在线程池中执行，避免阻塞事件循环
+    snapshot = await run_in_threadpool(get_library_snapshot, False, include_metadata)
+    if include_metadata and not snapshot.include_metadata:
+        return JSONResponse(
+            status_code=202,
+            content={"status": "pending", "detail": "正在读取音乐元数据，请稍后重试"},
+            headers={"Cache-Control": "no-store", "Retry-After": "2"}
+        )
+    
+    # ETag使用快照本身的版本号，与返回的内容一致
+    songs = snapshot.files
+    version = snapshot.version
+    etag = build_etag("songs", version, include_metadata)
+    
+    # 折叠后每组只保留一个版本，其余版本的ID放在duplicates字段中
+    if collapse_duplicates_:
+        duplicates = get_duplicate_groups()
+        songs = collapse_duplicates(songs, duplicates["groups"])
+        etag = build_etag("songs", version, include_metadata, "collapsed", duplicates["detected_at"])
+    
+    return conditional_json(request, songs, etag, headers={"X-Library-Version": str(version)})
+
+@router.get("/songs/changes", response_model=Dict[str, Any])
+async def get_song_changes(
+    since: int = Query(..., description="客户端持有的音乐库版本号"),
     include_metadata: bool = Query(False, description="是否包含音乐元数据")
 ):
-    """获取所有歌曲列表"""
-    return get_all_music_files(include_metadata=include_metadata)
+    """
+    获取指定版本之后的歌曲变更
+    
+    返回:
+        - version: 当前版本号
+        - full_resync: 是否需要全量同步（版本过旧时为true）
+        - added: 新增的歌曲
+        - removed: 删除的歌曲ID
+        - updated: 更新的歌曲
+    """
+    # 确保缓存是最新的
+    songs = await run_in_threadpool(get_all_music_files, include_metadata)
+    version = get_library_version()
+    
+    changes = get_changes_since(since)
+    if changes is None:
+        return {
+            "version": version,
+            "full_resync": True,
+            "added": [],
+            "removed": [],
+            "updated": []
+        }
+    
+    changed_ids = set(changes["added"]) | set(changes["updated"])
+    changed_songs = {song["id"]: song for song in songs if song["id"] in changed_ids}
+    
+    return {
+        "version": version,
+        "full_resync": False,
+        "added": [changed_songs[file_id] for file_id in changes["added"] if file_id in changed_songs],
+        "removed": changes["removed"],
+        "updated": [changed_songs[file_id] for file_id in changes["updated"] if file_id in changed_songs]
+    }
+
+@router.get("/songs/stream")
+async def stream_songs(
+    include_metadata: bool = Query(False, description="是否包含音乐元数据")
+):
+    """
+    流式获取歌曲列表（NDJSON，每行一条记录）
+    
+    还没有扫描结果时启动扫描，每读取一批文件就立即输出，界面不必等待扫描完成
+    （可能是重命名或移动的新文件需要在遍历结束后确认ID，最后输出）：
+        - {"type": "batch", "items": [...]}: 一批歌曲（扫描过程中按发现顺序，未排序）
+        - {"type": "done", "version": 版本号, "total": 歌曲总数}: 全部输出完毕
+        - {"type": "error", "message": 错误信息}: 扫描失败
+    """
+    return StreamingResponse(
+        _iter_song_stream(include_metadata),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store"}
+    )
+
+async def _iter_song_stream(include_metadata: bool) -> AsyncIterator[bytes]:
+    # 只读工作进程没有扫描数据流，直接输出索引中的快照
+    if INDEX_MODE != "reader":
+        snapshot = peek_library_snapshot()
+        if snapshot is None or (include_metadata and not snapshot.include_metadata):
+            feed = await _wait_for_scan_feed(include_metadata)
+            if feed is not None:
+                async for line in _follow_scan_feed(feed):
+                    yield line
+                return
+    
+    songs = await run_in_threadpool(get_all_music_files, include_metadata)
+    version = get_library_version()
+    for start in range(0, len(songs), SCAN_BATCH_SIZE):
+        yield _ndjson({"type": "batch", "items": songs[start:start + SCAN_BATCH_SIZE]})
+    yield _ndjson({"type": "done", "version": version, "total": len(songs)})
+
+async def _wait_for_scan_feed(include_metadata: bool):
+    """启动扫描并等待其数据流出现；已有扫描在进行且满足要求时直接跟随它"""
+    previous = get_scan_feed()
+    scanner.start_scan(include_metadata=include_metadata)
+    while True:
+        feed = get_scan_feed()
+        if feed is not None and (feed is not previous or not feed.done):
+            return feed if feed.include_metadata or not include_metadata else None
+        if not scanner.is_scanning:
+            return None
+        await asyncio.sleep(0.05)
+
+async def _follow_scan_feed(feed) -> AsyncIterator[bytes]:
+    """输出扫描数据流中的文件，直到扫描结束"""
+    seen = 0
+    while True:
+        files, done = await run_in_threadpool(feed.wait, seen)
+        for start in range(0, len(files), SCAN_BATCH_SIZE):
+            yield _ndjson({"type": "batch", "items": files[start:start + SCAN_BATCH_SIZE]})
+        seen += len(files)
+        if done:
+            break
+    
+    if feed.version is None:
+        yield _ndjson({"type": "error", "message": "扫描音乐库失败"})
+    else:
+        yield _ndjson({"type": "done", "version": feed.version, "total": seen})
+
+def _ndjson(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
 
 @router.get("/songs/{file_id}/metadata", response_model=Dict[str, Any])
 async def get_song_metadata(
@@ -29,21 +190,146 @@ async def get_song_metadata(
     file_name = os.path.basename(file_path)
     title = os.path.splitext(file_name)[0]
     
-    # 提取元数据
-    metadata = extract_metadata(file_path)
+    # 提取元数据（文件未变化时使用缓存）
+    metadata = get_cached_metadata(file_path)
+    
+    # 旧ID解析为当前ID
+    canonical_id = resolve_file_id(file_id)
     
     # 基本信息
     result = {
-        "id": file_id,
+        "id": canonical_id,
         "name": file_name,
         "title": metadata.get("title") or title,
-        "metadata": metadata
+        "metadata": metadata,
+        "loudness": library_index.get_analysis(canonical_id)
     }
     
     return result
 
+@router.post("/songs/metadata:batch", response_model=Dict[str, Any])
+async def get_songs_metadata_batch(request_data: Dict[str, List[str]]):
+    """
+    批量获取歌曲元数据，一次请求即可填充整个可见列表
+    
+    请求体: {"ids": [歌曲ID, ...]}，最多MAX_METADATA_BATCH个
+    
+    返回:
+        - items: 请求的ID -> 与/api/songs/{file_id}/metadata相同的结果
+        - missing: 找不到的ID
+    
+    扫描结果中已有元数据的歌曲直接使用，其余并行读取文件提取。
+    """
+    file_ids = request_data.get("ids")
+    if not isinstance(file_ids, list):
+        raise HTTPException(status_code=400, detail="缺少ids字段")
+    file_ids = list(dict.fromkeys(file_ids))
+    if len(file_ids) > MAX_METADATA_BATCH:
+        raise HTTPException(status_code=400, detail=f"一次最多获取{MAX_METADATA_BATCH}首歌曲的元数据")
+    
+    files = await run_in_threadpool(get_music_by_ids, file_ids)
+    extracted = await run_in_threadpool(
+        extract_metadata_batch,
+        [file["full_path"] for file in files.values() if "metadata" not in file],
+        METADATA_WORKERS
+    )
+    loudness = library_index.get_analysis_batch({file["id"] for file in files.values()})
+    
+    items = {}
+    for file_id, file in files.items():
+        metadata = file["metadata"] if "metadata" in file else extracted[file["full_path"]]
+        items[file_id] = {
+            "id": file["id"],
+            "name": file["name"],
+            "title": metadata.get("title") or os.path.splitext(file["name"])[0],
+            "metadata": metadata,
+            "loudness": loudness.get(file["id"])
+        }
+    
+    return {
+        "items": items,
+        "missing": [file_id for file_id in file_ids if file_id not in files]
+    }
+
+@router.get("/songs/{file_id}/lyrics", response_model=Dict[str, Any])
+async def get_song_lyrics(
+    request: Request,
+    file_id: str = Path(..., description="音乐文件ID")
+):
+    """
+    获取歌曲歌词
+    
+    返回:
+        - source: sidecar（同名的.lrc文件）或embedded（内嵌歌词）
+        - synced: 是否为同步歌词
+        - lines: 各行歌词，time为开始时间（秒），非同步歌词为null
+    """
+    file = get_music_by_id(file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    lyrics = await run_in_threadpool(lyrics_index.get_lyrics, file)
+    if lyrics is None:
+        raise HTTPException(status_code=404, detail="没有找到歌词")
+    
+    etag = build_etag("lyrics", file["id"], lyrics.signature)
+    return conditional_json(request, {"id": file["id"], **lyrics.to_dict()}, etag)
+
+@router.get("/songs/lyrics/search", response_model=Dict[str, Any])
+async def search_lyrics(
+    q: str = Query(..., description="一句歌词"),
+    limit: int = Query(50, description="最大返回结果数量", ge=1, le=200)
+):
+    """
+    按歌词搜索歌曲
+    
+    返回:
+        - items: 歌曲列表，lyric_match为匹配的行（line行号、text歌词、time开始时间）
+        - total: 结果总数
+        - query: 搜索关键词
+    """
+    matches = await run_in_threadpool(lyrics_index.search, q, limit)
+    files = get_music_by_ids([match["id"] for match in matches])
+    items = [
+        {**files[match["id"]], "lyric_match": {"line": match["line"], "text": match["text"], "time": match["time"]}}
+        for match in matches if match["id"] in files
+    ]
+    return {
+        "items": items,
+        "total": len(items),
+        "query": q
+    }
+
+@router.get("/songs/{file_id}/waveform", response_model=Dict[str, Any])
+async def get_song_waveform(
+    request: Request,
+    file_id: str = Path(..., description="音乐文件ID"),
+    points: int = Query(512, description="波形点数", ge=16, le=8192)
+):
+    """
+    获取歌曲波形（每段的最小/最大值）
+    
+    返回:
+        - points: 点数
+        - scale: 取值范围（-scale~scale）
+        - min / max: 每段的最小值和最大值
+    """
+    if not file_exists(file_id):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    try:
+        key, levels = await load_waveform(get_file_path(file_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成波形失败: {str(e)}")
+    
+    if levels is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return conditional_json(request, sample_pyramid(levels, points), build_etag("waveform", key, points))
+
 @router.get("/songs/search", response_model=Dict[str, Any])
 async def search_songs(
+    request: Request,
     q: str = Query(..., description="搜索关键词"),
     limit: int = Query(50, description="最大返回结果数量", ge=1, le=200),
     artist: Optional[str] = Query(None, description="按艺术家筛选"),
@@ -51,6 +337,7 @@ async def search_songs(
     genre: Optional[str] = Query(None, description="按流派筛选"),
     min_duration: Optional[int] = Query(None, description="最小时长（秒）", ge=0),
     max_duration: Optional[int] = Query(None, description="最大时长（秒）", ge=0),
+    fuzzy: bool = Query(False, description="是否容忍拼写错误（同时支持拼音）")
 ):
     """
     搜索歌曲
@@ -59,9 +346,23 @@ async def search_songs(
         - items: 搜索结果列表
         - total: 结果总数
         - query: 搜索关键词
+        - fuzzy: 是否使用了模糊搜索（模糊索引尚未构建完成时退回到普通搜索）
+    
+    请求头X-Client-Id相同的搜索中，新请求会取代尚未完成的旧请求（旧请求返回409）。
     """
-    # 搜索音乐
-    search_results = search_music(q, include_metadata=True, limit=limit)
+    cancelled = begin_client_search(request.headers.get("X-Client-Id"))
+    
+    # 搜索音乐（在线程池中执行，避免阻塞事件循环）
+    try:
+        search_results = await run_in_threadpool(fuzzy_searcher.search, q, limit) if fuzzy else None
+        used_fuzzy = search_results is not None
+        if search_results is None:
+            search_results = await run_in_threadpool(search_music, q, True, limit, cancelled)
+    except SearchCancelled:
+        raise HTTPException(status_code=409, detail="搜索已被新的请求取代")
+    finally:
+        end_client_search(cancelled)
+    etag = build_etag("search", get_library_version(), q, limit, artist, album, genre, min_duration, max_duration, used_fuzzy)
     
     # 应用筛选
     if any([artist, album, genre, min_duration, max_duration]):
@@ -76,8 +377,9 @@ async def search_songs(
     else:
         filtered_results = search_results
     
-    return {
+    return conditional_json(request, {
         "items": filtered_results,
         "total": len(filtered_results),
-        "query": q
-    } 
\ No newline at end of file
+        "query": q,
+        "fuzzy": used_fuzzy
+    }, etag) 
\ No newline at end of file
@@ -0,0 +1,133 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
+from typing import Dict, Any
+
+from src.utils.uploads import upload_manager, UploadBusy, UploadOffsetMismatch
+
+router = APIRouter(prefix="/api")
+
+# multipart请求中每次读取的大小
+_FORM_READ_SIZE = 64 * 1024
+
+def _get_upload_or_404(upload_id: str) -> Dict[str, Any]:
+    upload = upload_manager.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return upload
+
+async def _iter_chunk(request: Request):
+    """
+    请求体中的数据块：直接上传时为原始请求体，也可以是multipart表单的chunk字段
+
+    原始请求体边接收边写入；表单由python-multipart解析到临时文件后再分段读取，都不会把整块读入内存
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        async for data in request.stream():
+            yield data
+        return
+
+    form = await request.form()
+    try:
+        chunk = form.get("chunk")
+        if chunk is None or isinstance(chunk, str):
+            raise ValueError("缺少chunk文件字段")
+        while True:
+            data = await chunk.read(_FORM_READ_SIZE)
+            if not data:
+                break
+            yield data
+    finally:
+        await form.close()
+
+@router.post("/uploads", response_model=Dict[str, Any])
+async def create_upload(upload_data: dict):
+    """
+    创建上传会话
+
+    请求体:
+        - library: 目标音乐库（目录或目录名）
+        - path: 音乐库中的相对路径，如 "Artist/Album/01.flac"
+        - size: 文件大小（字节）
+        - sha256: 文件的SHA-256（十六进制），全部上传后校验
+    """
+    try:
+        size = int(upload_data.get("size") or 0)
+        return upload_manager.create(
+            upload_data.get("library") or "",
+            upload_data.get("path") or "",
+            size,
+            upload_data.get("sha256") or ""
+        )
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail="目标文件已存在")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/uploads/{upload_id}", response_model=Dict[str, Any])
+async def get_upload(upload_id: str):
+    """
+    获取上传状态
+
+    返回:
+        - offset: 已接收的字节数，中断后从这里继续上传
+        - status: uploading、stored（已移入音乐库，等待加入索引）、indexed（可以搜索和播放）或failed
+        - file_id: 加入索引后的曲目ID
+    """
+    return _get_upload_or_404(upload_id)
+
+@router.put("/uploads/{upload_id}", response_model=Dict[str, Any])
+async def upload_chunk(
+    request: Request,
+    upload_id: str,
+    offset: int = Query(..., ge=0, description="本块在文件中的起始位置，必须等于已接收的字节数")
+):
+    """
+    上传一块数据（请求体为原始字节，或multipart表单的chunk字段）
+
+    offset与已接收的字节数不一致时返回409，响应中的offset为应继续的位置
+    """
+    _get_upload_or_404(upload_id)
+    try:
+        return await upload_manager.write_chunk(upload_id, offset, _iter_chunk(request))
+    except UploadOffsetMismatch as e:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "偏移量与已接收的数据不一致", "offset": e.received}
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientDisconnect:
+        # 已接收的部分保留，客户端重新连接后查询offset继续
+        print(f"上传连接中断: {upload_id}")
+        raise HTTPException(status_code=400, detail="上传连接中断")
+
+@router.post("/uploads/{upload_id}/complete", response_model=Dict[str, Any])
+async def complete_upload(upload_id: str):
+    """
+    完成上传：校验SHA-256后移入音乐库，随后只把这个文件加入索引并读取标签，不重新扫描整个音乐库
+
+    校验失败时已接收的数据被丢弃，需要从offset 0重新上传
+    """
+    try:
+        return await upload_manager.complete(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail="目标文件已存在")
+    except UploadBusy:
+        raise HTTPException(status_code=409, detail="上传数据仍在接收或正在校验，请稍后重试")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"完成上传时出错: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"完成上传失败: {str(e)}")
+
+@router.delete("/uploads/{upload_id}", response_model=Dict[str, Any])
+async def cancel_upload(upload_id: str):
+    """取消上传并删除已接收的数据"""
+    if not await upload_manager.cancel(upload_id):
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return {"success": True}
@@ -3,11 +3,19 @@
 """
 
 import asyncio
+import json
 import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Any, Optional, Callable
 
-from src.utils.file_utils import scan_music_library, clear_cache
+from src.config.settings import INDEX_MODE, ANALYSIS_WORKERS, REPLAYGAIN_TARGET_LUFS
+from src.config.settings_manager import get_music_libraries
+from src.utils.file_utils import (
+    scan_music_library, clear_cache, get_stat_signature, get_scan_progress, load_persisted_snapshot, rescan_libraries
+)
+from src.utils.library_index import library_index
+from src.utils.scan_scheduler import get_due_libraries
 
 class AsyncLibraryScanner:
     """异步音乐库扫描器，用于在后台扫描音乐库"""
@@ -18,17 +26,44 @@ class AsyncLibraryScanner:
         self.scan_result: Optional[List[Dict[str, Any]]] = None
         self.scan_thread: Optional[threading.Thread] = None
         self.callbacks: List[Callable] = []  # 扫描完成后的回调函数列表
+        
+        # 响度分析任务状态
+        self.analysis_thread: Optional[threading.Thread] = None
+        self.analysis_status: Dict[str, Any] = {
+            "is_running": False,
+            "total": 0,
+            "done": 0,
+            "skipped": 0,
+            "failed": 0
+        }
+        
+        # 重复曲目检测任务状态
+        self.duplicates_thread: Optional[threading.Thread] = None
+        self.duplicates_status: Dict[str, Any] = {
+            "is_running": False,
+            "candidates": 0,
+            "done": 0,
+            "groups": 0
+        }
     
-    def start_scan(self, include_metadata: bool = False) -> bool:
+    def start_scan(self, include_metadata: bool = False, library_dirs: Optional[List[str]] = None) -> bool:
         """
         开始异步扫描
         
         Args:
             include_metadata: 是否包含音乐元数据
+            library_dirs: 只重新扫描这些目录（定期扫描使用，只在扫描进程中有效），None表示全部
             
         Returns:
             是否成功启动扫描
         """
+        # 只读工作进程把扫描请求交给扫描进程处理
+        if INDEX_MODE == "reader":
+            if self.get_status()["is_scanning"]:
+                return False
+            library_index.request_scan(include_metadata)
+            return True
+        
         # 如果已经在扫描中，返回False
         if self.is_scanning:
             return False
@@ -39,18 +74,76 @@ class AsyncLibraryScanner:
         # 在新线程中执行扫描
         self.scan_thread = threading.Thread(
             target=self._scan_thread_func,
-            args=(include_metadata,),
+            args=(include_metadata, library_dirs),
             daemon=True
         )
         self.scan_thread.start()
         
         return True
     
-    def _scan_thread_func(self, include_metadata: bool) -> None:
+    def warm_start(self) -> bool:
+        """
+        启动时先加载索引中保存的快照立即提供服务，再在后台重新扫描核对
+        
+        Returns:
+            是否加载到了已保存的快照（索引为空时直接开始扫描）
+        """
+        snapshot = load_persisted_snapshot()
+        if snapshot is not None:
+            self.start_scan(include_metadata=snapshot.include_metadata)
+            return True
+        
+        if self.is_scanning:
+            return False
+        self.is_scanning = True
+        self.scan_thread = threading.Thread(target=self._cold_start_thread_func, daemon=True)
+        self.scan_thread.start()
+        return False
+    
+    def _cold_start_thread_func(self) -> None:
+        """索引为空时先只扫描文件列表，尽快提供服务，之后再扫描一次补齐元数据"""
+        self._scan_thread_func(False)
+        while library_index.get_meta("include_metadata") != "1":
+            if self.start_scan(include_metadata=True):
+                return
+            # 其他扫描正在进行，等待结束后再补齐
+            time.sleep(1)
+    
+    def start_scheduled_scans(self) -> bool:
+        """
+        按各音乐库目录配置的间隔，重新扫描到期的目录（扫描进程定期调用）
+        
+        Returns:
+            是否启动了扫描
+        """
+        if self.is_scanning:
+            return False
+        due = get_due_libraries(get_music_libraries())
+        if not due:
+            return False
+        return self.start_scan(include_metadata=library_index.get_meta("include_metadata") == "1", library_dirs=due)
+    
+    def run_schedule(self, poll_interval: float = 30.0) -> None:
+        """在后台线程中定期检查到期的目录（单进程部署使用，多进程部署由扫描进程的主循环检查）"""
+        def loop():
+            while True:
+                time.sleep(poll_interval)
+                try:
+                    self.start_scheduled_scans()
+                except Exception as e:
+                    print(f"检查定期扫描时出错: {str(e)}")
+        
+        threading.Thread(target=loop, name="scan-schedule", daemon=True).start()
+    
+    def _scan_thread_func(self, include_metadata: bool, library_dirs: Optional[List[str]] = None) -> None:
         """扫描线程函数"""
+        self._publish_status()
         try:
-            # 强制刷新缓存，执行扫描
-            self.scan_result = scan_music_library(force_refresh=True, include_metadata=include_metadata)
+            if library_dirs is not None:
+                self.scan_result = rescan_libraries(library_dirs, include_metadata=include_metadata).files
+            else:
+                # 强制刷新缓存，执行扫描
+                self.scan_result = scan_music_library(force_refresh=True, include_metadata=include_metadata)
             self.last_scan_time = time.time()
             
             # 执行回调
@@ -64,6 +157,119 @@ class AsyncLibraryScanner:
             print(f"音乐库扫描出错: {str(e)}")
         finally:
             self.is_scanning = False
+            self._publish_status()
+    
+    def _publish_status(self) -> None:
+        """把扫描状态写入索引，供只读工作进程查询"""
+        try:
+            library_index.set_meta("scan_status", json.dumps({
+                "is_scanning": self.is_scanning,
+                "last_scan_time": self.last_scan_time,
+                "analysis": self.analysis_status,
+                "duplicates": self.duplicates_status
+            }))
+        except Exception as e:
+            print(f"写入扫描状态时出错: {str(e)}")
+    
+    def start_analysis(self) -> bool:
+        """
+        开始后台响度分析
+        
+        未变化的文件（签名一致）不会重复分析；已完成的结果分批写入索引，中断后可以继续
+        
+        Returns:
+            是否成功启动分析
+        """
+        if INDEX_MODE == "reader":
+            if self.get_status()["analysis"]["is_running"]:
+                return False
+            library_index.request_job("analysis")
+            return True
+        
+        if self.analysis_status["is_running"]:
+            return False
+        
+        self.analysis_status = {"is_running": True, "total": 0, "done": 0, "skipped": 0, "failed": 0}
+        self.analysis_thread = threading.Thread(target=self._analysis_thread_func, daemon=True)
+        self.analysis_thread.start()
+        return True
+    
+    def _analysis_thread_func(self) -> None:
+        """响度分析线程函数，解码和计算在进程池中并行执行"""
+        from src.utils.loudness import analyze_track
+        
+        status = self.analysis_status
+        self._publish_status()
+        try:
+            analyzed = library_index.get_analysis_signatures()
+            tasks = []
+            for file in scan_music_library(blocking=True):
+                signature = get_stat_signature(file["full_path"])
+                if signature is None:
+                    continue
+                if analyzed.get(file["id"]) == signature:
+                    status["skipped"] += 1
+                    continue
+                tasks.append((file["id"], file["full_path"], signature, REPLAYGAIN_TARGET_LUFS))
+            status["total"] = len(tasks)
+            
+            batch = []
+            with ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+                for result in executor.map(analyze_track, tasks, chunksize=4):
+                    if result["gain_db"] is None:
+                        status["failed"] += 1
+                    status["done"] += 1
+                    batch.append(result)
+                    
+                    # 分批写入，保证中断后已完成的结果不会丢失
+                    if len(batch) >= 50:
+                        library_index.save_analysis(batch)
+                        batch = []
+                        self._publish_status()
+            
+            if batch:
+                library_index.save_analysis(batch)
+        except Exception as e:
+            print(f"响度分析出错: {str(e)}")
+        finally:
+            status["is_running"] = False
+            self._publish_status()
+    
+    def start_duplicate_detection(self) -> bool:
+        """
+        开始后台重复曲目检测
+        
+        Returns:
+            是否成功启动检测
+        """
+        if INDEX_MODE == "reader":
+            if self.get_status()["duplicates"]["is_running"]:
+                return False
+            library_index.request_job("duplicates")
+            return True
+        
+        if self.duplicates_status["is_running"]:
+            return False
+        
+        self.duplicates_status = {"is_running": True, "candidates": 0, "done": 0, "groups": 0}
+        self.duplicates_thread = threading.Thread(target=self._duplicates_thread_func, daemon=True)
+        self.duplicates_thread.start()
+        return True
+    
+    def _duplicates_thread_func(self) -> None:
+        """重复曲目检测线程函数，分组需要标题和时长，因此使用包含元数据的扫描结果"""
+        from src.utils.duplicates import detect_duplicates
+        
+        status = self.duplicates_status
+        self._publish_status()
+        try:
+            music_files = scan_music_library(include_metadata=True, blocking=True)
+            detect_duplicates(music_files, ANALYSIS_WORKERS, status, get_stat_signature)
+        except Exception as e:
+            print(f"重复曲目检测出错: {str(e)}")
+        finally:
+            status["is_running"] = False
+            self._publish_status()
     
     def register_callback(self, callback: Callable) -> None:
         """
@@ -82,10 +288,24 @@ class AsyncLibraryScanner:
     
     def get_status(self) -> Dict[str, Any]:
         """获取扫描状态"""
+        if INDEX_MODE == "reader":
+            status = json.loads(library_index.get_meta("scan_status") or "{}")
+            return {
+                "is_scanning": status.get("is_scanning", False),
+                "last_scan_time": status.get("last_scan_time", 0),
+                "has_result": library_index.get_version() is not None,
+                "progress": get_scan_progress(),
+                "analysis": status.get("analysis", dict(self.analysis_status)),
+                "duplicates": status.get("duplicates", dict(self.duplicates_status))
+            }
+        
         return {
             "is_scanning": self.is_scanning,
             "last_scan_time": self.last_scan_time,
-            "has_result": self.scan_result is not None
+            "has_result": self.scan_result is not None,
+            "progress": get_scan_progress(),
+            "analysis": dict(self.analysis_status),
+            "duplicates": dict(self.duplicates_status)
         }
 
 
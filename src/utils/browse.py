@@ -0,0 +1,267 @@
+"""
+分类浏览（艺术家、专辑、流派、年份）
+
+每个曲目计入的分类保存在browse_tracks表，各分类的曲目数和总时长保存在browse_facets表。
+音乐库变化时只对变化的曲目减去旧的计数、加上新的计数，不需要重新统计整个音乐库。
+"""
+
+import threading
+import unicodedata
+from typing import List, Dict, Any, Optional, Tuple
+
+from src.utils.file_utils import register_change_listener
+from src.utils.library_index import library_index
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS browse_tracks (
+    track_id TEXT PRIMARY KEY,
+    artist TEXT,
+    album TEXT,
+    genre TEXT,
+    year TEXT,
+    duration REAL NOT NULL,
+    artist_key TEXT NOT NULL,
+    album_key TEXT,
+    genre_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_browse_tracks_artist ON browse_tracks(artist_key);
+CREATE INDEX IF NOT EXISTS idx_browse_tracks_album ON browse_tracks(album_key);
+CREATE INDEX IF NOT EXISTS idx_browse_tracks_genre ON browse_tracks(genre_key);
+CREATE INDEX IF NOT EXISTS idx_browse_tracks_year ON browse_tracks(year);
+CREATE TABLE IF NOT EXISTS browse_facets (
+    facet TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT,
+    artist TEXT,
+    track_count INTEGER NOT NULL,
+    total_duration REAL NOT NULL,
+    PRIMARY KEY (facet, key)
+);
+CREATE INDEX IF NOT EXISTS idx_browse_facets_count ON browse_facets(facet, track_count DESC);
+CREATE INDEX IF NOT EXISTS idx_browse_facets_artist ON browse_facets(facet, artist);
+"""
+
+# 支持的分类
+FACETS = ("artist", "album", "genre", "year")
+
+# 专辑键中艺术家与专辑名的分隔符
+_KEY_SEPARATOR = "\x1f"
+
+def facet_key(value: Optional[str]) -> str:
+    """分类键：兼容字符统一、忽略大小写和多余空白；未知值为空字符串"""
+    if not value:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", str(value)).casefold().split())
+
+def _year(value: Any) -> Optional[str]:
+    """从年份或日期字符串中取出四位年份"""
+    text = str(value or "").strip()[:4]
+    return text if len(text) == 4 and text.isdigit() else None
+
+def track_facets(file: Dict[str, Any]) -> Tuple:
+    """曲目计入的分类：(艺术家, 专辑, 流派, 年份, 时长)"""
+    metadata = file.get("metadata") or {}
+    return (
+        metadata.get("artist") or None,
+        metadata.get("album") or None,
+        metadata.get("genre") or None,
+        _year(metadata.get("year")),
+        float(metadata.get("duration") or 0)
+    )
+
+def _track_keys(row: Tuple) -> Tuple[str, str, str]:
+    """曲目的分类键：(艺术家键, 专辑键, 流派键)，没有专辑时专辑键与其他分类一样为空字符串"""
+    artist, album, genre = row[0], row[1], row[2]
+    artist_key = facet_key(artist)
+    album_key = artist_key + _KEY_SEPARATOR + facet_key(album) if album else ""
+    return artist_key, album_key, facet_key(genre)
+
+def _facet_entries(row: Tuple) -> List[Tuple[str, str, Optional[str], Optional[str]]]:
+    """一个曲目贡献的分类项：(分类, 键, 显示名称, 艺术家键)"""
+    artist, album, genre, year, _ = row
+    artist_key, album_key, genre_key = _track_keys(row)
+    return [
+        ("artist", artist_key, artist, None),
+        # 未知专辑不属于某个艺术家
+        ("album", album_key, album, artist_key if album_key else None),
+        ("genre", genre_key, genre, None),
+        ("year", year or "", year, None),
+    ]
+
+class BrowseIndex:
+    """分类浏览的聚合数据"""
+
+    def __init__(self):
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def _connect(self):
+        conn = library_index.connection()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._add_unknown_albums(conn)
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _add_unknown_albums(conn) -> None:
+        """旧版本的数据中没有专辑的曲目不计入专辑分类，补上未知专辑的计数"""
+        if conn.execute("SELECT 1 FROM browse_tracks WHERE album_key IS NULL LIMIT 1").fetchone() is None:
+            return
+        conn.execute("""
+            INSERT INTO browse_facets (facet, key, name, artist, track_count, total_duration)
+            SELECT 'album', '', NULL, NULL, COUNT(*), SUM(duration) FROM browse_tracks WHERE album_key IS NULL
+            ON CONFLICT(facet, key) DO UPDATE SET
+                track_count = track_count + excluded.track_count,
+                total_duration = total_duration + excluded.total_duration
+        """)
+        conn.execute("UPDATE browse_tracks SET album_key = '' WHERE album_key IS NULL")
+
+    def apply_library_changes(self, snapshot, added: List[str], removed: List[str], updated: List[str]) -> None:
+        """根据变化的曲目增量更新聚合数据"""
+        with self._update_lock:
+            conn = self._connect()
+
+            changed_ids = added + updated if snapshot.include_metadata else []
+            removed_ids = list(removed)
+            if len(added) == len(snapshot.files):
+                # 首次发布快照（如进程重启），清理离线期间已删除的曲目
+                rows = conn.execute("SELECT track_id FROM browse_tracks")
+                removed_ids.extend(row[0] for row in rows if row[0] not in snapshot.by_id)
+
+            old_rows = self._load_rows(conn, changed_ids + removed_ids)
+            deltas: Dict[Tuple[str, str], list] = {}
+            upserts, deletes = [], []
+
+            def add(row, sign):
+                for facet, key, name, artist_key in _facet_entries(row):
+                    delta = deltas.setdefault((facet, key), [name, artist_key, 0, 0.0])
+                    delta[2] += sign
+                    delta[3] += sign * row[4]
+                    if sign > 0 and name:
+                        delta[0] = name
+
+            for file_id in removed_ids:
+                old = old_rows.get(file_id)
+                if old is not None:
+                    add(old, -1)
+                    deletes.append((file_id,))
+
+            for file_id in changed_ids:
+                new = track_facets(snapshot.by_id[file_id])
+                old = old_rows.get(file_id)
+                if old == new:
+                    continue
+                if old is not None:
+                    add(old, -1)
+                add(new, 1)
+                upserts.append((file_id, *new, *_track_keys(new)))
+
+            if not deltas:
+                return
+
+            with conn:
+                conn.executemany("DELETE FROM browse_tracks WHERE track_id = ?", deletes)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO browse_tracks "
+                    "(track_id, artist, album, genre, year, duration, artist_key, album_key, genre_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    upserts
+                )
+                conn.executemany("""
+                    INSERT INTO browse_facets (facet, key, name, artist, track_count, total_duration)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(facet, key) DO UPDATE SET
+                        name = COALESCE(excluded.name, name),
+                        track_count = track_count + excluded.track_count,
+                        total_duration = total_duration + excluded.total_duration
+                """, [
+                    (facet, key, name, artist_key, count, duration)
+                    for (facet, key), (name, artist_key, count, duration) in deltas.items()
+                    if count or duration
+                ])
+                conn.execute("DELETE FROM browse_facets WHERE track_count <= 0")
+
+    @staticmethod
+    def _load_rows(conn, track_ids: List[str]) -> Dict[str, Tuple]:
+        rows = {}
+        for start in range(0, len(track_ids), 500):
+            batch = track_ids[start:start + 500]
+            cursor = conn.execute(
+                f"SELECT track_id, artist, album, genre, year, duration FROM browse_tracks "
+                f"WHERE track_id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for row in cursor:
+                rows[row[0]] = tuple(row[1:])
+        return rows
+
+    def list_facet(
+        self,
+        facet: str,
+        sort: str = "name",
+        limit: int = 500,
+        offset: int = 0,
+        artist: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        获取某个分类的所有项
+
+        Args:
+            facet: artist、album、genre或year
+            sort: name（按名称）、count（按曲目数）或duration（按总时长）
+            artist: 只返回该艺术家的专辑（仅album）
+        """
+        conditions = ["f.facet = ?"]
+        params: List[Any] = [facet]
+        if artist is not None and facet == "album":
+            conditions.append("f.artist = ?")
+            params.append(facet_key(artist))
+        where = " AND ".join(conditions)
+
+        order = {
+            "count": "f.track_count DESC, f.key",
+            "duration": "f.total_duration DESC, f.key"
+        }.get(sort, "f.key")
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM browse_facets f WHERE {where}", params).fetchone()[0]
+        # 专辑的艺术家名称在同一次查询中取出
+        rows = conn.execute(
+            f"SELECT f.key, f.name, f.track_count, f.total_duration, a.name FROM browse_facets f "
+            f"LEFT JOIN browse_facets a ON a.facet = 'artist' AND a.key = f.artist "
+            f"WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+
+        items = []
+        for key, name, count, duration, artist_name in rows:
+            item = {"key": key, "name": name, "track_count": count, "total_duration": round(duration, 2)}
+            if facet == "album":
+                item["artist"] = artist_name
+            items.append(item)
+        return {"items": items, "total": total}
+
+    def get_track_ids(self, facet: str, key: str, limit: int = -1, offset: int = 0) -> List[str]:
+        """获取某个分类项下的曲目ID"""
+        column = {"artist": "artist_key", "album": "album_key", "genre": "genre_key", "year": "year"}[facet]
+        if facet == "year" and key == "":
+            condition = "year IS NULL"
+            params: List[Any] = []
+        else:
+            condition = f"{column} = ?"
+            params = [key]
+        rows = self._connect().execute(
+            f"SELECT track_id FROM browse_tracks WHERE {condition} ORDER BY track_id LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return [row[0] for row in rows]
+
+
+# 创建全局实例，并在音乐库变化时增量更新
+browse_index = BrowseIndex()
+register_change_listener(browse_index.apply_library_changes)
@@ -0,0 +1,221 @@
+"""
+响应压缩中间件
+
+对较大的JSON/文本响应进行gzip或brotli压缩（brotli需要安装可选依赖brotli），
+并缓存带ETag响应的压缩结果，避免对同一份音乐库快照重复压缩。
+"""
+
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 可压缩的内容类型前缀
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/",
+)
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """根据Accept-Encoding选择压缩算法，优先使用brotli"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        # 忽略 q=0 的编码
+        if any(p.strip() in ("q=0", "q=0.0", "q=0.00", "q=0.000") for p in parts[1:]):
+            continue
+        accepted.add(name)
+
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress_body(body: bytes, encoding: str, high_quality: bool = False) -> bytes:
+    """
+    一次性压缩完整响应体
+
+    Args:
+        body: 原始内容
+        encoding: br 或 gzip
+        high_quality: 结果会被缓存时使用更高的压缩级别
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=9 if high_quality else 5)
+    compressor = zlib.compressobj(9 if high_quality else 6, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+class _StreamCompressor:
+    """流式压缩器，每个数据块都会刷新，保证NDJSON等流式内容能及时送达"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+class CompressionMiddleware:
+    """
+    压缩中间件
+
+    - 只压缩JSON和文本类型，且响应体不小于minimum_size
+    - 跳过excluded_prefixes下的路径（如已经压缩过的音频文件）
+    - 带ETag的完整响应会缓存压缩结果
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        excluded_prefixes: Sequence[str] = ("/library/",),
+        cache_size: int = 16
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.excluded_prefixes = tuple(excluded_prefixes)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def get_cached(self, etag: str, encoding: str) -> Optional[bytes]:
+        """读取压缩缓存"""
+        with self._cache_lock:
+            key = (etag, encoding)
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+    def put_cached(self, etag: str, encoding: str, body: bytes) -> None:
+        """写入压缩缓存，超出容量时淘汰最久未使用的项"""
+        with self._cache_lock:
+            self._cache[(etag, encoding)] = body
+            self._cache.move_to_end((etag, encoding))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+class _CompressionResponder:
+    """处理单个请求的响应消息"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Optional[Message] = None
+        self.started = False
+        self.passthrough = False
+        self.stream: Optional[_StreamCompressor] = None
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # 延迟发送响应头，等第一个数据块到达后再决定是否压缩
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                message["status"] in (204, 304)
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            return
+
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.stream is not None:
+            # 流式响应的后续数据块
+            data = self.stream.compress(body)
+            if not more_body:
+                data += self.stream.finish()
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        if more_body:
+            # 流式响应：边生成边压缩
+            self.stream = _StreamCompressor(self.encoding)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            self._set_encoding_headers(headers)
+            del headers["content-length"]
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": self.stream.compress(body), "more_body": True})
+            return
+
+        # 完整响应
+        if len(body) < self.middleware.minimum_size:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        etag = headers.get("etag")
+        compressed = self.middleware.get_cached(etag, self.encoding) if etag else None
+        if compressed is None:
+            compressed = compress_body(body, self.encoding, high_quality=etag is not None)
+            if etag:
+                self.middleware.put_cached(etag, self.encoding, compressed)
+
+        self._set_encoding_headers(headers)
+        headers["content-length"] = str(len(compressed))
+        await self._flush_start()
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        """设置压缩相关响应头"""
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # 压缩后的表示与原始表示不同，强ETag降级为弱ETag
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = "W/" + etag
+
+    async def _flush_start(self) -> None:
+        if not self.started and self.start_message is not None:
+            self.started = True
+            await self._send(self.start_message)
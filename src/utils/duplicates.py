@@ -0,0 +1,373 @@
+"""
+重复曲目检测
+
+先用廉价的信息分组候选（完全相同的文件大小，或标题、艺术家相同且时长相近），
+再在进程池中计算音频负载的内容哈希（跳过ID3/FLAC等标签区）和色度指纹加以确认：
+内容哈希相同的是同一文件的副本，指纹相似的是同一首歌的不同编码版本。
+"""
+
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable
+
+from src.utils.library_index import library_index
+
+# 标题和艺术家相同时，时长相差不超过该值（秒）才视为候选
+DURATION_TOLERANCE = 2.0
+
+# 色度指纹的平均相似度不低于该值时视为同一首歌
+SIMILARITY_THRESHOLD = 0.9
+
+# 指纹只取开头的这段音频（秒），每秒4帧
+FINGERPRINT_SECONDS = 120
+_FRAMES_PER_SECOND = 4
+_FFT_SIZE = 4096
+
+# 选择保留版本时优先的无损格式
+LOSSLESS_FORMATS = {".flac", ".wav", ".ape", ".wv", ".aiff"}
+
+_groups_cache: tuple = (None, [])
+
+def _normalize(text: Optional[str]) -> str:
+    """标题/艺术家归一化：兼容字符统一、忽略大小写和首尾空白"""
+    if not text:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+def _byte_size(signature: str) -> int:
+    return int(signature.split(":", 1)[0])
+
+def find_candidate_groups(files: List[Dict[str, Any]], signatures: Dict[str, str]) -> List[List[str]]:
+    """
+    按文件大小、标题/艺术家/时长分组候选重复曲目
+
+    Args:
+        files: 音乐文件列表
+        signatures: 曲目ID -> 文件签名（大小:修改时间）
+
+    Returns:
+        候选分组（每组至少两个曲目ID）
+    """
+    parent = {file["id"]: file["id"] for file in files if file["id"] in signatures}
+
+    def find(file_id):
+        while parent[file_id] != file_id:
+            parent[file_id] = parent[parent[file_id]]
+            file_id = parent[file_id]
+        return file_id
+
+    def union(ids):
+        root = find(ids[0])
+        for file_id in ids[1:]:
+            parent[find(file_id)] = root
+
+    by_size: Dict[int, List[str]] = {}
+    by_tags: Dict[tuple, List[tuple]] = {}
+    for file in files:
+        file_id = file["id"]
+        if file_id not in parent:
+            continue
+        by_size.setdefault(_byte_size(signatures[file_id]), []).append(file_id)
+
+        title = _normalize(file.get("title") or os.path.splitext(file["name"])[0])
+        duration = file.get("duration")
+        if title and duration:
+            by_tags.setdefault((title, _normalize(file.get("artist"))), []).append((duration, file_id))
+
+    for ids in by_size.values():
+        if len(ids) > 1:
+            union(ids)
+
+    # 同一标题和艺术家下，按时长排序后把相邻且相差不大的连成一组
+    for items in by_tags.values():
+        items.sort()
+        for (prev_duration, prev_id), (duration, file_id) in zip(items, items[1:]):
+            if duration - prev_duration <= DURATION_TOLERANCE:
+                union([prev_id, file_id])
+
+    groups: Dict[str, List[str]] = {}
+    for file_id in parent:
+        groups.setdefault(find(file_id), []).append(file_id)
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+def _audio_payload_range(f, file_size: int) -> tuple:
+    """返回音频负载在文件中的起止位置，跳过ID3v2/ID3v1标签和FLAC元数据块"""
+    start, end = 0, file_size
+    header = f.read(10)
+
+    if header[:3] == b"ID3" and len(header) == 10:
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = 10 + size + (10 if header[5] & 0x10 else 0)
+    elif header[:4] == b"fLaC":
+        position = 4
+        while True:
+            f.seek(position)
+            block_header = f.read(4)
+            if len(block_header) < 4:
+                break
+            position += 4 + int.from_bytes(block_header[1:4], "big")
+            if block_header[0] & 0x80:
+                break
+        start = position
+
+    if file_size - 128 > start:
+        f.seek(file_size - 128)
+        if f.read(3) == b"TAG":
+            end = file_size - 128
+
+    return start, max(start, end)
+
+def audio_payload_hash(file_path: str) -> str:
+    """计算音频负载的SHA-1，只修改了标签的副本会得到相同的哈希"""
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        start, end = _audio_payload_range(f, os.fstat(f.fileno()).st_size)
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def chroma_fingerprint(file_path: str) -> Optional[bytes]:
+    """
+    计算色度指纹：每帧把55Hz~5kHz的频谱能量折叠到12个音级并归一化
+
+    Returns:
+        形状为 (帧数, 12) 的uint8数组的字节串；无法解码时返回None
+    """
+    import numpy as np
+    import soundfile as sf
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    try:
+        info = sf.info(file_path)
+        data, sample_rate = sf.read(
+            file_path,
+            frames=info.samplerate * FINGERPRINT_SECONDS,
+            dtype="float32",
+            always_2d=True
+        )
+    except Exception:
+        return None
+
+    mono = data.mean(axis=1)
+    if len(mono) < _FFT_SIZE:
+        return None
+
+    # 跳过开头的静音，不同编码器添加的前导静音长度不同
+    loud = np.flatnonzero(np.abs(mono) > 0.01)
+    if loud.size == 0:
+        return None
+    mono = mono[loud[0]:]
+    if len(mono) < _FFT_SIZE:
+        return None
+
+    hop = max(1, sample_rate // _FRAMES_PER_SECOND)
+    frames = sliding_window_view(mono, _FFT_SIZE)[::hop] * np.hanning(_FFT_SIZE).astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(frames, axis=-1)) ** 2
+
+    freqs = np.fft.rfftfreq(_FFT_SIZE, 1.0 / sample_rate)
+    valid = (freqs >= 55) & (freqs <= 5000)
+    pitch_class = np.round(12 * np.log2(freqs[valid] / 440.0)).astype(np.int64) % 12
+    mapping = np.zeros((valid.sum(), 12), dtype=np.float32)
+    mapping[np.arange(valid.sum()), pitch_class] = 1.0
+
+    chroma = spectrum[:, valid] @ mapping
+    peak = chroma.max(axis=1, keepdims=True)
+    chroma = np.divide(chroma, peak, out=np.zeros_like(chroma), where=peak > 0)
+    return np.round(chroma * 255).astype(np.uint8).tobytes()
+
+def fingerprint_similarity(a: bytes, b: bytes, max_offset: int = 2) -> float:
+    """比较两个色度指纹，允许少量帧的错位，返回0~1的平均余弦相似度"""
+    import numpy as np
+
+    x = np.frombuffer(a, dtype=np.uint8).reshape(-1, 12).astype(np.float32)
+    y = np.frombuffer(b, dtype=np.uint8).reshape(-1, 12).astype(np.float32)
+    best = 0.0
+    for offset in range(-max_offset, max_offset + 1):
+        xs = x[max(offset, 0):]
+        ys = y[max(-offset, 0):]
+        length = min(len(xs), len(ys))
+        if length == 0:
+            continue
+        xs, ys = xs[:length], ys[:length]
+        norms = np.linalg.norm(xs, axis=1) * np.linalg.norm(ys, axis=1)
+        active = norms > 0
+        if not active.any():
+            continue
+        cosine = (xs * ys).sum(axis=1)[active] / norms[active]
+        best = max(best, float(cosine.mean()))
+    return best
+
+def fingerprint_track(task: tuple) -> Dict[str, Any]:
+    """
+    进程池任务：计算单个曲目的内容哈希和色度指纹
+
+    Args:
+        task: (曲目ID, 文件路径, 文件签名)
+    """
+    file_id, file_path, signature = task
+    try:
+        payload_hash = audio_payload_hash(file_path)
+    except OSError as e:
+        print(f"计算内容哈希时出错: {file_path}, 错误: {str(e)}")
+        payload_hash = None
+    return {
+        "id": file_id,
+        "signature": signature,
+        "payload_hash": payload_hash,
+        "fingerprint": chroma_fingerprint(file_path)
+    }
+
+def confirm_group(ids: List[str], fingerprints: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    在一个候选分组内确认重复
+
+    Returns:
+        确认的重复组列表，每组为 {"kind": "exact"|"similar", "ids": [...]}
+    """
+    # 内容哈希相同的合并为一个簇
+    clusters: List[List[str]] = []
+    by_hash: Dict[str, List[str]] = {}
+    for file_id in ids:
+        payload_hash = fingerprints.get(file_id, {}).get("payload_hash")
+        if payload_hash is None:
+            clusters.append([file_id])
+        else:
+            by_hash.setdefault(payload_hash, []).append(file_id)
+    clusters.extend(by_hash.values())
+
+    # 再用色度指纹把不同编码的簇合并
+    merged: List[List[List[str]]] = []
+    for cluster in clusters:
+        fingerprint = fingerprints.get(cluster[0], {}).get("fingerprint")
+        for group in merged:
+            leader = fingerprints.get(group[0][0], {}).get("fingerprint")
+            if fingerprint and leader and fingerprint_similarity(fingerprint, leader) >= SIMILARITY_THRESHOLD:
+                group.append(cluster)
+                break
+        else:
+            merged.append([cluster])
+
+    result = []
+    for group in merged:
+        members = [file_id for cluster in group for file_id in cluster]
+        if len(members) > 1:
+            result.append({"kind": "exact" if len(group) == 1 else "similar", "ids": members})
+    return result
+
+def choose_primary(files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """选择保留的版本：优先无损格式，其次文件较大、添加较早的"""
+    return min(files, key=lambda file: (
+        os.path.splitext(file["name"])[1].lower() not in LOSSLESS_FORMATS,
+        -file["size"],
+        file["add_time"]
+    ))
+
+def detect_duplicates(
+    music_files: List[Dict[str, Any]],
+    max_workers: int,
+    status: Dict[str, Any],
+    get_signature
+) -> List[Dict[str, Any]]:
+    """
+    检测重复曲目并把结果写入索引
+
+    Args:
+        music_files: 音乐文件列表（最好包含元数据）
+        max_workers: 进程池大小
+        status: 进度字典，会被更新candidates、done、groups字段
+        get_signature: 根据文件路径返回签名的函数
+
+    Returns:
+        重复组列表，每组为 {"kind", "primary", "ids"}
+    """
+    files_by_id = {file["id"]: file for file in music_files}
+    signatures = {}
+    for file in music_files:
+        signature = get_signature(file["full_path"])
+        if signature is not None:
+            signatures[file["id"]] = signature
+
+    candidates = find_candidate_groups(music_files, signatures)
+    candidate_ids = [file_id for ids in candidates for file_id in ids]
+    status["candidates"] = len(candidate_ids)
+
+    # 只为签名变化的候选重新计算指纹
+    fingerprints = library_index.get_fingerprints(candidate_ids)
+    tasks = [
+        (file_id, files_by_id[file_id]["full_path"], signatures[file_id])
+        for file_id in candidate_ids
+        if fingerprints.get(file_id, {}).get("signature") != signatures[file_id]
+    ]
+    status["done"] = len(candidate_ids) - len(tasks)
+
+    if tasks:
+        batch = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for result in executor.map(fingerprint_track, tasks, chunksize=2):
+                fingerprints[result["id"]] = result
+                batch.append(result)
+                status["done"] += 1
+                if len(batch) >= 50:
+                    library_index.save_fingerprints(batch)
+                    batch = []
+        if batch:
+            library_index.save_fingerprints(batch)
+
+    groups = []
+    for ids in candidates:
+        for group in confirm_group(ids, fingerprints):
+            primary = choose_primary([files_by_id[file_id] for file_id in group["ids"]])
+            groups.append(dict(group, primary=primary["id"]))
+    status["groups"] = len(groups)
+
+    library_index.set_meta("duplicates", json.dumps({"detected_at": time.time(), "groups": groups}))
+    return groups
+
+def get_duplicate_groups() -> Dict[str, Any]:
+    """读取最近一次检测的结果：{"detected_at", "groups"}"""
+    global _groups_cache
+
+    raw = library_index.get_meta("duplicates")
+    if raw is None:
+        return {"detected_at": None, "groups": []}
+    if _groups_cache[0] != raw:
+        _groups_cache = (raw, json.loads(raw))
+    return _groups_cache[1]
+
+def collapse_duplicates(files: Iterable[Dict[str, Any]], groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    折叠重复曲目：每组只保留一个版本，并在其duplicates字段中列出其余版本的ID
+
+    保留的版本已不在列表中时，改用组内第一个仍存在的曲目
+    """
+    files = list(files)
+    present = {file["id"] for file in files}
+    keep: Dict[str, List[str]] = {}
+    hidden = set()
+    for group in groups:
+        members = [file_id for file_id in group["ids"] if file_id in present]
+        if len(members) < 2:
+            continue
+        primary = group["primary"] if group["primary"] in present else members[0]
+        others = [file_id for file_id in members if file_id != primary]
+        keep[primary] = others
+        hidden.update(others)
+
+    result = []
+    for file in files:
+        if file["id"] in hidden:
+            continue
+        if file["id"] in keep:
+            file = dict(file, duplicates=keep[file["id"]])
+        result.append(file)
+    return result
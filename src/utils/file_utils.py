@@ -1,156 +1,930 @@
 import os
+import json
 import urllib.parse
 import hashlib
 import time
+import zlib
 import threading
-from typing import List, Dict, Any, Optional
-from src.config.settings import SUPPORTED_FORMATS
+import queue
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable, Iterator
+from src.config.settings import SUPPORTED_FORMATS, INDEX_MODE, LYRICS_SIDECAR_EXT
 from src.config.settings_manager import get_music_libraries
 from src.utils.metadata_utils import extract_metadata
+from src.utils.library_index import library_index
+from src.utils.track_ids import track_ids
+from src.utils.scan_scheduler import RootThrottle, run_scheduled, map_throttled, mark_scanned
 
-# 音乐库扫描结果缓存
-_music_files_cache: Optional[List[Dict[str, Any]]] = None
-_cache_timestamp: float = 0
-_cache_library_dirs: List[str] = []
+class LibrarySnapshot:
+    """
+    音乐库快照
+    
+    每次扫描都在旁边构建一个新的快照，完成后整体替换全局引用。
+    快照创建后不再修改，读取方无需加锁；其中的列表和字典不应被调用方修改。
+    """
+    
+    __slots__ = (
+        "files", "by_id", "version", "include_metadata", "library_dirs", "dir_mtimes",
+        "timestamp", "source", "validated_at"
+    )
+    
+    def __init__(
+        self,
+        files: List[Dict[str, Any]],
+        version: int,
+        include_metadata: bool,
+        library_dirs: List[str],
+        dir_mtimes: Dict[str, float],
+        source: str = "scan",
+        validated_at: Optional[float] = None
+    ):
+        self.files = files
+        self.by_id = {file["id"]: file for file in files}
+        self.version = version
+        self.include_metadata = include_metadata
+        self.library_dirs = list(library_dirs)
+        self.dir_mtimes = dir_mtimes
+        self.timestamp = time.time()
+        # 来源：scan（本进程扫描）或index（从索引加载）；validated_at为内容最近一次与磁盘核对的时间
+        self.source = source
+        self.validated_at = validated_at if validated_at is not None else self.timestamp
+
+# 当前音乐库快照，扫描完成后整体替换
+_snapshot: Optional[LibrarySnapshot] = None
+_snapshot_expired = False  # 被clear_cache标记为过期，下次访问时重新扫描
 _CACHE_VALID_TIME = 300  # 缓存有效期（秒）增加到5分钟
-_last_dir_mtimes: Dict[str, float] = {}  # 记录目录的最后修改时间
-_cache_lock = threading.Lock()  # 添加线程锁避免并发问题
+_cache_lock = threading.Lock()  # 串行化扫描过程，读取快照不需要持有
+_refresh_thread: Optional[threading.Thread] = None  # 快照过期后在后台重新扫描的线程
+_refresh_lock = threading.Lock()
+
+# 音乐库版本与变更记录
+# 版本号以启动时的毫秒时间戳为起点单调递增，进程重启后也不会回退
+_library_version: int = int(time.time() * 1000)
+_CHANGE_LOG_SIZE = 200  # 保留的变更记录条数
+_change_log = deque(maxlen=_CHANGE_LOG_SIZE)  # 每项为 {"version", "added", "removed", "updated"}
+_change_log_lock = threading.Lock()
+
+# 音乐库变化的监听函数，参数为 (新快照, 新增ID, 删除ID, 更新ID)
+_change_listeners: List[Callable] = []
+
+# 扫描进度：phase为idle、walking（遍历目录）或reading（读取文件信息）
+_scan_progress: Dict[str, Any] = {"phase": "idle", "found": 0, "processed": 0, "total": 0, "started_at": None, "finished_at": None}
+_PROGRESS_PUBLISH_INTERVAL = 1.0  # 写入索引供只读工作进程查询的最小间隔（秒）
+_progress_published_at = 0.0
+
+# 扫描时每批输出的文件数
+SCAN_BATCH_SIZE = 200
+
+class ScanFeed:
+    """
+    进行中的扫描的数据流
+    
+    扫描线程每读取一批文件就追加进来，流式接口按位置读取新增的部分，
+    因此界面不必等待整个扫描完成就能显示曲目。扫描结束后记录发布的版本号。
+    """
+    
+    def __init__(self, include_metadata: bool):
+        self.include_metadata = include_metadata
+        self.files: List[Dict[str, Any]] = []
+        self.done = False
+        self.version: Optional[int] = None
+        self._condition = threading.Condition()
+    
+    def extend(self, batch: List[Dict[str, Any]]) -> None:
+        with self._condition:
+            self.files.extend(batch)
+            self._condition.notify_all()
+    
+    def finish(self, version: Optional[int] = None) -> None:
+        with self._condition:
+            self.done = True
+            self.version = version
+            self._condition.notify_all()
+    
+    def wait(self, seen: int, timeout: float = 1.0) -> tuple:
+        """
+        等待出现第seen个之后的文件或扫描结束
+        
+        Returns:
+            (新增的文件列表, 是否已结束)
+        """
+        with self._condition:
+            if len(self.files) <= seen and not self.done:
+                self._condition.wait(timeout)
+            return self.files[seen:], self.done
+
+# 当前或最近一次扫描的数据流
+_scan_feed: Optional[ScanFeed] = None
 
-def scan_music_library(force_refresh: bool = False, include_metadata: bool = False) -> List[Dict[str, Any]]:
+def scan_music_library(force_refresh: bool = False, include_metadata: bool = False, blocking: bool = False) -> List[Dict[str, Any]]:
     """
     扫描所有配置的音乐库目录，获取音乐文件信息
     
     Args:
         force_refresh: 是否强制刷新缓存
         include_metadata: 是否包含音乐元数据
+        blocking: 快照过期或缺少元数据时是否在当前线程扫描并等待结果（见get_library_snapshot）
+    """
+    return get_library_snapshot(force_refresh=force_refresh, include_metadata=include_metadata, blocking=blocking).files
+
+def get_library_snapshot(force_refresh: bool = False, include_metadata: bool = False, blocking: bool = False) -> LibrarySnapshot:
     """
-    global _music_files_cache, _cache_timestamp, _cache_library_dirs, _last_dir_mtimes
+    获取当前音乐库快照，必要时重新扫描
+    
+    已有快照但已过期时，直接返回当前快照，并在后台线程中重新扫描。
+    还没有快照、快照缺少请求的元数据、强制刷新或blocking为True（后台任务需要最新结果）时
+    在当前线程扫描并等待，不会把不含元数据的快照当作含元数据的结果返回；
+    在异步路由中调用时应放到线程池中执行。
+    """
+    # 只读工作进程不扫描，直接读取扫描进程维护的索引
+    if INDEX_MODE == "reader":
+        return _load_from_index(force_refresh=force_refresh, include_metadata=include_metadata)
+    
+    snapshot = _snapshot
+    if not force_refresh and _snapshot_is_fresh(snapshot, include_metadata):
+        return snapshot
+    
+    if snapshot is not None and not force_refresh and not blocking and (snapshot.include_metadata or not include_metadata):
+        _refresh_in_background(include_metadata)
+        return snapshot
     
-    # 使用线程锁确保并发安全
     with _cache_lock:
-        # 获取最新的音乐库目录
-        current_library_dirs = get_music_libraries()
-        library_dirs_changed = set(current_library_dirs) != set(_cache_library_dirs)
-        
-        # 检查目录是否有变化
-        dirs_modified = False
-        if not force_refresh and _music_files_cache is not None:
-            for lib_dir in current_library_dirs:
-                if os.path.exists(lib_dir) and os.path.isdir(lib_dir):
-                    try:
-                        current_mtime = os.path.getmtime(lib_dir)
-                        if lib_dir in _last_dir_mtimes and current_mtime > _last_dir_mtimes[lib_dir]:
-                            dirs_modified = True
-                            break
-                    except (OSError, IOError):
-                        # 如果无法获取修改时间，假设已修改
-                        dirs_modified = True
-                        break
-        
-        # 检查缓存是否有效
-        current_time = time.time()
-        cache_expired = current_time - _cache_timestamp > _CACHE_VALID_TIME
-        
-        if not force_refresh and _music_files_cache is not None and \
-           not cache_expired and not library_dirs_changed and not dirs_modified:
-            return _music_files_cache
+        # 等待锁期间可能已经有其他线程完成了扫描
+        snapshot = _snapshot
+        if not force_refresh and _snapshot_is_fresh(snapshot, include_metadata):
+            return snapshot
         
-        music_files = []
-        file_paths = set()  # 用于去重
+        # 已有快照包含元数据时，重新扫描也保留元数据
+        if snapshot is not None and snapshot.include_metadata:
+            include_metadata = True
+        
+        return _scan_and_publish(snapshot, get_music_libraries(), None, include_metadata)
+
+def _refresh_in_background(include_metadata: bool) -> None:
+    """在后台线程中重新扫描，已有刷新线程或扫描正在进行时不重复启动"""
+    global _refresh_thread
+    
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(
+            target=_background_refresh, args=(include_metadata,), name="library-refresh", daemon=True
+        )
+        _refresh_thread.start()
+
+def _background_refresh(include_metadata: bool) -> None:
+    """后台刷新线程：其他线程正在扫描时直接退出，扫描完成后的快照已是最新"""
+    if not _cache_lock.acquire(blocking=False):
+        return
+    try:
+        snapshot = _snapshot
+        if _snapshot_is_fresh(snapshot, include_metadata):
+            return
+        if snapshot is not None and snapshot.include_metadata:
+            include_metadata = True
+        _scan_and_publish(snapshot, get_music_libraries(), None, include_metadata)
+    except Exception as e:
+        print(f"后台刷新音乐库时出错: {str(e)}")
+    finally:
+        _cache_lock.release()
+
+def rescan_libraries(scan_dirs: List[str], include_metadata: bool = False) -> LibrarySnapshot:
+    """
+    只重新扫描指定的音乐库目录（定期扫描使用），其他目录沿用当前快照中的文件
+    
+    还没有快照或音乐库目录有变化时扫描全部目录。
+    """
+    with _cache_lock:
+        snapshot = _snapshot
+        if snapshot is not None and snapshot.include_metadata:
+            include_metadata = True
         
-        # 更新目录修改时间记录
-        new_dir_mtimes = {}
+        library_dirs = get_music_libraries()
+        targets = [library_dir for library_dir in library_dirs if library_dir in set(scan_dirs)]
+        if snapshot is None or set(library_dirs) != set(snapshot.library_dirs) or len(targets) == len(library_dirs):
+            targets = None
+        return _scan_and_publish(snapshot, library_dirs, targets, include_metadata)
+
+def _scan_and_publish(
+    snapshot: Optional[LibrarySnapshot],
+    library_dirs: List[str],
+    targets: Optional[List[str]],
+    include_metadata: bool
+) -> LibrarySnapshot:
+    """扫描全部目录（targets为None）或部分目录，与其余目录的现有文件合并后发布（调用方需持有_cache_lock）"""
+    previous = snapshot.by_id if snapshot is not None else None
+    feed = _start_scan_feed(include_metadata)
+    published = None
+    try:
+        music_files, dir_mtimes = _walk_music_libraries(targets or library_dirs, include_metadata, previous, feed, scope=targets)
+        if targets is not None:
+            prefixes = tuple(os.path.join(library_dir, "") for library_dir in targets)
+            music_files.extend(file for file in snapshot.files if not file["full_path"].startswith(prefixes))
+            music_files.sort(key=lambda x: x["add_time"], reverse=True)
+            dir_mtimes = {**snapshot.dir_mtimes, **dir_mtimes}
+        published = _publish_snapshot(music_files, library_dirs, dir_mtimes, include_metadata)
+        mark_scanned(targets or library_dirs)
+        return published
+    finally:
+        feed.finish(published.version if published is not None else None)
+
+def add_music_files(file_paths: List[str]) -> Dict[str, str]:
+    """
+    把新放入音乐库目录的文件加入当前快照（上传使用），不遍历目录
+    
+    文件总是提取元数据；快照中已有同一路径时替换原来的记录。音乐库目录的修改时间随之更新，
+    因此放入文件本身不会触发完整扫描。还没有快照时先完整扫描一次。
+    
+    Returns:
+        文件路径 -> 曲目ID（不在任何音乐库目录中或无法读取的文件不包含在内）
+    """
+    with _cache_lock:
+        snapshot = _snapshot
+        library_dirs = get_music_libraries()
+        if snapshot is None or set(library_dirs) != set(snapshot.library_dirs):
+            snapshot = _scan_and_publish(snapshot, library_dirs, None, True)
+            return {path: file["id"] for file in snapshot.files for path in file_paths if file["full_path"] == path}
         
-        # 扫描外部音乐库目录
-        for library_dir in current_library_dirs:
-            if not os.path.exists(library_dir) or not os.path.isdir(library_dir):
+        entries = []
+        for file_path in dict.fromkeys(file_paths):
+            library_dir = next(
+                (library_dir for library_dir in library_dirs if file_path.startswith(os.path.join(library_dir, ""))),
+                None
+            )
+            if library_dir is None or not any(file_path.lower().endswith(fmt) for fmt in SUPPORTED_FORMATS):
+                print(f"文件不在音乐库目录中: {file_path}")
                 continue
-                
+            directory, file = os.path.split(file_path)
             try:
-                # 记录目录修改时间
-                new_dir_mtimes[library_dir] = os.path.getmtime(library_dir)
+                sidecars = {
+                    os.path.splitext(name)[0].lower(): name for name in os.listdir(directory)
+                    if name.lower().endswith(LYRICS_SIDECAR_EXT)
+                }
+                entries.append((file_path, library_dir, file, os.stat(file_path), _sidecar_lyrics(directory, sidecars, file)))
+            except (OSError, IOError) as e:
+                print(f"处理文件时出错: {file_path}, 错误: {str(e)}")
+        if not entries:
+            return {}
+        
+        # scope为空：只登记这些文件，不把其他登记视为消失
+        file_ids = track_ids.assign([(entry[0], entry[3]) for entry in entries], scope=[])
+        added = [
+            _build_music_file(entry, file_id, True, snapshot.by_id)
+            for entry, file_id in zip(entries, file_ids)
+        ]
+        
+        paths = {file["full_path"] for file in added}
+        music_files = added + [file for file in snapshot.files if file["full_path"] not in paths]
+        music_files.sort(key=lambda x: x["add_time"], reverse=True)
+        dir_mtimes = dict(snapshot.dir_mtimes)
+        for library_dir in {entry[1] for entry in entries}:
+            try:
+                dir_mtimes[library_dir] = os.path.getmtime(library_dir)
+            except OSError:
+                pass
+        _publish_snapshot(music_files, snapshot.library_dirs, dir_mtimes, snapshot.include_metadata)
+        return {file["full_path"]: file["id"] for file in added}
+
+def _snapshot_is_fresh(snapshot: Optional[LibrarySnapshot], include_metadata: bool) -> bool:
+    """检查快照是否仍然有效"""
+    if snapshot is None or _snapshot_expired:
+        return False
+    
+    if include_metadata and not snapshot.include_metadata:
+        return False
+    
+    if time.time() - snapshot.timestamp > _CACHE_VALID_TIME:
+        return False
+    
+    # 获取最新的音乐库目录
+    current_library_dirs = get_music_libraries()
+    if set(current_library_dirs) != set(snapshot.library_dirs):
+        return False
+    
+    # 检查目录是否有变化
+    for lib_dir in current_library_dirs:
+        if os.path.exists(lib_dir) and os.path.isdir(lib_dir):
+            try:
+                current_mtime = os.path.getmtime(lib_dir)
+                if lib_dir in snapshot.dir_mtimes and current_mtime > snapshot.dir_mtimes[lib_dir]:
+                    return False
+            except (OSError, IOError):
+                # 如果无法获取修改时间，假设已修改
+                return False
+    
+    return True
+
+def _update_scan_progress(force: bool = False, **values) -> None:
+    """更新扫描进度，并按一定间隔写入索引"""
+    global _progress_published_at
+    
+    _scan_progress.update(values)
+    now = time.time()
+    if not force and now - _progress_published_at < _PROGRESS_PUBLISH_INTERVAL:
+        return
+    _progress_published_at = now
+    try:
+        library_index.set_meta("scan_progress", json.dumps(_scan_progress))
+    except Exception as e:
+        print(f"写入扫描进度时出错: {str(e)}")
+
+def get_scan_progress() -> Dict[str, Any]:
+    """获取扫描进度（只读工作进程读取扫描进程写入索引的进度）"""
+    if INDEX_MODE == "reader":
+        try:
+            return json.loads(library_index.get_meta("scan_progress") or "null") or dict(_scan_progress)
+        except Exception as e:
+            print(f"读取扫描进度时出错: {str(e)}")
+    return dict(_scan_progress)
+
+def _walk_music_libraries(
+    library_dirs: List[str],
+    include_metadata: bool,
+    previous: Optional[Dict[str, Dict[str, Any]]] = None,
+    feed: Optional[ScanFeed] = None,
+    scope: Optional[List[str]] = None
+) -> tuple:
+    """
+    遍历音乐库目录，获取音乐文件信息
+    
+    Args:
+        previous: 上一个快照的 ID -> 音乐文件，修改时间和大小未变的文件沿用其中的元数据
+        feed: 扫描数据流，每读取一批文件就追加进去
+        scope: 只扫描部分目录时传入这些目录
+    
+    Returns:
+        (按添加时间倒序的音乐文件列表, 各音乐库目录的修改时间)
+    """
+    _update_scan_progress(force=True, phase="walking", found=0, processed=0, total=0, started_at=time.time())
+    try:
+        music_files = []
+        dir_mtimes: Dict[str, float] = {}
+        for batch in iter_music_file_batches(library_dirs, include_metadata, previous, dir_mtimes, scope=scope):
+            music_files.extend(batch)
+            if feed is not None:
+                feed.extend(batch)
+        
+        # 同一路径只保留最后生成的一条（ID在扫描期间发生变化时会重复生成），并按添加时间排序
+        by_path = {file["full_path"]: file for file in music_files}
+        if len(by_path) < len(music_files):
+            music_files = list(by_path.values())
+        music_files.sort(key=lambda x: x["add_time"], reverse=True)
+        return music_files, dir_mtimes
+    finally:
+        _update_scan_progress(force=True, phase="idle", finished_at=time.time())
+
+def _start_scan_feed(include_metadata: bool) -> ScanFeed:
+    """为新开始的扫描创建数据流"""
+    global _scan_feed
+    
+    _scan_feed = ScanFeed(include_metadata)
+    return _scan_feed
+
+def get_scan_feed() -> Optional[ScanFeed]:
+    """获取进行中或最近一次扫描的数据流（只在扫描进程中可用）"""
+    return _scan_feed
+
+def peek_library_snapshot() -> Optional[LibrarySnapshot]:
+    """获取当前快照，不触发扫描；还没有快照时返回None"""
+    return _snapshot
+
+def iter_music_file_batches(
+    library_dirs: List[str],
+    include_metadata: bool,
+    previous: Optional[Dict[str, Dict[str, Any]]] = None,
+    dir_mtimes: Optional[Dict[str, float]] = None,
+    batch_size: int = SCAN_BATCH_SIZE,
+    scope: Optional[List[str]] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    遍历音乐库目录，按批生成音乐文件信息（按读取完成的顺序，未排序）
+    
+    各目录按扫描策略（优先级、并发数、速率限制）调度，见scan_scheduler。
+    文件按目录在遍历过程中分配ID并生成：已登记的路径沿用登记的ID，与所有登记都不匹配的新路径直接分配新ID。
+    可能是重命名或移动的新路径需要与消失的登记比较，在遍历全部目录、统一分配ID之后生成。
+    
+    Args:
+        previous: 上一个快照的 ID -> 音乐文件，修改时间和大小未变的文件沿用其中的元数据
+        dir_mtimes: 用于返回各音乐库目录的修改时间
+        scope: 只扫描部分目录时，消失的曲目只在这些目录中查找
+    """
+    output: queue.Queue = queue.Queue()
+    threading.Thread(
+        target=_scan_libraries,
+        args=(library_dirs, include_metadata, previous or {}, dir_mtimes if dir_mtimes is not None else {}, batch_size, scope, output),
+        name="library-scan",
+        daemon=True
+    ).start()
+    
+    while True:
+        item = output.get()
+        if item is None:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+def _scan_libraries(
+    library_dirs: List[str],
+    include_metadata: bool,
+    previous: Dict[str, Dict[str, Any]],
+    dir_mtimes: Dict[str, float],
+    batch_size: int,
+    scope: Optional[List[str]],
+    output: queue.Queue
+) -> None:
+    """扫描线程：把生成的每批音乐文件放入output，结束时放入None，出错时放入异常"""
+    lock = threading.Lock()
+    file_keys = set()  # 用于去重：(设备号, inode)
+    entries_by_dir: Dict[str, list] = {library_dir: [] for library_dir in library_dirs}  # (文件路径, 音乐库目录, 文件名, stat结果, 歌词文件)
+    emitted: Dict[str, str] = {}  # 已生成的文件路径 -> ID
+    counts = {"found": 0, "processed": 0}
+    
+    def count(key: str, n: int = 1) -> None:
+        with lock:
+            counts[key] += n
+            _update_scan_progress(**{key: counts[key]})
+    
+    def emit(throttle: RootThrottle, items: List[tuple]) -> None:
+        """按目录的并发数创建一批音乐文件信息并输出；读取元数据前先取令牌"""
+        if not items:
+            return
+        batch = map_throttled(
+            throttle,
+            lambda item: _build_music_file(item[0], item[1], include_metadata, previous, throttle.wait),
+            items
+        )
+        with lock:
+            emitted.update((entry[0], file_id) for entry, file_id in items)
+        count("processed", len(batch))
+        output.put(batch)
+    
+    def walk(library_dir: str, throttle: RootThrottle) -> None:
+        if not os.path.exists(library_dir) or not os.path.isdir(library_dir):
+            return
+        
+        # 记录目录修改时间
+        dir_mtimes[library_dir] = os.path.getmtime(library_dir)
+        
+        entries = entries_by_dir[library_dir]
+        ready = []
+        for root, _, files in os.walk(library_dir):
+            found = []
+            # 同一目录中与音频文件同名的.lrc文件作为歌词，随遍历一起发现
+            sidecars = {
+                os.path.splitext(file)[0].lower(): file for file in files
+                if file.lower().endswith(LYRICS_SIDECAR_EXT)
+            }
+            for file in files:
+                if not any(file.lower().endswith(fmt) for fmt in SUPPORTED_FORMATS):
+                    continue
+                file_path = os.path.join(root, file)
                 
-                for root, _, files in os.walk(library_dir):
-                    for file in files:
-                        if any(file.lower().endswith(fmt) for fmt in SUPPORTED_FORMATS):
-                            file_path = os.path.join(root, file)
-                            
-                            # 如果文件已经在列表中，跳过
-                            if file_path in file_paths:
-                                continue
-                                
-                            file_paths.add(file_path)
-                            
-                            try:
-                                # 计算文件大小（MB）
-                                size_mb = round(os.path.getsize(file_path) / (1024 * 1024), 2)
-                                
-                                # 生成唯一ID
-                                file_id = generate_file_id(file_path)
-                                
-                                # 计算相对路径，用于API访问
-                                relative_path = os.path.relpath(file_path, library_dir)
-                                encoded_path = '/'.join([urllib.parse.quote(part) for part in relative_path.split(os.sep)])
-                                
-                                # 创建音乐文件信息字典
-                                music_file = {
-                                    "id": file_id,
-                                    "name": file,
-                                    "path": f"/library/{urllib.parse.quote(os.path.basename(library_dir))}/{encoded_path}",
-                                    "size": size_mb,
-                                    "add_time": os.path.getctime(file_path),
-                                    "source": "library",
-                                    "full_path": file_path
-                                }
-                                
-                                # 如果需要包含元数据，则提取
-                                if include_metadata:
-                                    metadata = extract_metadata(file_path)
-                                    music_file.update({
-                                        "metadata": metadata,
-                                        # 使用提取的元数据补充基本信息
-                                        "title": metadata.get("title") or os.path.splitext(file)[0],
-                                        "artist": metadata.get("artist"),
-                                        "album": metadata.get("album"),
-                                        "duration": metadata.get("duration")
-                                    })
-                                
-                                music_files.append(music_file)
-                            except (OSError, IOError) as e:
-                                # 跳过无法处理的文件，但不中断整个扫描过程
-                                print(f"处理文件时出错: {file_path}, 错误: {str(e)}")
-                                continue
-            except Exception as e:
-                print(f"扫描音乐库时出错: {library_dir}, 错误: {str(e)}")
+                throttle.wait()
+                try:
+                    stat = os.stat(file_path)
+                except (OSError, IOError) as e:
+                    # 跳过无法处理的文件，但不中断整个扫描过程
+                    print(f"处理文件时出错: {file_path}, 错误: {str(e)}")
+                    continue
+                
+                # 如果文件已经在列表中，跳过（按已有的stat结果比较同一文件，重叠的库目录或符号链接不会重复计入）
+                with lock:
+                    if (stat.st_dev, stat.st_ino) in file_keys:
+                        continue
+                    file_keys.add((stat.st_dev, stat.st_ino))
+                
+                entry = (file_path, library_dir, file, stat, _sidecar_lyrics(root, sidecars, file))
+                entries.append(entry)
+                found.append(entry)
+                count("found")
+            
+            # 每个目录遍历完后分配ID，可能是重命名的文件留到最后
+            if found:
+                file_ids = track_ids.assign_new([(entry[0], entry[3]) for entry in found])
+                ready.extend((entry, file_id) for entry, file_id in zip(found, file_ids) if file_id is not None)
+            while len(ready) >= batch_size:
+                emit(throttle, ready[:batch_size])
+                ready = ready[batch_size:]
+        emit(throttle, ready)
+    
+    try:
+        throttles = run_scheduled(library_dirs, walk)
+        
+        # 分配ID：已知路径沿用登记的ID，重命名和移动的文件保留原ID
+        entries = [entry for library_dir in library_dirs for entry in entries_by_dir[library_dir]]
+        # 没有找到任何文件的目录可能是未挂载的网络存储，不删除其中的登记
+        walked_roots = [library_dir for library_dir in library_dirs if entries_by_dir[library_dir]]
+        file_ids = track_ids.assign([(entry[0], entry[3]) for entry in entries], scope=scope, roots=walked_roots)
+        _update_scan_progress(phase="reading", total=len(entries))
+        
+        pending: Dict[str, List[tuple]] = {}
+        for entry, file_id in zip(entries, file_ids):
+            if emitted.get(entry[0]) == file_id:
                 continue
+            if entry[0] in emitted:
+                # 遍历期间登记被其他扫描修改，极少发生；以统一分配的结果为准
+                print(f"曲目ID在扫描期间发生变化: {entry[0]}")
+            pending.setdefault(entry[1], []).append((entry, file_id))
         
-        # 按添加时间排序
-        music_files.sort(key=lambda x: x["add_time"], reverse=True)
+        def read(library_dir: str, throttle: RootThrottle) -> None:
+            items = pending[library_dir]
+            for start in range(0, len(items), batch_size):
+                emit(throttle, items[start:start + batch_size])
+        
+        run_scheduled(list(pending), read, throttles)
+        output.put(None)
+    except BaseException as e:
+        output.put(e)
+
+def _sidecar_lyrics(directory: str, sidecars: Dict[str, str], file: str) -> Optional[tuple]:
+    """音频文件同名的歌词文件：(路径, 修改时间)，没有时返回None"""
+    name = sidecars.get(os.path.splitext(file)[0].lower())
+    if name is None:
+        return None
+    path = os.path.join(directory, name)
+    try:
+        return path, os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _build_music_file(
+    entry: tuple,
+    file_id: str,
+    include_metadata: bool,
+    previous: Dict[str, Dict[str, Any]],
+    before_read: Optional[Callable[[], None]] = None
+) -> Dict[str, Any]:
+    """
+    根据遍历得到的 (文件路径, 音乐库目录, 文件名, stat结果, 歌词文件) 创建音乐文件信息字典
+    
+    Args:
+        before_read: 需要读取文件提取元数据时先调用（用于限速）
+    """
+    file_path, library_dir, file, stat, lyrics = entry
+    
+    # 计算相对路径，用于API访问
+    relative_path = os.path.relpath(file_path, library_dir)
+    encoded_path = '/'.join([urllib.parse.quote(part) for part in relative_path.split(os.sep)])
+    
+    # 创建音乐文件信息字典
+    music_file = {
+        "id": file_id,
+        "name": file,
+        "path": f"/library/{urllib.parse.quote(os.path.basename(library_dir))}/{encoded_path}",
+        "size": round(stat.st_size / (1024 * 1024), 2),
+        "add_time": stat.st_ctime,
+        "mtime": stat.st_mtime,
+        "source": "library",
+        "full_path": file_path
+    }
+    
+    # 同名的.lrc歌词文件
+    if lyrics is not None:
+        music_file["lyrics_path"], music_file["lyrics_mtime"] = lyrics
+    
+    # 如果需要包含元数据，则提取（文件未变化时沿用上次的结果）
+    if include_metadata:
+        old = previous.get(file_id)
+        # 旧版本提取的元数据没有has_lyrics，需要重新读取一次标签
+        if (
+            old is not None and "metadata" in old and old["full_path"] == file_path
+            and old.get("mtime") == stat.st_mtime and old["size"] == music_file["size"]
+            and (not old["metadata"] or "has_lyrics" in old["metadata"])
+        ):
+            metadata = old["metadata"]
+        else:
+            if before_read is not None:
+                before_read()
+            metadata = extract_metadata(file_path)
+        music_file.update({
+            "metadata": metadata,
+            # 使用提取的元数据补充基本信息
+            "title": metadata.get("title") or os.path.splitext(file)[0],
+            "artist": metadata.get("artist"),
+            "album": metadata.get("album"),
+            "duration": metadata.get("duration")
+        })
+    
+    return music_file
+
+def _publish_snapshot(
+    music_files: List[Dict[str, Any]],
+    library_dirs: List[str],
+    dir_mtimes: Dict[str, float],
+    include_metadata: bool,
+    version: Optional[int] = None,
+    validated_at: Optional[float] = None,
+    persist: bool = True
+) -> LibrarySnapshot:
+    """
+    记录与旧快照的差异，构建新快照并替换全局引用（调用方需持有_cache_lock）
+    
+    Args:
+        version: 指定版本号（从索引加载时使用）；为None时在有变化时自增版本号并写入索引
+        validated_at: 从索引加载时，索引内容最近一次与磁盘核对的时间
+        persist: 为False时曲目已在索引中（如导入），只更新版本号
+    """
+    global _snapshot, _snapshot_expired, _library_version
+    
+    old_snapshot = _snapshot
+    old_files = old_snapshot.by_id if old_snapshot is not None else None
+    files_by_id = {file["id"]: file for file in music_files}
+    added, removed, updated = _diff_music_files(old_files, files_by_id)
+    changed = bool(added or removed or updated)
+    
+    with _change_log_lock:
+        if version is None:
+            if changed:
+                _library_version += 1
+        else:
+            _library_version = version
+        if changed:
+            _change_log.append({
+                "version": _library_version,
+                "added": added,
+                "removed": removed,
+                "updated": updated
+            })
+        new_version = _library_version
+    
+    # 持久化到索引，供只读工作进程使用
+    if version is None:
+        try:
+            if not persist:
+                if changed:
+                    library_index.set_version(new_version, include_metadata)
+            elif old_files is None:
+                library_index.replace_all(music_files, new_version, include_metadata)
+            elif changed:
+                upserts = [files_by_id[file_id] for file_id in added + updated]
+                library_index.apply_changes(upserts, removed, new_version, include_metadata)
+            library_index.set_meta("validated_at", str(time.time()))
+        except Exception as e:
+            print(f"写入音乐库索引时出错: {str(e)}")
+    
+    snapshot = LibrarySnapshot(
+        music_files, new_version, include_metadata, library_dirs, dir_mtimes,
+        source="scan" if version is None else "index",
+        validated_at=validated_at
+    )
+    _snapshot = snapshot
+    _snapshot_expired = False
+    
+    # 通知监听方增量更新各自的数据（只在扫描进程中执行，只读工作进程直接读取结果）
+    if version is None and changed:
+        for listener in list(_change_listeners):
+            try:
+                listener(snapshot, added, removed, updated)
+            except Exception as e:
+                print(f"执行音乐库变化监听时出错: {str(e)}")
+    return snapshot
+
+def register_change_listener(listener: Callable) -> None:
+    """
+    注册音乐库变化的监听函数
+    
+    Args:
+        listener: 接收 (新快照, 新增ID列表, 删除ID列表, 更新ID列表)
+    """
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+def _load_from_index(force_refresh: bool = False, include_metadata: bool = False) -> LibrarySnapshot:
+    """
+    从索引读取音乐库快照（只读工作进程使用）
+    
+    索引版本未变化时直接返回本进程的快照；需要扫描时向扫描进程发出请求
+    """
+    snapshot = _snapshot
+    empty = LibrarySnapshot([], _library_version, include_metadata, [], {})
+    
+    try:
+        index_has_metadata = library_index.get_meta("include_metadata") == "1"
+        if force_refresh or (include_metadata and not index_has_metadata):
+            library_index.request_scan(include_metadata or index_has_metadata)
+        
+        index_version = library_index.get_version()
+        if index_version is None:
+            # 索引尚未建立
+            if snapshot is None:
+                library_index.request_scan(include_metadata)
+            return snapshot or empty
+        
+        if snapshot is not None and index_version == snapshot.version and not _snapshot_expired:
+            return snapshot
+        
+        with _cache_lock:
+            snapshot = _snapshot
+            if snapshot is not None and index_version == snapshot.version and not _snapshot_expired:
+                return snapshot
+            
+            music_files = library_index.load_all()
+            return _publish_snapshot(
+                music_files, [], {}, index_has_metadata,
+                version=index_version, validated_at=_index_validated_at()
+            )
+    except Exception as e:
+        print(f"读取音乐库索引时出错: {str(e)}")
+        return snapshot or empty
+
+def _index_validated_at() -> Optional[float]:
+    """索引内容最近一次与磁盘核对的时间"""
+    value = library_index.get_meta("validated_at") or library_index.get_meta("updated_at")
+    return float(value) if value is not None else None
+
+def load_persisted_snapshot() -> Optional[LibrarySnapshot]:
+    """
+    启动时从索引加载上次保存的快照（扫描进程使用）
+    
+    加载的快照立即用于响应请求，并在缓存有效期内视为有效，因此请求不会等待扫描；
+    调用方随后应在后台强制重新扫描，与磁盘的差异按正常的变更记录发布。
+    
+    Returns:
+        加载的快照；索引为空或已有快照时返回None
+    """
+    if INDEX_MODE == "reader" or _snapshot is not None:
+        return None
+    
+    with _cache_lock:
+        if _snapshot is not None:
+            return None
+        try:
+            version = library_index.get_version()
+            if version is None:
+                return None
+            include_metadata = library_index.get_meta("include_metadata") == "1"
+            music_files = library_index.load_all()
+            validated_at = _index_validated_at()
+        except Exception as e:
+            print(f"加载已保存的音乐库快照时出错: {str(e)}")
+            return None
+        
+        return _publish_snapshot(
+            music_files, get_music_libraries(), {}, include_metadata,
+            version=version, validated_at=validated_at
+        )
+
+def reload_from_index() -> LibrarySnapshot:
+    """
+    索引被直接写入（如导入）后，从索引重新构建快照（扫描进程使用）
+    
+    与当前快照的差异按正常的变更记录发布并通知监听方，版本号随之递增
+    """
+    with _cache_lock:
+        include_metadata = library_index.get_meta("include_metadata") == "1"
+        music_files = library_index.load_all()
+        return _publish_snapshot(music_files, get_music_libraries(), {}, include_metadata, persist=False)
+
+def get_snapshot_status() -> Dict[str, Any]:
+    """
+    获取当前快照的状态（用于健康检查）
+    
+    Returns:
+        - loaded: 是否已有可用的快照
+        - source: scan或index
+        - version / files / include_metadata
+        - age_seconds: 距内容最近一次与磁盘核对的秒数
+    """
+    snapshot = _snapshot
+    if INDEX_MODE == "reader":
+        try:
+            version = library_index.get_version()
+            validated_at = _index_validated_at()
+        except Exception as e:
+            print(f"读取音乐库索引时出错: {str(e)}")
+            version, validated_at = None, None
+        loaded = version is not None
+        return {
+            "loaded": loaded,
+            "source": "index",
+            "version": version,
+            "files": len(snapshot.files) if snapshot is not None and snapshot.version == version else None,
+            "include_metadata": library_index.get_meta("include_metadata") == "1" if loaded else False,
+            "age_seconds": round(time.time() - validated_at, 1) if validated_at is not None else None
+        }
+    
+    if snapshot is None:
+        return {"loaded": False, "source": None, "version": None, "files": 0, "include_metadata": False, "age_seconds": None}
+    return {
+        "loaded": True,
+        "source": snapshot.source,
+        "version": snapshot.version,
+        "files": len(snapshot.files),
+        "include_metadata": snapshot.include_metadata,
+        "age_seconds": round(time.time() - snapshot.validated_at, 1)
+    }
+
+def _file_signature(file: Dict[str, Any]) -> tuple:
+    """用于判断音乐文件信息是否变化的签名"""
+    return (
+        file["path"], file["size"], file["add_time"], file.get("mtime"), repr(file.get("metadata")),
+        file.get("lyrics_path"), file.get("lyrics_mtime")
+    )
+
+def _diff_music_files(
+    old_files: Optional[Dict[str, Dict[str, Any]]],
+    new_files: Dict[str, Dict[str, Any]]
+) -> tuple:
+    """
+    比较两次扫描结果
+    
+    Returns:
+        (新增ID列表, 删除ID列表, 更新ID列表)
+    """
+    if old_files is None:
+        return list(new_files.keys()), [], []
+    
+    added = [file_id for file_id in new_files if file_id not in old_files]
+    removed = [file_id for file_id in old_files if file_id not in new_files]
+    updated = [
+        file_id for file_id, file in new_files.items()
+        if file_id in old_files and _file_signature(file) != _file_signature(old_files[file_id])
+    ]
+    return added, removed, updated
+
+def get_library_version() -> int:
+    """获取当前音乐库版本号"""
+    return _library_version
+
+def get_changes_since(since: int) -> Optional[Dict[str, List[str]]]:
+    """
+    获取指定版本之后的变更
+    
+    Args:
+        since: 客户端持有的版本号
         
-        # 更新缓存
-        _music_files_cache = music_files
-        _cache_timestamp = current_time
-        _cache_library_dirs = current_library_dirs.copy()
-        _last_dir_mtimes = new_dir_mtimes
+    Returns:
+        合并后的新增、删除、更新ID列表；如果变更记录不足以覆盖该版本则返回None，
+        此时客户端需要全量同步
+    """
+    with _change_log_lock:
+        if since == _library_version:
+            return {"added": [], "removed": [], "updated": []}
+        if since > _library_version or not _change_log or since < _change_log[0]["version"] - 1:
+            return None
         
-        return music_files
+        # 按顺序合并多条变更记录
+        added, removed, updated = set(), set(), set()
+        for entry in _change_log:
+            if entry["version"] <= since:
+                continue
+            for file_id in entry["added"]:
+                if file_id in removed:
+                    removed.discard(file_id)
+                    updated.add(file_id)
+                else:
+                    added.add(file_id)
+            for file_id in entry["removed"]:
+                if file_id in added:
+                    added.discard(file_id)
+                else:
+                    removed.add(file_id)
+                updated.discard(file_id)
+            for file_id in entry["updated"]:
+                if file_id not in added:
+                    updated.add(file_id)
+        
+        return {"added": sorted(added), "removed": sorted(removed), "updated": sorted(updated)}
 
 def get_all_music_files(include_metadata: bool = False) -> List[Dict[str, Any]]:
     """获取所有音乐文件列表"""
     return scan_music_library(include_metadata=include_metadata)
 
 def clear_cache():
-    """清除音乐库扫描缓存"""
-    global _music_files_cache, _cache_timestamp, _last_dir_mtimes
+    """
+    清除音乐库扫描缓存
     
-    with _cache_lock:
-        _music_files_cache = None
-        _cache_timestamp = 0
-        _last_dir_mtimes = {}
+    只把当前快照标记为过期，保留旧快照用于计算差异，下次访问时重新扫描
+    """
+    global _snapshot_expired
+    
+    _snapshot_expired = True
 
-def generate_file_id(file_path: str) -> str:
-    """根据文件路径生成唯一ID"""
-    return hashlib.md5(file_path.encode('utf-8')).hexdigest()
+def get_stat_signature(file_path: str) -> Optional[str]:
+    """根据文件大小和修改时间生成签名，文件不存在时返回None"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def generate_file_id(file_path: str, stat: Optional[os.stat_result] = None) -> str:
+    """
+    为新出现的文件生成ID（32位十六进制）
+    
+    有stat结果时由路径的CRC32和(设备号, inode)组成，不需要计算加密哈希；
+    否则退回到路径的MD5
+    """
+    if stat is None:
+        return hashlib.md5(file_path.encode('utf-8')).hexdigest()
+    return f"{zlib.crc32(file_path.encode('utf-8')):08x}{stat.st_dev & 0xffffffff:08x}{stat.st_ino & 0xffffffffffffffff:016x}"
+
+def resolve_file_id(file_id: str) -> str:
+    """把旧ID（别名）解析为当前ID，不是别名时原样返回"""
+    if INDEX_MODE == "reader":
+        return library_index.resolve_alias(file_id) or file_id
+    return track_ids.resolve_alias(file_id) or file_id
 
 def decode_filename(filename: str) -> str:
     """解码URL编码的文件名"""
@@ -172,11 +946,9 @@ def get_file_path(file_id_or_path: str) -> str:
     """
     # 检查是否是ID格式（32位十六进制字符串）
     if len(file_id_or_path) == 32 and all(c in '0123456789abcdef' for c in file_id_or_path.lower()):
-        # 查找对应ID的文件
-        music_files = scan_music_library()
-        for file in music_files:
-            if file["id"] == file_id_or_path:
-                return file["full_path"]
+        file = get_music_by_id(file_id_or_path)
+        if file:
+            return file["full_path"]
     
     # 检查是否是完整路径
     if os.path.exists(file_id_or_path) and os.path.isfile(file_id_or_path):
@@ -191,9 +963,33 @@ def file_exists(file_id_or_path: str) -> bool:
     return os.path.exists(file_path) and os.path.isfile(file_path)
 
 def get_music_by_id(file_id: str) -> Dict[str, Any]:
-    """根据ID获取音乐文件信息"""
-    music_files = scan_music_library()
-    for file in music_files:
-        if file["id"] == file_id:
-            return file
-    return None 
\ No newline at end of file
+    """根据ID获取音乐文件信息，旧ID会通过别名解析；还没有快照时读取索引，不等待首次扫描"""
+    if INDEX_MODE == "reader" or _snapshot is None:
+        return library_index.get_track(file_id) or library_index.get_track(resolve_file_id(file_id))
+    
+    by_id = get_library_snapshot().by_id
+    return by_id.get(file_id) or by_id.get(resolve_file_id(file_id)) 
+
+def get_music_by_ids(file_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    根据ID批量获取音乐文件信息，旧ID会通过别名解析
+    
+    Returns:
+        请求的ID -> 音乐文件信息（找不到的ID不包含在内）
+    """
+    if INDEX_MODE == "reader" or _snapshot is None:
+        found = library_index.get_tracks(file_ids)
+        missing = [file_id for file_id in file_ids if file_id not in found]
+        if missing:
+            aliases = library_index.resolve_aliases(missing)
+            targets = library_index.get_tracks(set(aliases.values()))
+            found.update({alias: targets[target] for alias, target in aliases.items() if target in targets})
+        return found
+    
+    by_id = get_library_snapshot().by_id
+    result = {}
+    for file_id in file_ids:
+        file = by_id.get(file_id) or by_id.get(resolve_file_id(file_id))
+        if file:
+            result[file_id] = file
+    return result
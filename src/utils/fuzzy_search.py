@@ -0,0 +1,281 @@
+"""
+模糊搜索
+
+为每个快照版本构建一次三元组倒排索引：标题、艺术家、专辑和文件名先做Unicode归一化
+（NFKC全半角折叠、忽略大小写、去掉变音符号），中文另外生成二元组和拼音（全拼与首字母）。
+查询时只取出现次数最少的若干个查询片段，用NumPy统计每个曲目命中的片段数，
+只对命中最多的少量候选重新打分，因此查询开销与音乐库大小基本无关。
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+from src.utils.file_utils import get_library_snapshot
+
+# 参与统计的查询片段上限（优先选择出现次数少的）
+MAX_QUERY_GRAMS = 24
+
+# 按编辑距离重新打分的部分命中候选数量：请求结果数的倍数，至少MIN_CANDIDATES个
+CANDIDATES_PER_RESULT = 4
+MIN_CANDIDATES = 64
+
+# 命中片段比例低于该值的曲目不作为候选
+MIN_GRAM_RATIO = 0.3
+
+# 最终相似度低于该值的结果不返回
+MIN_SIMILARITY = 0.6
+
+_TOKEN_SPLIT = re.compile(r"[\s\-_.,;:!?/\\|()\[\]{}<>\"'`~@#$%^&*+=，。、；：！？（）【】《》「」『』·…—]+")
+
+def _is_cjk(char: str) -> bool:
+    return "㐀" <= char <= "鿿" or "豈" <= char <= "﫿"
+
+def normalize_text(text: Optional[str]) -> str:
+    """NFKC归一化（全角转半角）、忽略大小写并去掉变音符号"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(char for char in decomposed if unicodedata.category(char) != "Mn")
+    return unicodedata.normalize("NFC", stripped)
+
+def tokenize(text: str) -> List[str]:
+    """按空白和标点切分归一化后的文本"""
+    return [token for token in _TOKEN_SPLIT.split(text) if token]
+
+@lru_cache(maxsize=1)
+def _get_lazy_pinyin():
+    """首次需要时才导入pypinyin（导入需要加载词典，较慢）；未安装时返回None，不支持拼音搜索"""
+    try:
+        from pypinyin import lazy_pinyin
+    except ImportError:
+        return None
+    return lazy_pinyin
+
+# 单个汉字的默认读音（逐字查询比整句转换快得多，多音字取最常用的读音）
+_pinyin_cache: Dict[str, str] = {}
+
+def _char_pinyin(char: str) -> str:
+    syllable = _pinyin_cache.get(char)
+    if syllable is None:
+        syllable = "".join(_get_lazy_pinyin()(char, errors="ignore"))
+        _pinyin_cache[char] = syllable
+    return syllable
+
+def pinyin_variants(text: str) -> List[str]:
+    """中文文本的拼音全拼和首字母（未安装pypinyin或不含中文时为空）"""
+    if not any(_is_cjk(char) for char in text) or _get_lazy_pinyin() is None:
+        return []
+    syllables = [_char_pinyin(char) if _is_cjk(char) else char for char in text if not char.isspace()]
+    syllables = [syllable for syllable in syllables if syllable]
+    return ["".join(syllables), "".join(syllable[0] for syllable in syllables)]
+
+@lru_cache(maxsize=262144)
+def _token_grams(token: str) -> Tuple[str, ...]:
+    """单个词的片段：两端补位后的三元组，中文另外加入二元组"""
+    grams = set()
+    padded = f"${token}$"
+    for i in range(len(padded) - 2):
+        grams.add(padded[i:i + 3])
+    if any(_is_cjk(char) for char in token):
+        for i in range(len(token) - 1):
+            grams.add(token[i:i + 2])
+        if len(token) == 1:
+            grams.add(token)
+    return tuple(grams)
+
+def text_grams(tokens: List[str]) -> set:
+    """生成一组词的全部片段"""
+    grams = set()
+    for token in tokens:
+        grams.update(_token_grams(token))
+    return grams
+
+def token_similarity(a: str, b: str) -> float:
+    """基于编辑距离（相邻字符交换计为一次编辑）的相似度，长度相差过大时直接返回0"""
+    if a == b:
+        return 1.0
+    longest = max(len(a), len(b))
+    if abs(len(a) - len(b)) > 2 or longest == 0:
+        return 0.0
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return 1.0 - previous[-1] / longest
+
+def _searchable_fields(file: Dict[str, Any]) -> List[str]:
+    metadata = file.get("metadata") or {}
+    fields = [file["name"].rsplit(".", 1)[0], metadata.get("title"), metadata.get("artist"), metadata.get("album")]
+    return [normalize_text(field) for field in fields if field]
+
+def _query_variants(query: str) -> Tuple[str, List[str]]:
+    normalized = normalize_text(query)
+    tokens = tokenize(normalized)
+    for variant in pinyin_variants(normalized):
+        tokens.append(variant)
+    return normalized, tokens
+
+class FuzzySearchIndex:
+    """某个快照版本的三元组倒排索引"""
+
+    def __init__(self, files: List[Dict[str, Any]], version: int):
+        import numpy as np
+
+        self.files = files
+        self.version = version
+        self.texts: List[str] = []
+
+        gram_ids: Dict[str, int] = {}
+        pair_grams = []
+        pair_docs = []
+        doc_gram_counts = []
+        for doc_id, file in enumerate(files):
+            fields = _searchable_fields(file)
+            text = " ".join(fields)
+            self.texts.append(text)
+
+            tokens = tokenize(text)
+            for field in fields:
+                tokens.extend(pinyin_variants(field))
+            grams = text_grams(tokens)
+            doc_gram_counts.append(len(grams))
+            for gram in grams:
+                gram_id = gram_ids.setdefault(gram, len(gram_ids))
+                pair_grams.append(gram_id)
+            pair_docs.extend([doc_id] * len(grams))
+
+        # 压缩为CSR格式：postings[offsets[g]:offsets[g+1]] 是包含片段g的曲目
+        pair_grams = np.asarray(pair_grams, dtype=np.int32)
+        pair_docs = np.asarray(pair_docs, dtype=np.int32)
+        order = np.argsort(pair_grams, kind="stable")
+        self.postings = pair_docs[order]
+        self.offsets = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_grams, minlength=len(gram_ids)), out=self.offsets[1:])
+        self.gram_ids = gram_ids
+        self.doc_gram_counts = np.asarray(doc_gram_counts, dtype=np.int32)
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """模糊搜索，返回带score的音乐文件列表"""
+        import numpy as np
+
+        normalized, tokens = _query_variants(query)
+        if not normalized:
+            return []
+
+        query_grams = [self.gram_ids.get(gram) for gram in text_grams(tokens)]
+        total_grams = len(query_grams)
+        known = sorted(
+            (gram_id for gram_id in query_grams if gram_id is not None),
+            key=lambda gram_id: self.offsets[gram_id + 1] - self.offsets[gram_id]
+        )[:MAX_QUERY_GRAMS]
+        if not known or not self.files:
+            return []
+
+        # 统计每个曲目命中的片段数
+        postings = np.concatenate([self.postings[self.offsets[g]:self.offsets[g + 1]] for g in known])
+        counts = np.bincount(postings, minlength=len(self.files))
+        considered = min(total_grams, MAX_QUERY_GRAMS)
+        threshold = max(1, int(np.ceil(considered * MIN_GRAM_RATIO)))
+        candidates = np.flatnonzero(counts >= threshold)
+        max_candidates = max(limit * CANDIDATES_PER_RESULT, MIN_CANDIDATES)
+        if candidates.size > max_candidates:
+            # 命中全部片段的曲目（包括完全包含查询的）都保留，其余按命中数截断
+            full = candidates[counts[candidates] >= considered]
+            partial = candidates[counts[candidates] < considered]
+            room = max(max_candidates - full.size, 0)
+            if partial.size > room:
+                partial = partial[np.argpartition(-counts[partial], room)[:room]] if room else partial[:0]
+            candidates = np.concatenate([full, partial])
+
+        query_tokens = tokenize(normalized)
+        results = []
+        for doc_id in candidates.tolist():
+            text = self.texts[doc_id]
+            exact = normalized in text
+            similarity = min(1.0, counts[doc_id] / considered)
+            if not exact and similarity < 1.0:
+                # 每个查询词与曲目中最接近的词的平均相似度，用于容忍拼写错误
+                doc_tokens = tokenize(text)
+                typo = sum(
+                    max((token_similarity(token, doc_token) for doc_token in doc_tokens), default=0.0)
+                    for token in query_tokens
+                ) / max(len(query_tokens), 1)
+                similarity = max(similarity, typo)
+                if similarity < MIN_SIMILARITY:
+                    continue
+            # 完全包含查询的排在前面；相似度相同时文本较短的排在前面
+            score = (1.0 if exact else 0.0) + similarity - self.doc_gram_counts[doc_id] * 1e-4
+            results.append((score, doc_id, exact))
+
+        results.sort(reverse=True)
+        items = []
+        for score, doc_id, exact in results[:limit]:
+            result = self.files[doc_id].copy()
+            result["score"] = round(float(score), 4)
+            result["match_reasons"] = ["完全匹配" if exact else "模糊匹配"]
+            items.append(result)
+        return items
+
+class FuzzySearcher:
+    """维护与当前快照对应的模糊索引，音乐库变化后在后台重建，重建期间继续使用旧索引"""
+
+    def __init__(self):
+        self._index: Optional[FuzzySearchIndex] = None
+        self._building_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.last_build_seconds = 0.0
+
+    def _build(self, snapshot) -> None:
+        started = time.time()
+        try:
+            index = FuzzySearchIndex(snapshot.files, snapshot.version)
+            with self._lock:
+                if self._index is None or self._index.version < index.version:
+                    self._index = index
+            self.last_build_seconds = time.time() - started
+        except Exception as e:
+            print(f"构建模糊搜索索引时出错: {str(e)}")
+        finally:
+            with self._lock:
+                if self._building_version == snapshot.version:
+                    self._building_version = None
+
+    def get_index(self) -> Optional[FuzzySearchIndex]:
+        """获取可用的索引；尚未构建完成时返回None"""
+        snapshot = get_library_snapshot(include_metadata=True)
+        with self._lock:
+            index = self._index
+            if index is not None and index.version == snapshot.version:
+                return index
+            if self._building_version != snapshot.version:
+                self._building_version = snapshot.version
+                threading.Thread(target=self._build, args=(snapshot,), daemon=True).start()
+        return index
+
+    def search(self, query: str, limit: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """
+        模糊搜索
+
+        Returns:
+            搜索结果；索引尚未构建完成时返回None，调用方应退回到普通搜索
+        """
+        index = self.get_index()
+        if index is None:
+            return None
+        return index.search(query, limit)
+
+
+# 创建全局实例
+fuzzy_searcher = FuzzySearcher()
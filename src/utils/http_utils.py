@@ -0,0 +1,59 @@
+"""
+HTTP条件请求工具
+"""
+
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+def build_etag(*parts: Any) -> str:
+    """
+    根据若干组成部分生成强ETag
+
+    Args:
+        parts: 参与计算的值（版本号、查询参数等）
+
+    Returns:
+        带引号的ETag字符串
+    """
+    raw = "|".join(str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest() + '"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """检查请求的If-None-Match头是否与ETag匹配"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match使用弱比较，忽略W/前缀
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+def conditional_json(request: Request, content: Any, etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    返回支持条件请求的JSON响应
+
+    如果客户端持有的ETag与当前一致，返回304且不携带响应体
+    """
+    response_headers = {
+        "ETag": etag,
+        # 允许客户端缓存，但每次使用前都要重新验证
+        "Cache-Control": "no-cache",
+    }
+    if headers:
+        response_headers.update(headers)
+
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=response_headers)
+
+    return JSONResponse(content=content, headers=response_headers)
@@ -0,0 +1,80 @@
+"""
+多进程部署中的扫描进程
+
+负责维护共享的音乐库索引，并持有所有播放区域的播放器实例。
+HTTP工作进程只读访问索引，通过RemotePlayer控制播放。
+"""
+
+import threading
+import time
+from multiprocessing.connection import Connection, Listener
+
+def run_index_writer(conn: Connection, authkey: bytes, poll_interval: float = 2.0) -> None:
+    """
+    扫描进程入口
+
+    Args:
+        conn: 用于把播放器服务地址发回父进程的管道
+        authkey: 播放器服务的认证密钥
+        poll_interval: 检查扫描请求和目录变化的间隔（秒）
+    """
+    from src.models.player import serve_player
+    from src.models.zones import zone_manager
+    from src.utils.async_scanner import scanner
+    from src.utils.file_utils import scan_music_library
+    from src.utils.library_index import library_index
+    from src.utils.uploads import upload_manager
+    # 导入后注册音乐库变化监听，在扫描进程中增量维护智能播放列表、分类浏览数据和歌词
+    import src.utils.browse  # noqa: F401
+    import src.utils.lyrics  # noqa: F401
+    import src.utils.playlists  # noqa: F401
+
+    # 启动播放器服务，并把地址告诉父进程
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    conn.send(listener.address)
+    conn.close()
+    threading.Thread(target=serve_player, args=(listener, zone_manager.local_players()), daemon=True).start()
+
+    # 启动时先加载上次保存的快照，再在后台完整扫描一次，只写入与磁盘的差异
+    scanner.warm_start()
+
+    while True:
+        time.sleep(poll_interval)
+
+        if scanner.is_scanning:
+            continue
+
+        try:
+            if library_index.pop_job_request("analysis"):
+                scanner.start_analysis()
+            if library_index.pop_job_request("duplicates"):
+                scanner.start_duplicate_detection()
+            job = library_index.pop_job_request("import")
+            if job:
+                _run_import(job)
+            # HTTP工作进程上传并移入音乐库的文件，只把这些文件加入索引
+            upload_manager.index_stored()
+
+            request = library_index.pop_scan_request()
+            if request:
+                scanner.start_scan(include_metadata=request.get("include_metadata", False))
+            elif not scanner.start_scheduled_scans():
+                # 未强制刷新时，只在目录变化或缓存过期时才会真正重新扫描
+                include_metadata = library_index.get_meta("include_metadata") == "1"
+                scan_music_library(include_metadata=include_metadata)
+        except Exception as e:
+            print(f"扫描进程出错: {str(e)}")
+
+def _run_import(job: dict) -> None:
+    """执行HTTP工作进程转交的导入任务，完成后删除临时文件"""
+    import os
+    from src.utils.library_transfer import import_library_file
+
+    try:
+        counts = import_library_file(job["path"], job["format"])
+        print(f"音乐库导入完成: {counts}")
+    except Exception as e:
+        print(f"导入音乐库时出错: {str(e)}")
+    finally:
+        if os.path.exists(job["path"]):
+            os.remove(job["path"])
@@ -0,0 +1,419 @@
+"""
+音乐库索引（SQLite WAL）
+
+扫描结果持久化到本地SQLite数据库，多进程部署时由一个扫描进程写入，
+HTTP工作进程只读访问。
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterable
+
+# 默认索引文件路径（与config.json位于同一目录）
+INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "library_index.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    full_path TEXT NOT NULL,
+    add_time REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_add_time ON tracks(add_time);
+CREATE INDEX IF NOT EXISTS idx_tracks_full_path ON tracks(full_path);
+CREATE TABLE IF NOT EXISTS analysis (
+    id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    integrated_lufs REAL,
+    peak REAL,
+    gain_db REAL,
+    analyzed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    payload_hash TEXT,
+    fingerprint BLOB
+);
+CREATE TABLE IF NOT EXISTS track_ids (
+    id TEXT PRIMARY KEY,
+    full_path TEXT NOT NULL UNIQUE,
+    dev INTEGER,
+    inode INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS id_aliases (
+    alias TEXT PRIMARY KEY,
+    id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_requests (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    params TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_requests_job ON job_requests(job, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class LibraryIndex:
+    """音乐库索引，每个线程使用独立的数据库连接"""
+
+    def __init__(self, db_path: str = INDEX_FILE):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接（供播放列表等其他存储使用同一数据库）"""
+        return self._connect()
+
+    def open_connection(self) -> sqlite3.Connection:
+        """新建一个独立的连接（可跨线程使用，如流式导出），调用方负责关闭"""
+        self._connect()  # 确保表结构已创建
+        return sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+
+    def replace_all(self, music_files: List[Dict[str, Any]], version: int, include_metadata: bool) -> None:
+        """用完整扫描结果替换索引内容"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM tracks")
+            conn.executemany(
+                "INSERT INTO tracks (id, full_path, add_time, data) VALUES (?, ?, ?, ?)",
+                self._rows(music_files)
+            )
+            self._write_meta(conn, version, include_metadata)
+
+    def apply_changes(
+        self,
+        upserts: List[Dict[str, Any]],
+        removed_ids: List[str],
+        version: int,
+        include_metadata: bool
+    ) -> None:
+        """增量写入变更的音乐文件"""
+        conn = self._connect()
+        with conn:
+            if removed_ids:
+                conn.executemany("DELETE FROM tracks WHERE id = ?", [(file_id,) for file_id in removed_ids])
+            if upserts:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tracks (id, full_path, add_time, data) VALUES (?, ?, ?, ?)",
+                    self._rows(upserts)
+                )
+            self._write_meta(conn, version, include_metadata)
+
+    @staticmethod
+    def _rows(music_files: Iterable[Dict[str, Any]]):
+        for file in music_files:
+            yield (file["id"], file["full_path"], file["add_time"], json.dumps(file, ensure_ascii=False))
+
+    @staticmethod
+    def _write_meta(conn: sqlite3.Connection, version: int, include_metadata: bool) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [
+                ("version", str(version)),
+                ("include_metadata", "1" if include_metadata else "0"),
+                ("updated_at", str(time.time())),
+            ]
+        )
+
+    def set_version(self, version: int, include_metadata: bool) -> None:
+        """只更新版本号等元信息（曲目已由其他方式写入索引时使用）"""
+        conn = self._connect()
+        with conn:
+            self._write_meta(conn, version, include_metadata)
+
+    def import_batch(
+        self,
+        tracks: List[Dict[str, Any]],
+        track_id_rows: List[tuple],
+        aliases: List[tuple],
+        analysis_rows: List[tuple],
+        fingerprint_rows: List[tuple]
+    ) -> None:
+        """
+        在一个事务中批量写入导入的数据，已有的同ID记录被覆盖
+
+        Args:
+            track_id_rows: (id, full_path, dev, inode, size, mtime_ns)
+            aliases: (alias, id)
+            analysis_rows: (id, signature, integrated_lufs, peak, gain_db, analyzed_at)
+            fingerprint_rows: (id, signature, payload_hash, fingerprint)
+        """
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tracks (id, full_path, add_time, data) VALUES (?, ?, ?, ?)",
+                self._rows(tracks)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO track_ids (id, full_path, dev, inode, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+                track_id_rows
+            )
+            conn.executemany("INSERT OR REPLACE INTO id_aliases (alias, id) VALUES (?, ?)", aliases)
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis (id, signature, integrated_lufs, peak, gain_db, analyzed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                analysis_rows
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (id, signature, payload_hash, fingerprint) VALUES (?, ?, ?, ?)",
+                fingerprint_rows
+            )
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """读取元信息"""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        """写入元信息"""
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_version(self) -> Optional[int]:
+        """获取索引版本号，索引为空时返回None"""
+        value = self.get_meta("version")
+        return int(value) if value is not None else None
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        """按添加时间倒序读取全部音乐文件"""
+        rows = self._connect().execute("SELECT data FROM tracks ORDER BY add_time DESC")
+        return [json.loads(row[0]) for row in rows]
+
+    def load_recent(self, limit: int) -> List[Dict[str, Any]]:
+        """按添加时间倒序读取最近添加的音乐文件（使用add_time索引）"""
+        rows = self._connect().execute("SELECT data FROM tracks ORDER BY add_time DESC LIMIT ?", (limit,))
+        return [json.loads(row[0]) for row in rows]
+
+    def get_track(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID读取单个音乐文件"""
+        row = self._connect().execute("SELECT data FROM tracks WHERE id = ?", (file_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_tracks(self, file_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """根据ID批量读取音乐文件"""
+        conn = self._connect()
+        result = {}
+        file_ids = list(file_ids)
+        # 分批查询，避免超出SQLite的参数数量限制
+        for start in range(0, len(file_ids), 500):
+            batch = file_ids[start:start + 500]
+            rows = conn.execute(f"SELECT id, data FROM tracks WHERE id IN ({','.join('?' * len(batch))})", batch)
+            for file_id, data in rows:
+                result[file_id] = json.loads(data)
+        return result
+
+    def resolve_aliases(self, aliases: Iterable[str]) -> Dict[str, str]:
+        """批量把旧ID解析为当前ID，只返回是别名的项"""
+        conn = self._connect()
+        result = {}
+        aliases = list(aliases)
+        for start in range(0, len(aliases), 500):
+            batch = aliases[start:start + 500]
+            rows = conn.execute(f"SELECT alias, id FROM id_aliases WHERE alias IN ({','.join('?' * len(batch))})", batch)
+            result.update(rows)
+        return result
+
+    def load_track_ids(self) -> List[tuple]:
+        """读取全部路径与ID的对应关系：(id, full_path, dev, inode, size, mtime_ns)"""
+        return self._connect().execute(
+            "SELECT id, full_path, dev, inode, size, mtime_ns FROM track_ids"
+        ).fetchall()
+
+    def load_track_paths(self) -> List[tuple]:
+        """读取已索引曲目的 (id, full_path)，用于从旧版本迁移ID"""
+        return self._connect().execute("SELECT id, full_path FROM tracks").fetchall()
+
+    def load_id_aliases(self) -> Dict[str, str]:
+        """读取全部ID别名"""
+        return dict(self._connect().execute("SELECT alias, id FROM id_aliases").fetchall())
+
+    def save_track_ids(
+        self,
+        records: List[tuple],
+        deleted_ids: List[str],
+        aliases: Dict[str, str]
+    ) -> None:
+        """
+        写入ID登记的变化
+
+        Args:
+            records: (id, full_path, dev, inode, size, mtime_ns) 列表
+            deleted_ids: 已合并到其他ID或文件已删除、需要删除的登记（指向它们的别名一并删除）
+            aliases: 旧ID -> 新ID
+        """
+        conn = self._connect()
+        with conn:
+            if deleted_ids:
+                conn.executemany("DELETE FROM track_ids WHERE id = ?", [(file_id,) for file_id in deleted_ids])
+                # 合并的登记的别名随后改为指向新ID重新写入
+                conn.executemany("DELETE FROM id_aliases WHERE id = ?", [(file_id,) for file_id in deleted_ids])
+            if records:
+                # 先删除路径冲突的旧登记，再写入
+                conn.executemany(
+                    "DELETE FROM track_ids WHERE full_path = ? AND id != ?",
+                    [(record[1], record[0]) for record in records]
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO track_ids (id, full_path, dev, inode, size, mtime_ns) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    records
+                )
+            if aliases:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO id_aliases (alias, id) VALUES (?, ?)",
+                    list(aliases.items())
+                )
+
+    def resolve_alias(self, alias: str) -> Optional[str]:
+        """根据旧ID查询当前ID"""
+        row = self._connect().execute("SELECT id FROM id_aliases WHERE alias = ?", (alias,)).fetchone()
+        return row[0] if row else None
+
+    def get_analysis_signatures(self) -> Dict[str, str]:
+        """获取所有已分析曲目的文件签名，用于跳过未变化的文件"""
+        rows = self._connect().execute("SELECT id, signature FROM analysis")
+        return {row[0]: row[1] for row in rows}
+
+    def save_analysis(self, results: List[Dict[str, Any]]) -> None:
+        """批量保存响度分析结果"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis (id, signature, integrated_lufs, peak, gain_db, analyzed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (r["id"], r["signature"], r["integrated_lufs"], r["peak"], r["gain_db"], time.time())
+                    for r in results
+                ]
+            )
+
+    def get_analysis(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """读取单个曲目的响度分析结果"""
+        row = self._connect().execute(
+            "SELECT integrated_lufs, peak, gain_db, analyzed_at FROM analysis WHERE id = ?", (file_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {"integrated_lufs": row[0], "peak": row[1], "gain_db": row[2], "analyzed_at": row[3]}
+
+    def get_analysis_batch(self, file_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量读取曲目的响度分析结果"""
+        conn = self._connect()
+        result = {}
+        file_ids = list(file_ids)
+        for start in range(0, len(file_ids), 500):
+            batch = file_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id, integrated_lufs, peak, gain_db, analyzed_at FROM analysis WHERE id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for row in rows:
+                result[row[0]] = {"integrated_lufs": row[1], "peak": row[2], "gain_db": row[3], "analyzed_at": row[4]}
+        return result
+
+    def get_gain_for_path(self, full_path: str) -> Optional[float]:
+        """根据文件路径读取回放增益（dB）"""
+        row = self._connect().execute(
+            "SELECT a.gain_db FROM analysis a JOIN tracks t ON a.id = t.id WHERE t.full_path = ?", (full_path,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_fingerprints(self, file_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量读取曲目的内容哈希和音频指纹"""
+        conn = self._connect()
+        result = {}
+        file_ids = list(file_ids)
+        # 分批查询，避免超出SQLite的参数数量限制
+        for start in range(0, len(file_ids), 500):
+            batch = file_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id, signature, payload_hash, fingerprint FROM fingerprints WHERE id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for row in rows:
+                result[row[0]] = {"signature": row[1], "payload_hash": row[2], "fingerprint": row[3]}
+        return result
+
+    def save_fingerprints(self, results: List[Dict[str, Any]]) -> None:
+        """批量保存内容哈希和音频指纹"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (id, signature, payload_hash, fingerprint) VALUES (?, ?, ?, ?)",
+                [(r["id"], r["signature"], r["payload_hash"], r["fingerprint"]) for r in results]
+            )
+
+    def request_job(self, job: str, **params) -> None:
+        """请求扫描进程执行后台任务（只读进程使用），同一任务尚未处理的请求被这次请求替换"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM job_requests WHERE job = ?", (job,))
+            conn.execute(
+                "INSERT INTO job_requests (job, params) VALUES (?, ?)",
+                (job, json.dumps(dict(params, time=time.time())))
+            )
+
+    def enqueue_job(self, job: str, **params) -> None:
+        """把后台任务加入扫描进程的队列（只读进程使用），每次请求都会执行，不与其他请求合并"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO job_requests (job, params) VALUES (?, ?)",
+                (job, json.dumps(dict(params, time=time.time())))
+            )
+
+    def pop_job_request(self, job: str) -> Optional[Dict[str, Any]]:
+        """取出最早的一个待处理的后台任务请求（扫描进程使用）"""
+        conn = self._connect()
+        with conn:
+            # 读取和删除在同一个写事务中，同一请求不会被取出两次
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT seq, params FROM job_requests WHERE job = ? ORDER BY seq LIMIT 1",
+                (job,)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute("DELETE FROM job_requests WHERE seq = ?", (row[0],))
+        return json.loads(row[1])
+
+    def request_scan(self, include_metadata: bool) -> None:
+        """请求扫描进程执行一次完整扫描（只读进程使用）"""
+        self.request_job("scan", include_metadata=include_metadata)
+
+    def pop_scan_request(self) -> Optional[Dict[str, Any]]:
+        """取出待处理的扫描请求（扫描进程使用）"""
+        return self.pop_job_request("scan")
+
+
+# 创建全局索引实例
+library_index = LibraryIndex()
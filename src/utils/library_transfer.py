@@ -0,0 +1,248 @@
+"""
+音乐库索引的导出与导入
+
+导出时在一个只读事务中逐行读取索引（曲目、路径登记与stat签名、ID别名、响度分析、音频指纹），
+由生成器逐条编码输出，内存占用与音乐库大小无关。支持两种格式：
+- ndjson：每行一个JSON对象
+- binary：每条记录为4字节大端长度加UTF-8编码的JSON
+
+导入时逐条解析，按批在一个事务中写入索引。导入完成后从索引重建快照，
+再在后台重新扫描，只需核对stat签名，未变化的文件直接沿用导入的元数据。
+"""
+
+import base64
+import json
+import struct
+import time
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+from src.utils.library_index import library_index
+
+# 导出格式版本
+EXPORT_FORMAT_VERSION = 1
+
+# 支持的格式及对应的媒体类型
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "binary": "application/octet-stream"
+}
+
+# 导出时每次从数据库读取的行数
+_FETCH_SIZE = 1000
+
+# 导出时每个输出块的目标大小（字节）
+_CHUNK_SIZE = 64 * 1024
+
+# 导入时每个事务写入的记录数
+IMPORT_BATCH_SIZE = 1000
+
+# 单条记录的长度上限，防止错误的数据导致分配过多内存
+_MAX_RECORD_SIZE = 64 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+def iter_export_records() -> Iterator[Dict[str, Any]]:
+    """逐条生成导出记录，第一条为header"""
+    conn = library_index.open_connection()
+    try:
+        # 在一个读事务中导出，得到一致的数据
+        conn.execute("BEGIN")
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('version', 'include_metadata')").fetchall())
+        yield {
+            "type": "header",
+            "format_version": EXPORT_FORMAT_VERSION,
+            "exported_at": time.time(),
+            "library_version": int(meta["version"]) if meta.get("version") else None,
+            "include_metadata": meta.get("include_metadata") == "1"
+        }
+
+        cursor = conn.execute("""
+            SELECT t.data, r.dev, r.inode, r.size, r.mtime_ns
+            FROM tracks t LEFT JOIN track_ids r ON r.id = t.id
+            ORDER BY t.add_time DESC
+        """)
+        for data, dev, inode, size, mtime_ns in _fetch(cursor):
+            yield {
+                "type": "track",
+                "track": json.loads(data),
+                "stat": {"dev": dev, "inode": inode, "size": size, "mtime_ns": mtime_ns} if size is not None else None
+            }
+
+        for alias, file_id in _fetch(conn.execute("SELECT alias, id FROM id_aliases")):
+            yield {"type": "alias", "alias": alias, "id": file_id}
+
+        cursor = conn.execute("SELECT id, signature, integrated_lufs, peak, gain_db, analyzed_at FROM analysis")
+        for file_id, signature, lufs, peak, gain_db, analyzed_at in _fetch(cursor):
+            yield {
+                "type": "analysis",
+                "id": file_id,
+                "signature": signature,
+                "integrated_lufs": lufs,
+                "peak": peak,
+                "gain_db": gain_db,
+                "analyzed_at": analyzed_at
+            }
+
+        cursor = conn.execute("SELECT id, signature, payload_hash, fingerprint FROM fingerprints")
+        for file_id, signature, payload_hash, fingerprint in _fetch(cursor):
+            yield {
+                "type": "fingerprint",
+                "id": file_id,
+                "signature": signature,
+                "payload_hash": payload_hash,
+                "fingerprint": base64.b64encode(fingerprint).decode("ascii") if fingerprint is not None else None
+            }
+    finally:
+        conn.close()
+
+def _fetch(cursor) -> Iterator[tuple]:
+    while True:
+        rows = cursor.fetchmany(_FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+def encode_records(records: Iterable[Dict[str, Any]], fmt: str) -> Iterator[bytes]:
+    """把记录编码为指定格式，合并成较大的块输出"""
+    buffer = []
+    size = 0
+    for record in records:
+        payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if fmt == "binary":
+            buffer.append(_LENGTH.pack(len(payload)))
+            buffer.append(payload)
+            size += len(payload) + _LENGTH.size
+        else:
+            buffer.append(payload)
+            buffer.append(b"\n")
+            size += len(payload) + 1
+        if size >= _CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+def decode_records(stream: BinaryIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    """从文件中逐条解析记录"""
+    if fmt == "binary":
+        while True:
+            prefix = stream.read(_LENGTH.size)
+            if not prefix:
+                return
+            if len(prefix) < _LENGTH.size:
+                raise ValueError("导入数据不完整")
+            (length,) = _LENGTH.unpack(prefix)
+            if length > _MAX_RECORD_SIZE:
+                raise ValueError(f"记录过大: {length}字节")
+            payload = stream.read(length)
+            if len(payload) < length:
+                raise ValueError("导入数据不完整")
+            yield json.loads(payload)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def import_records(records: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    把导出的记录写入索引，每batch_size条记录一个事务
+
+    Returns:
+        各类记录的导入数量
+    """
+    records = iter(records)
+    header = next(records, None)
+    if header is None or header.get("type") != "header":
+        raise ValueError("导入数据缺少header")
+    if header.get("format_version") != EXPORT_FORMAT_VERSION:
+        raise ValueError(f"不支持的导出格式版本: {header.get('format_version')}")
+
+    counts = {"tracks": 0, "aliases": 0, "analysis": 0, "fingerprints": 0, "skipped": 0}
+    batch = _new_batch()
+    pending = 0
+    for record in records:
+        kind = record.get("type")
+        if kind == "track":
+            track = record["track"]
+            batch["tracks"].append(track)
+            stat = record.get("stat")
+            if stat:
+                batch["track_id_rows"].append((
+                    track["id"], track["full_path"], stat.get("dev"), stat.get("inode"), stat.get("size"), stat.get("mtime_ns")
+                ))
+        elif kind == "alias":
+            batch["aliases"].append((record["alias"], record["id"]))
+        elif kind == "analysis":
+            batch["analysis_rows"].append((
+                record["id"], record["signature"], record.get("integrated_lufs"), record.get("peak"),
+                record.get("gain_db"), record.get("analyzed_at") or time.time()
+            ))
+        elif kind == "fingerprint":
+            fingerprint = record.get("fingerprint")
+            batch["fingerprint_rows"].append((
+                record["id"], record["signature"], record.get("payload_hash"),
+                base64.b64decode(fingerprint) if fingerprint else None
+            ))
+        else:
+            counts["skipped"] += 1
+            continue
+
+        pending += 1
+        if pending >= batch_size:
+            _flush(batch, counts)
+            batch = _new_batch()
+            pending = 0
+
+    _flush(batch, counts)
+
+    # 导入的曲目带有元数据时，索引随之标记为包含元数据
+    if header.get("include_metadata") and counts["tracks"]:
+        library_index.set_meta("include_metadata", "1")
+    return counts
+
+def _new_batch() -> Dict[str, list]:
+    return {"tracks": [], "track_id_rows": [], "aliases": [], "analysis_rows": [], "fingerprint_rows": []}
+
+def _flush(batch: Dict[str, list], counts: Dict[str, int]) -> None:
+    if not any(batch.values()):
+        return
+    library_index.import_batch(**batch)
+    counts["tracks"] += len(batch["tracks"])
+    counts["aliases"] += len(batch["aliases"])
+    counts["analysis"] += len(batch["analysis_rows"])
+    counts["fingerprints"] += len(batch["fingerprint_rows"])
+
+def import_library_file(path: str, fmt: str, rescan: bool = True) -> Dict[str, Any]:
+    """
+    从文件导入索引（扫描进程使用），完成后重建快照并在后台重新扫描核对
+
+    Args:
+        path: 导出文件路径
+        fmt: ndjson或binary
+        rescan: 是否在导入后重新扫描
+    """
+    from src.utils.async_scanner import scanner
+    from src.utils.file_utils import reload_from_index
+    from src.utils.track_ids import track_ids
+
+    with open(path, "rb") as f:
+        counts = import_records(decode_records(f, fmt))
+
+    # 内存中的ID登记和快照都以索引为准重新加载
+    track_ids.reload()
+    snapshot = reload_from_index()
+    counts["library_version"] = snapshot.version
+
+    if rescan:
+        scanner.start_scan(include_metadata=snapshot.include_metadata)
+    return counts
+
+def detect_format(content_type: Optional[str], fmt: Optional[str]) -> str:
+    """根据参数或Content-Type确定格式"""
+    if fmt:
+        return fmt
+    if content_type and content_type.split(";")[0].strip() == FORMATS["binary"]:
+        return "binary"
+    return "ndjson"
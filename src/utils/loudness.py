@@ -0,0 +1,177 @@
+"""
+响度分析工具（ITU-R BS.1770 / EBU R128）
+
+对解码后的PCM按400ms块（75%重叠）分帧，在频域中施加K加权，
+用NumPy一次性计算整个数据块的均方值，再按绝对门限和相对门限求综合响度。
+"""
+
+import math
+from typing import Dict, Any, List, Optional
+
+# ReplayGain 2.0 参考响度
+DEFAULT_TARGET_LUFS = -18.0
+
+# 每次从文件读取的帧数（以100ms为单位）
+_CHUNK_HOPS = 100
+
+def _biquad_power_response(b, a, w):
+    """计算双二阶滤波器在给定角频率上的功率响应"""
+    import numpy as np
+
+    z1 = np.exp(-1j * w)
+    z2 = z1 * z1
+    h = (b[0] + b[1] * z1 + b[2] * z2) / (a[0] + a[1] * z1 + a[2] * z2)
+    return np.abs(h) ** 2
+
+def k_weighting_power(num_bins: int, block_size: int, sample_rate: int):
+    """
+    计算K加权滤波器在rfft各频点上的功率响应
+
+    由高架滤波器（+4dB @1.5kHz）和高通滤波器（38Hz）级联而成，
+    系数按采样率从模拟原型计算，因此适用于任意采样率
+    """
+    import numpy as np
+
+    w = 2 * math.pi * np.arange(num_bins) / block_size
+
+    # 高架滤波器
+    gain_db, fc, q = 4.0, 1500.0, 1 / math.sqrt(2)
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    shelf_b = (
+        A * ((A + 1) + (A - 1) * cos_w0 + 2 * math.sqrt(A) * alpha),
+        -2 * A * ((A - 1) + (A + 1) * cos_w0),
+        A * ((A + 1) + (A - 1) * cos_w0 - 2 * math.sqrt(A) * alpha),
+    )
+    shelf_a = (
+        (A + 1) - (A - 1) * cos_w0 + 2 * math.sqrt(A) * alpha,
+        2 * ((A - 1) - (A + 1) * cos_w0),
+        (A + 1) - (A - 1) * cos_w0 - 2 * math.sqrt(A) * alpha,
+    )
+
+    # 高通滤波器
+    fc, q = 38.0, 0.5
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    hp_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    hp_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    return _biquad_power_response(shelf_b, shelf_a, w) * _biquad_power_response(hp_b, hp_a, w)
+
+def _channel_weights(channels: int) -> List[float]:
+    """
+    BS.1770的声道权重：左、右、中置为1.0，环绕声道为1.41
+
+    5.1（L, R, C, LFE, Ls, Rs）不计低音声道；5声道（L, R, C, Ls, Rs）的第4、5个声道为环绕
+    """
+    if channels == 6:
+        return [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    return [1.41 if 3 <= c <= 4 else 1.0 for c in range(channels)]
+
+def analyze_loudness(file_path: str, target_lufs: float = DEFAULT_TARGET_LUFS) -> Optional[Dict[str, Any]]:
+    """
+    分析音乐文件的综合响度和峰值
+
+    Args:
+        file_path: 音乐文件路径
+        target_lufs: 目标响度
+
+    Returns:
+        包含integrated_lufs、peak、gain_db的字典；无法解码时返回None
+    """
+    import numpy as np
+    import soundfile as sf
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    try:
+        info = sf.info(file_path)
+    except Exception as e:
+        print(f"无法解码音频文件: {file_path}, 错误: {str(e)}")
+        return None
+
+    sample_rate = info.samplerate
+    channels = info.channels
+    block = int(round(0.4 * sample_rate))
+    hop = int(round(0.1 * sample_rate))
+
+    channel_weights = np.array(_channel_weights(channels), dtype=np.float64)
+
+    num_bins = block // 2 + 1
+    # 单边谱的功率换算权重（直流和奈奎斯特频点只计一次）
+    bin_weights = np.full(num_bins, 2.0)
+    bin_weights[0] = 1.0
+    if block % 2 == 0:
+        bin_weights[-1] = 1.0
+    spectral_weights = k_weighting_power(num_bins, block, sample_rate) * bin_weights / (block * block)
+
+    block_powers = []
+    peak = 0.0
+    blocks = sf.blocks(
+        file_path,
+        blocksize=hop * _CHUNK_HOPS + (block - hop),
+        overlap=block - hop,
+        dtype="float32",
+        always_2d=True
+    )
+    for chunk in blocks:
+        if len(chunk) == 0:
+            continue
+        peak = max(peak, float(np.max(np.abs(chunk))))
+        if len(chunk) < block:
+            continue
+
+        # (帧数, 声道数, 块长度)
+        frames = sliding_window_view(chunk, block, axis=0)[::hop]
+        spectrum = np.fft.rfft(frames, axis=-1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2) @ spectral_weights
+        block_powers.append(power @ channel_weights)
+
+    if not block_powers:
+        return {"integrated_lufs": None, "peak": peak, "gain_db": 0.0}
+
+    powers = np.concatenate(block_powers)
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(powers)
+
+    # 绝对门限 -70 LUFS
+    gated = powers[loudness > -70.0]
+    if gated.size == 0:
+        return {"integrated_lufs": None, "peak": peak, "gain_db": 0.0}
+
+    # 相对门限：比绝对门限后的平均响度低10LU
+    relative_gate = -0.691 + 10 * math.log10(float(np.mean(gated))) - 10.0
+    gated = powers[loudness > max(relative_gate, -70.0)]
+    integrated = -0.691 + 10 * math.log10(float(np.mean(gated)))
+
+    gain_db = target_lufs - integrated
+    # 防止增益后削波
+    if peak > 0:
+        gain_db = min(gain_db, -20 * math.log10(peak))
+
+    return {
+        "integrated_lufs": round(integrated, 2),
+        "peak": round(peak, 6),
+        "gain_db": round(gain_db, 2)
+    }
+
+def analyze_track(task: tuple) -> Dict[str, Any]:
+    """
+    进程池任务：分析单个曲目
+
+    Args:
+        task: (曲目ID, 文件路径, 文件签名, 目标响度)
+    """
+    file_id, file_path, signature, target_lufs = task
+    try:
+        result = analyze_loudness(file_path, target_lufs)
+    except Exception as e:
+        print(f"分析响度时出错: {file_path}, 错误: {str(e)}")
+        result = None
+    
+    # 失败的结果也记录签名，文件未变化时不再重复分析
+    if result is None:
+        result = {"integrated_lufs": None, "peak": None, "gain_db": None}
+    return dict(result, id=file_id, signature=signature)
@@ -0,0 +1,352 @@
+"""
+歌词
+
+歌词来自与音频文件同名的.lrc文件（扫描时随目录遍历一起发现），或音频文件内嵌的歌词
+（ID3的SYLT/USLT帧、Vorbis注释的LYRICS标签）。解析后的歌词保存在lyrics表：
+各行文本以换行连接，同步歌词的时间（毫秒）保存为uint32数组。
+
+歌词全文另外写入FTS5全文索引（trigram分词，支持中文和任意位置的子串），可以按一句歌词搜索；
+SQLite不支持FTS5时退回到LIKE查询。音乐库变化时只重新读取变化的曲目。
+"""
+
+import re
+import threading
+from array import array
+from typing import List, Dict, Any, Optional, Tuple
+
+from src.utils.file_utils import register_change_listener
+from src.utils.library_index import library_index
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lyrics (
+    id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    source TEXT NOT NULL,
+    times BLOB,
+    text TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS lyrics_fts USING fts5(text, tokenize='trigram')"
+
+# trigram分词的全文索引只能匹配至少3个字符的查询
+_FTS_MIN_QUERY = 3
+
+# [mm:ss]、[mm:ss.xx]或[mm:ss:xx]时间标签
+_TIME_TAG = re.compile(r"\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]")
+# [ti:标题]、[offset:+500]等信息标签
+_INFO_TAG = re.compile(r"^\[([a-zA-Z#]+):(.*)\]\s*$")
+# 增强格式中的逐字时间 <mm:ss.xx>
+_WORD_TIME = re.compile(r"<\d+:\d{1,2}(?:[.:]\d{1,3})?>")
+
+# 歌词文件可能使用的编码
+_ENCODINGS = ("utf-8-sig", "gb18030", "utf-16")
+
+class Lyrics:
+    """解析后的歌词，times为None表示非同步歌词"""
+
+    __slots__ = ("lines", "times", "source", "signature")
+
+    def __init__(self, lines: List[str], times: Optional[array] = None, source: str = "sidecar", signature: str = ""):
+        self.lines = lines
+        self.times = times
+        self.source = source
+        self.signature = signature
+
+    @property
+    def synced(self) -> bool:
+        return self.times is not None
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.times is None:
+            lines = [{"time": None, "text": line} for line in self.lines]
+        else:
+            lines = [{"time": time / 1000, "text": line} for time, line in zip(self.times, self.lines)]
+        return {"source": self.source, "synced": self.synced, "lines": lines}
+
+def parse_lrc(content: str, source: str = "sidecar") -> Optional[Lyrics]:
+    """解析LRC格式的歌词；没有时间标签时作为非同步歌词，没有内容时返回None"""
+    offset = 0
+    timed: List[Tuple[int, str]] = []
+    plain: List[str] = []
+    for raw in content.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        info = _INFO_TAG.match(line)
+        if info and not _TIME_TAG.match(line):
+            if info.group(1).lower() == "offset":
+                try:
+                    offset = int(info.group(2).strip())
+                except ValueError:
+                    pass
+            continue
+
+        tags = []
+        while True:
+            match = _TIME_TAG.match(line)
+            if not match:
+                break
+            minutes, seconds, fraction = match.groups()
+            fraction_ms = int(fraction.ljust(3, "0")) if fraction else 0
+            tags.append((int(minutes) * 60 + int(seconds)) * 1000 + fraction_ms)
+            line = line[match.end():]
+        text = _WORD_TIME.sub("", line).strip()
+        if tags:
+            timed.extend((tag, text) for tag in tags)
+        else:
+            plain.append(text)
+
+    if timed:
+        # offset为正时歌词提前显示
+        timed.sort(key=lambda item: item[0])
+        times = array("I", (max(0, time - offset) for time, _ in timed))
+        return Lyrics([text for _, text in timed], times, source)
+    if plain:
+        return Lyrics(plain, None, source)
+    return None
+
+def read_lrc_file(path: str) -> Optional[Lyrics]:
+    """读取并解析歌词文件"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"读取歌词文件时出错: {path}, 错误: {str(e)}")
+        return None
+    for encoding in _ENCODINGS:
+        try:
+            return parse_lrc(data.decode(encoding))
+        except UnicodeDecodeError:
+            continue
+    return parse_lrc(data.decode("utf-8", errors="replace"))
+
+def read_embedded_lyrics(file_path: str) -> Optional[Lyrics]:
+    """读取音频文件内嵌的歌词，同步歌词（SYLT，毫秒时间）优先"""
+    import mutagen
+
+    try:
+        audio = mutagen.File(file_path)
+    except Exception as e:
+        print(f"读取内嵌歌词时出错: {file_path}, 错误: {str(e)}")
+        return None
+    if audio is None or not audio.tags:
+        return None
+
+    tags = audio.tags
+    if hasattr(tags, "getall"):
+        # ID3
+        for frame in tags.getall("SYLT"):
+            if frame.format == 2 and frame.text:
+                entries = sorted((time, text.strip()) for text, time in frame.text)
+                return Lyrics([text for _, text in entries], array("I", (time for time, _ in entries)), "embedded")
+        for frame in tags.getall("USLT"):
+            if frame.text and frame.text.strip():
+                return parse_lrc(frame.text, "embedded")
+        return None
+
+    # Vorbis注释（FLAC、OGG）中的歌词也可能是LRC格式
+    for key in ("lyrics", "unsyncedlyrics"):
+        try:
+            values = tags.get(key)
+        except Exception:
+            values = None
+        if values:
+            content = values[0] if isinstance(values, list) else str(values)
+            if content.strip():
+                return parse_lrc(content, "embedded")
+    return None
+
+def lyrics_source(file: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+    """
+    曲目的歌词来源：(来源, 文件路径, 签名)，歌词文件优先；没有歌词时返回None
+
+    签名随歌词文件或音频文件的变化而变化，用于判断保存的歌词是否需要重新读取
+    """
+    if file.get("lyrics_path"):
+        return "sidecar", file["lyrics_path"], f"sidecar:{file['lyrics_path']}:{file.get('lyrics_mtime')}"
+    if (file.get("metadata") or {}).get("has_lyrics"):
+        return "embedded", file["full_path"], f"embedded:{file['size']}:{file.get('mtime')}"
+    return None
+
+def _load(source: str, path: str, signature: str) -> Optional[Lyrics]:
+    lyrics = read_lrc_file(path) if source == "sidecar" else read_embedded_lyrics(path)
+    if lyrics is not None:
+        lyrics.signature = signature
+    return lyrics
+
+class LyricsIndex:
+    """保存解析后的歌词和歌词全文索引"""
+
+    def __init__(self):
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self.fts_enabled = False
+
+    def _connect(self):
+        conn = library_index.connection()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    try:
+                        conn.execute(_FTS_SCHEMA)
+                        self.fts_enabled = True
+                    except Exception as e:
+                        print(f"SQLite不支持FTS5 trigram分词，歌词搜索使用LIKE查询: {str(e)}")
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    def apply_library_changes(self, snapshot, added: List[str], removed: List[str], updated: List[str]) -> None:
+        """根据变化的曲目增量更新歌词（只重新读取签名变化的曲目）"""
+        with self._update_lock:
+            conn = self._connect()
+
+            removed_ids = list(removed)
+            if len(added) == len(snapshot.files):
+                # 首次发布快照（如进程重启），清理离线期间已删除的曲目
+                rows = conn.execute("SELECT id FROM lyrics")
+                removed_ids.extend(row[0] for row in rows if row[0] not in snapshot.by_id)
+
+            changed_ids = added + updated
+            existing = self._load_signatures(conn, changed_ids + removed_ids)
+
+            upserts: List[Tuple[str, Lyrics]] = []
+            deletes = [file_id for file_id in removed_ids if file_id in existing]
+            for file_id in changed_ids:
+                source = lyrics_source(snapshot.by_id[file_id])
+                stored = existing.get(file_id)
+                if source is None:
+                    if stored is not None:
+                        deletes.append(file_id)
+                    continue
+                if stored is not None and stored[1] == source[2]:
+                    continue
+                lyrics = _load(*source)
+                if lyrics is not None:
+                    upserts.append((file_id, lyrics))
+                elif stored is not None:
+                    deletes.append(file_id)
+
+            if not upserts and not deletes:
+                return
+
+            with conn:
+                for file_id in deletes:
+                    rowid = existing[file_id][0]
+                    conn.execute("DELETE FROM lyrics WHERE rowid = ?", (rowid,))
+                    if self.fts_enabled:
+                        conn.execute("DELETE FROM lyrics_fts WHERE rowid = ?", (rowid,))
+                for file_id, lyrics in upserts:
+                    times = lyrics.times.tobytes() if lyrics.times is not None else None
+                    stored = existing.get(file_id)
+                    if stored is not None:
+                        rowid = stored[0]
+                        conn.execute(
+                            "UPDATE lyrics SET signature = ?, source = ?, times = ?, text = ? WHERE rowid = ?",
+                            (lyrics.signature, lyrics.source, times, lyrics.text, rowid)
+                        )
+                        if self.fts_enabled:
+                            conn.execute("DELETE FROM lyrics_fts WHERE rowid = ?", (rowid,))
+                    else:
+                        rowid = conn.execute(
+                            "INSERT INTO lyrics (id, signature, source, times, text) VALUES (?, ?, ?, ?, ?)",
+                            (file_id, lyrics.signature, lyrics.source, times, lyrics.text)
+                        ).lastrowid
+                    if self.fts_enabled:
+                        conn.execute("INSERT INTO lyrics_fts (rowid, text) VALUES (?, ?)", (rowid, lyrics.text))
+
+    @staticmethod
+    def _load_signatures(conn, file_ids: List[str]) -> Dict[str, Tuple[int, str]]:
+        """ID -> (rowid, 签名)"""
+        result = {}
+        for start in range(0, len(file_ids), 500):
+            batch = file_ids[start:start + 500]
+            cursor = conn.execute(
+                f"SELECT id, rowid, signature FROM lyrics WHERE id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for file_id, rowid, signature in cursor:
+                result[file_id] = (rowid, signature)
+        return result
+
+    def get_lyrics(self, file: Dict[str, Any]) -> Optional[Lyrics]:
+        """
+        获取曲目的歌词，优先使用已保存的解析结果
+
+        扫描结果不含元数据时不知道是否有内嵌歌词，直接读取音频文件的标签
+        """
+        source = lyrics_source(file)
+        if source is None:
+            if "metadata" in file:
+                return None
+            lyrics = read_embedded_lyrics(file["full_path"])
+            if lyrics is not None:
+                lyrics.signature = f"embedded:{file['size']}:{file.get('mtime')}"
+            return lyrics
+
+        row = self._connect().execute(
+            "SELECT signature, source, times, text FROM lyrics WHERE id = ?", (file["id"],)
+        ).fetchone()
+        if row is not None and row[0] == source[2]:
+            times = None
+            if row[2] is not None:
+                times = array("I")
+                times.frombytes(row[2])
+            return Lyrics(row[3].split("\n"), times, row[1], row[0])
+
+        # 还没有保存（如扫描后歌词文件刚被修改），直接读取；由扫描进程在下次扫描时保存
+        return _load(*source)
+
+    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        按一句歌词搜索（忽略大小写和多余空白）
+
+        Returns:
+            [{"id", "line": 匹配的行号, "text": 该行歌词, "time": 该行开始时间（秒，非同步歌词为None）}]
+        """
+        query = " ".join(query.split())
+        if not query:
+            return []
+
+        conn = self._connect()
+        if self.fts_enabled and len(query) >= _FTS_MIN_QUERY:
+            rows = conn.execute(
+                "SELECT l.id, l.times, l.text FROM lyrics_fts f JOIN lyrics l ON l.rowid = f.rowid "
+                "WHERE lyrics_fts MATCH ? LIMIT ?",
+                ('"' + query.replace('"', '""') + '"', limit)
+            )
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            rows = conn.execute(
+                "SELECT id, times, text FROM lyrics WHERE text LIKE ? ESCAPE '\\' LIMIT ?",
+                (pattern, limit)
+            )
+
+        folded = query.casefold()
+        results = []
+        for file_id, times_blob, text in rows:
+            lines = text.split("\n")
+            index = next((i for i, line in enumerate(lines) if folded in " ".join(line.split()).casefold()), None)
+            if index is None:
+                # 查询跨越了多行，取第一行
+                index = 0
+            time = None
+            if times_blob is not None:
+                times = array("I")
+                times.frombytes(times_blob)
+                time = times[index] / 1000
+            results.append({"id": file_id, "line": index, "text": lines[index], "time": time})
+        return results
+
+# 创建全局歌词索引实例
+lyrics_index = LyricsIndex()
+
+# 音乐库变化时增量更新歌词
+register_change_listener(lyrics_index.apply_library_changes)
@@ -3,13 +3,52 @@
 """
 
 import os
-from typing import Dict, Any, Optional
-import mutagen
-from mutagen.id3 import ID3
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
-from mutagen.oggvorbis import OggVorbis
-from mutagen.wavpack import WavPack
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Optional
+
+# mutagen在首次提取元数据时才导入，加快服务启动
+
+# 最近提取的元数据：文件路径 -> ((大小, 修改时间), 元数据)，文件变化后自动失效
+_METADATA_CACHE_SIZE = 4096
+_metadata_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_metadata_cache_lock = threading.Lock()
+
+def get_cached_metadata(file_path: str) -> Dict[str, Any]:
+    """提取元数据，文件大小和修改时间未变时使用缓存的结果"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return {}
+    signature = (stat.st_size, stat.st_mtime_ns)
+    
+    with _metadata_cache_lock:
+        cached = _metadata_cache.get(file_path)
+        if cached is not None and cached[0] == signature:
+            _metadata_cache.move_to_end(file_path)
+            return cached[1]
+    
+    metadata = extract_metadata(file_path)
+    with _metadata_cache_lock:
+        _metadata_cache[file_path] = (signature, metadata)
+        _metadata_cache.move_to_end(file_path)
+        while len(_metadata_cache) > _METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return metadata
+
+def extract_metadata_batch(file_paths: Iterable[str], max_workers: int = 8) -> Dict[str, Dict[str, Any]]:
+    """
+    并行提取多个文件的元数据（读取文件主要等待I/O，使用线程池）
+    
+    Returns:
+        文件路径 -> 元数据
+    """
+    file_paths = list(dict.fromkeys(file_paths))
+    if len(file_paths) <= 1:
+        return {file_path: get_cached_metadata(file_path) for file_path in file_paths}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_paths))) as executor:
+        return dict(zip(file_paths, executor.map(get_cached_metadata, file_paths)))
 
 def extract_metadata(file_path: str) -> Dict[str, Any]:
     """
@@ -36,6 +75,7 @@ def extract_metadata(file_path: str) -> Dict[str, Any]:
             "duration": None,
             "bitrate": None,
             "sample_rate": None,
+            "has_lyrics": False,  # 是否有内嵌歌词（USLT/SYLT帧或LYRICS标签）
         }
         
         # 根据文件类型选择处理方法
@@ -59,6 +99,9 @@ def extract_metadata(file_path: str) -> Dict[str, Any]:
 
 def extract_mp3_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
     """提取MP3文件元数据"""
+    from mutagen.id3 import ID3
+    from mutagen.mp3 import MP3
+    
     try:
         audio = MP3(file_path)
         id3 = ID3(file_path)
@@ -81,6 +124,7 @@ def extract_mp3_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
             metadata["track"] = str(id3['TRCK'])
         if 'TCON' in id3:  # 流派
             metadata["genre"] = str(id3['TCON'])
+        metadata["has_lyrics"] = _has_lyrics_tag(id3.keys())
         
         return metadata
     except Exception:
@@ -88,6 +132,8 @@ def extract_mp3_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
 
 def extract_flac_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
     """提取FLAC文件元数据"""
+    from mutagen.flac import FLAC
+    
     try:
         audio = FLAC(file_path)
         
@@ -109,6 +155,7 @@ def extract_flac_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
             metadata["track"] = str(audio['tracknumber'][0]) if audio['tracknumber'] else None
         if 'genre' in audio:
             metadata["genre"] = str(audio['genre'][0]) if audio['genre'] else None
+        metadata["has_lyrics"] = _has_lyrics_tag(audio.keys())
         
         return metadata
     except Exception:
@@ -116,6 +163,8 @@ def extract_flac_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
 
 def extract_ogg_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
     """提取OGG文件元数据"""
+    from mutagen.oggvorbis import OggVorbis
+    
     try:
         audio = OggVorbis(file_path)
         
@@ -137,6 +186,7 @@ def extract_ogg_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
             metadata["track"] = str(audio['tracknumber'][0]) if audio['tracknumber'] else None
         if 'genre' in audio:
             metadata["genre"] = str(audio['genre'][0]) if audio['genre'] else None
+        metadata["has_lyrics"] = _has_lyrics_tag(audio.keys())
         
         return metadata
     except Exception:
@@ -144,6 +194,8 @@ def extract_ogg_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
 
 def extract_wav_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
     """提取WAV文件元数据"""
+    import mutagen
+    
     try:
         audio = mutagen.File(file_path)
         
@@ -154,6 +206,8 @@ def extract_wav_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
             metadata["bitrate"] = audio.info.bitrate // 1000 if audio.info.bitrate else None
         if audio and hasattr(audio.info, 'sample_rate'):
             metadata["sample_rate"] = audio.info.sample_rate
+        if audio and audio.tags:
+            metadata["has_lyrics"] = _has_lyrics_tag(audio.tags.keys())
         
         return metadata
     except Exception:
@@ -161,6 +215,8 @@ def extract_wav_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str,
 
 def extract_generic_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
     """使用通用方法提取元数据"""
+    import mutagen
+    
     try:
         audio = mutagen.File(file_path)
         
@@ -182,11 +238,20 @@ def extract_generic_metadata(file_path: str, metadata: Dict[str, Any]) -> Dict[s
                     metadata["artist"] = str(tags['artist'][0]) if isinstance(tags['artist'], list) else str(tags['artist'])
                 if 'album' in tags:
                     metadata["album"] = str(tags['album'][0]) if isinstance(tags['album'], list) else str(tags['album'])
+                metadata["has_lyrics"] = _has_lyrics_tag(tags.keys())
         
         return metadata
     except Exception:
         return metadata
 
+def _has_lyrics_tag(keys) -> bool:
+    """标签中是否有歌词：ID3的USLT/SYLT帧（键形如USLT::eng），或Vorbis注释的LYRICS/UNSYNCEDLYRICS"""
+    for key in keys:
+        key = str(key)
+        if key.startswith(("USLT", "SYLT")) or key.lower() in ("lyrics", "unsyncedlyrics"):
+            return True
+    return False
+
 def format_duration(seconds: Optional[int]) -> str:
     """
     将秒数格式化为mm:ss格式
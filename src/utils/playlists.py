@@ -0,0 +1,320 @@
+"""
+播放列表与播放历史
+
+保存在音乐库索引数据库中：普通播放列表按位置保存曲目ID；智能播放列表保存筛选规则，
+符合规则的曲目物化到smart_playlist_items表，音乐库变化时只对变化的曲目重新判断。
+播放记录只追加，同时维护按曲目汇总的播放次数，用于“最常播放”“最近播放”查询。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterable
+
+from src.utils.file_utils import get_library_snapshot, register_change_listener
+from src.utils.library_index import library_index
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    rule TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_items (
+    playlist_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    track_id TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_playlist_items_track ON playlist_items(track_id);
+CREATE TABLE IF NOT EXISTS smart_playlist_items (
+    playlist_id INTEGER NOT NULL,
+    track_id TEXT NOT NULL,
+    PRIMARY KEY (playlist_id, track_id)
+);
+CREATE TABLE IF NOT EXISTS play_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    track_id TEXT NOT NULL,
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_play_log_played_at ON play_log(played_at);
+CREATE INDEX IF NOT EXISTS idx_play_log_track ON play_log(track_id);
+CREATE TABLE IF NOT EXISTS play_stats (
+    track_id TEXT PRIMARY KEY,
+    play_count INTEGER NOT NULL,
+    last_played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_play_stats_count ON play_stats(play_count DESC, last_played DESC);
+CREATE INDEX IF NOT EXISTS idx_play_stats_last ON play_stats(last_played DESC);
+"""
+
+# 智能播放列表规则支持的字段
+RULE_FIELDS = ("query", "artist", "album", "genre", "year", "min_duration", "max_duration")
+
+def normalize_rule(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留支持的非空字段，文本字段统一为小写"""
+    normalized = {}
+    for field in RULE_FIELDS:
+        value = rule.get(field)
+        if value is None or value == "":
+            continue
+        if field in ("min_duration", "max_duration"):
+            normalized[field] = int(value)
+        else:
+            normalized[field] = str(value).lower().strip()
+    return normalized
+
+def matches_rule(file: Dict[str, Any], rule: Dict[str, Any]) -> bool:
+    """判断曲目是否符合智能播放列表规则（与搜索、筛选接口的匹配方式一致）"""
+    metadata = file.get("metadata") or {}
+
+    query = rule.get("query")
+    if query:
+        fields = [file["name"], metadata.get("title"), metadata.get("artist"), metadata.get("album"), metadata.get("genre")]
+        if not any(value and query in value.lower() for value in fields):
+            return False
+
+    for field in ("artist", "album", "genre", "year"):
+        expected = rule.get(field)
+        if expected and not (metadata.get(field) and expected in str(metadata[field]).lower()):
+            return False
+
+    duration = metadata.get("duration")
+    if rule.get("min_duration") is not None and not (duration and duration >= rule["min_duration"]):
+        return False
+    if rule.get("max_duration") is not None and not (duration and duration <= rule["max_duration"]):
+        return False
+    return True
+
+class PlaylistStore:
+    """播放列表与播放历史存储"""
+
+    def __init__(self):
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = library_index.connection()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    # ---- 播放列表 ----
+
+    def list_playlists(self) -> List[Dict[str, Any]]:
+        """获取所有播放列表及曲目数量"""
+        rows = self._connect().execute("""
+            SELECT p.id, p.name, p.rule, p.created_at, p.updated_at,
+                   CASE WHEN p.rule IS NULL
+                        THEN (SELECT COUNT(*) FROM playlist_items i WHERE i.playlist_id = p.id)
+                        ELSE (SELECT COUNT(*) FROM smart_playlist_items s WHERE s.playlist_id = p.id)
+                   END
+            FROM playlists p ORDER BY p.name
+        """)
+        return [self._playlist_row(row) for row in rows]
+
+    def get_playlist(self, playlist_id: int) -> Optional[Dict[str, Any]]:
+        """获取播放列表信息（不含曲目）"""
+        row = self._connect().execute(
+            "SELECT id, name, rule, created_at, updated_at, NULL FROM playlists WHERE id = ?", (playlist_id,)
+        ).fetchone()
+        return self._playlist_row(row) if row else None
+
+    @staticmethod
+    def _playlist_row(row: tuple) -> Dict[str, Any]:
+        rule = json.loads(row[2]) if row[2] else None
+        result = {
+            "id": row[0],
+            "name": row[1],
+            "smart": rule is not None,
+            "rule": rule,
+            "created_at": row[3],
+            "updated_at": row[4]
+        }
+        if row[5] is not None:
+            result["count"] = row[5]
+        return result
+
+    def create_playlist(self, name: str, track_ids: Iterable[str] = (), rule: Optional[Dict[str, Any]] = None) -> int:
+        """
+        创建播放列表
+
+        Args:
+            name: 名称（唯一）
+            track_ids: 普通播放列表的初始曲目
+            rule: 智能播放列表的筛选规则；提供时忽略track_ids
+
+        Raises:
+            ValueError: 名称已存在
+        """
+        conn = self._connect()
+        now = time.time()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO playlists (name, rule, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (name, json.dumps(rule, ensure_ascii=False) if rule is not None else None, now, now)
+                )
+                playlist_id = cursor.lastrowid
+                if rule is None:
+                    self._write_items(conn, playlist_id, list(track_ids))
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"播放列表已存在: {name}") from e
+
+        if rule is not None:
+            self.rebuild_smart_playlist(playlist_id, rule)
+        return playlist_id
+
+    def update_playlist(self, playlist_id: int, name: Optional[str] = None, rule: Optional[Dict[str, Any]] = None) -> None:
+        """重命名播放列表，或修改智能播放列表的规则（会重新计算曲目）"""
+        conn = self._connect()
+        try:
+            with conn:
+                if name is not None:
+                    conn.execute("UPDATE playlists SET name = ? WHERE id = ?", (name, playlist_id))
+                if rule is not None:
+                    conn.execute(
+                        "UPDATE playlists SET rule = ? WHERE id = ?",
+                        (json.dumps(rule, ensure_ascii=False), playlist_id)
+                    )
+                conn.execute("UPDATE playlists SET updated_at = ? WHERE id = ?", (time.time(), playlist_id))
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"播放列表已存在: {name}") from e
+
+        if rule is not None:
+            self.rebuild_smart_playlist(playlist_id, rule)
+
+    def delete_playlist(self, playlist_id: int) -> None:
+        """删除播放列表"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (playlist_id,))
+            conn.execute("DELETE FROM smart_playlist_items WHERE playlist_id = ?", (playlist_id,))
+            conn.execute("DELETE FROM playlists WHERE id = ?", (playlist_id,))
+
+    def get_track_ids(self, playlist_id: int, smart: bool, limit: int = -1, offset: int = 0) -> List[str]:
+        """
+        获取播放列表中的曲目ID
+
+        普通播放列表按位置排列，智能播放列表按添加时间倒序
+        """
+        conn = self._connect()
+        if smart:
+            rows = conn.execute("""
+                SELECT s.track_id FROM smart_playlist_items s JOIN tracks t ON t.id = s.track_id
+                WHERE s.playlist_id = ? ORDER BY t.add_time DESC LIMIT ? OFFSET ?
+            """, (playlist_id, limit, offset))
+        else:
+            rows = conn.execute(
+                "SELECT track_id FROM playlist_items WHERE playlist_id = ? ORDER BY position LIMIT ? OFFSET ?",
+                (playlist_id, limit, offset)
+            )
+        return [row[0] for row in rows]
+
+    def set_items(self, playlist_id: int, track_ids: List[str]) -> None:
+        """整体替换普通播放列表的曲目"""
+        conn = self._connect()
+        with conn:
+            self._write_items(conn, playlist_id, track_ids)
+            conn.execute("UPDATE playlists SET updated_at = ? WHERE id = ?", (time.time(), playlist_id))
+
+    @staticmethod
+    def _write_items(conn, playlist_id: int, track_ids: List[str]) -> None:
+        conn.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (playlist_id,))
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO playlist_items (playlist_id, position, track_id, added_at) VALUES (?, ?, ?, ?)",
+            [(playlist_id, position, track_id, now) for position, track_id in enumerate(track_ids)]
+        )
+
+    # ---- 智能播放列表 ----
+
+    def _smart_playlists(self) -> List[tuple]:
+        rows = self._connect().execute("SELECT id, rule FROM playlists WHERE rule IS NOT NULL")
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def rebuild_smart_playlist(self, playlist_id: int, rule: Dict[str, Any]) -> None:
+        """
+        对当前快照中的全部曲目重新计算智能播放列表（只在创建或修改规则时执行）
+
+        快照过期时不等待扫描，后台重新扫描后的变化由apply_library_changes更新；还没有元数据时等待扫描
+        """
+        files = get_library_snapshot(include_metadata=True).files
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM smart_playlist_items WHERE playlist_id = ?", (playlist_id,))
+            conn.executemany(
+                "INSERT INTO smart_playlist_items (playlist_id, track_id) VALUES (?, ?)",
+                [(playlist_id, file["id"]) for file in files if matches_rule(file, rule)]
+            )
+
+    def apply_library_changes(self, snapshot, added: List[str], removed: List[str], updated: List[str]) -> None:
+        """音乐库变化时，只对新增、更新的曲目重新判断规则，并移除已删除的曲目"""
+        playlists = self._smart_playlists()
+        if not playlists:
+            return
+
+        # 不含元数据的快照无法判断规则，只处理删除
+        changed = [snapshot.by_id[file_id] for file_id in added + updated] if snapshot.include_metadata else []
+        inserts, deletes = [], [(playlist_id, file_id) for playlist_id, _ in playlists for file_id in removed]
+        for playlist_id, rule in playlists:
+            for file in changed:
+                (inserts if matches_rule(file, rule) else deletes).append((playlist_id, file["id"]))
+
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM smart_playlist_items WHERE playlist_id = ? AND track_id = ?", deletes)
+            conn.executemany(
+                "INSERT OR IGNORE INTO smart_playlist_items (playlist_id, track_id) VALUES (?, ?)", inserts
+            )
+
+    # ---- 播放历史 ----
+
+    def log_play(self, track_id: str, played_at: Optional[float] = None) -> None:
+        """追加一条播放记录，并更新该曲目的播放次数"""
+        played_at = played_at or time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT INTO play_log (track_id, played_at) VALUES (?, ?)", (track_id, played_at))
+            conn.execute("""
+                INSERT INTO play_stats (track_id, play_count, last_played) VALUES (?, 1, ?)
+                ON CONFLICT(track_id) DO UPDATE SET play_count = play_count + 1, last_played = excluded.last_played
+            """, (track_id, played_at))
+
+    def get_history(self, limit: int, before: Optional[float] = None) -> List[Dict[str, Any]]:
+        """按时间倒序获取播放记录，before用于翻页"""
+        rows = self._connect().execute(
+            "SELECT track_id, played_at FROM play_log WHERE played_at < ? ORDER BY played_at DESC LIMIT ?",
+            (before if before is not None else float("inf"), limit)
+        )
+        return [{"track_id": row[0], "played_at": row[1]} for row in rows]
+
+    def most_played(self, limit: int) -> List[Dict[str, Any]]:
+        """播放次数最多的曲目"""
+        rows = self._connect().execute(
+            "SELECT track_id, play_count, last_played FROM play_stats "
+            "ORDER BY play_count DESC, last_played DESC LIMIT ?",
+            (limit,)
+        )
+        return [{"track_id": row[0], "play_count": row[1], "last_played": row[2]} for row in rows]
+
+    def recently_played(self, limit: int) -> List[Dict[str, Any]]:
+        """最近播放过的曲目（每首只出现一次）"""
+        rows = self._connect().execute(
+            "SELECT track_id, play_count, last_played FROM play_stats ORDER BY last_played DESC LIMIT ?",
+            (limit,)
+        )
+        return [{"track_id": row[0], "play_count": row[1], "last_played": row[2]} for row in rows]
+
+
+# 创建全局存储实例，并在音乐库变化时增量更新智能播放列表
+playlist_store = PlaylistStore()
+register_change_listener(playlist_store.apply_library_changes)
@@ -0,0 +1,277 @@
+"""
+本地预读缓存
+
+音乐库位于SMB/NFS等网络存储时，把即将播放的曲目预先复制到本地磁盘，
+播放器和文件访问都优先读取本地副本。缓存文件名由源路径、大小和修改时间计算，
+源文件变化后旧副本自然失效，按最近使用顺序淘汰。
+
+列表中可见的曲目只缓存开头部分（.head文件），播放开头的Range请求由本地片段响应。
+多进程部署时各进程共用缓存目录：内存中没有记录的文件会到目录中查找，
+使用时更新文件的修改时间，淘汰前重新统计目录，容量上限和最近使用顺序由所有进程共享。
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from src.config.settings import (
+    READ_CACHE_DIR,
+    READ_CACHE_SIZE_MB,
+    PREFETCH_HEAD_MB
+)
+
+# 只缓存开头部分的文件后缀
+HEAD_SUFFIX = ".head"
+
+# 临时文件超过这个时间（秒）没有写入，视为中断的复制；更新的临时文件可能是其他进程正在写入的
+_STALE_PART_SECONDS = 600
+
+class ReadAheadCache:
+    """带容量上限和LRU淘汰的本地预读缓存"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, head_bytes: int, max_workers: int = 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.head_bytes = head_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # 缓存文件名 -> 大小，按最近使用排序
+        self._total_bytes = 0
+        self._in_progress = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+        self._loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用了本地缓存"""
+        return bool(self.cache_dir) and self.max_bytes > 0
+
+    def _ensure_loaded(self) -> None:
+        """首次使用时读取缓存目录中已有的文件"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._sync()
+            self._loaded = True
+
+    def _sync(self) -> None:
+        """按缓存目录重建记录，包括其他进程写入的文件，按修改时间（最近使用时间）排序（调用方需持有锁）"""
+        existing = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            local_path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(local_path)
+            except OSError:
+                continue
+            if name.endswith(".part"):
+                # 中断的复制
+                if now - stat.st_mtime > _STALE_PART_SECONDS:
+                    try:
+                        os.remove(local_path)
+                    except OSError:
+                        pass
+                continue
+            existing.append((stat.st_mtime, name, stat.st_size))
+
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(existing))
+        self._total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def _cache_key(file_path: str) -> Optional[str]:
+        """根据源文件路径、大小和修改时间计算缓存键"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        key = f"{file_path}|{stat.st_size}|{stat.st_mtime_ns}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _cache_name(cls, file_path: str) -> Optional[str]:
+        """完整副本的缓存文件名"""
+        key = cls._cache_key(file_path)
+        return key + os.path.splitext(file_path)[1] if key is not None else None
+
+    def _lookup(self, name: str) -> Optional[str]:
+        """查找缓存文件并标记为最近使用，返回本地路径；内存中没有记录时到目录中查找（可能由其他进程写入）"""
+        local_path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            else:
+                try:
+                    size = os.path.getsize(local_path)
+                except OSError:
+                    return None
+                self._entries[name] = size
+                self._total_bytes += size
+
+        try:
+            os.utime(local_path)
+        except OSError:
+            # 副本已被删除（可能被其他进程淘汰）
+            with self._lock:
+                size = self._entries.pop(name, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+        return local_path
+
+    def resolve(self, file_path: str) -> str:
+        """返回可读取的路径：已缓存时返回本地副本，否则返回原路径"""
+        if not self.enabled:
+            return file_path
+
+        self._ensure_loaded()
+        name = self._cache_name(file_path)
+        if name is None:
+            return file_path
+        return self._lookup(name) or file_path
+
+    def resolve_head(self, file_path: str) -> Optional[str]:
+        """返回已缓存的文件开头部分的本地路径，没有时返回None"""
+        if not self.enabled or self.head_bytes <= 0:
+            return None
+
+        self._ensure_loaded()
+        key = self._cache_key(file_path)
+        if key is None:
+            return None
+        return self._lookup(key + HEAD_SUFFIX)
+
+    def prefetch(self, file_paths: Iterable[str]) -> None:
+        """在后台把整个文件复制到本地缓存（用于播放队列中的后续曲目）"""
+        if not self.enabled:
+            return
+        for file_path in file_paths:
+            self._submit(self._copy_to_cache, file_path)
+
+    def prefetch_head(self, file_paths: Iterable[str]) -> None:
+        """在后台把文件开头部分复制到本地缓存（用于当前列表中可见的曲目）"""
+        if not self.enabled or self.head_bytes <= 0:
+            return
+        for file_path in file_paths:
+            self._submit(self._copy_head, file_path)
+
+    def _submit(self, func, file_path: str) -> None:
+        with self._lock:
+            key = (func.__name__, file_path)
+            if key in self._in_progress:
+                return
+            self._in_progress.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="read-ahead")
+        self._executor.submit(self._run, func, file_path, key)
+
+    def _run(self, func, file_path: str, key: tuple) -> None:
+        try:
+            func(file_path)
+        except Exception as e:
+            print(f"预读文件时出错: {file_path}, 错误: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_progress.discard(key)
+
+    def _copy_head(self, file_path: str) -> None:
+        self._ensure_loaded()
+        key = self._cache_key(file_path)
+        if key is None:
+            return
+        if os.path.getsize(file_path) <= self.head_bytes:
+            # 文件不比开头部分大，直接缓存完整副本
+            self._copy_to_cache(file_path)
+            return
+
+        name = key + HEAD_SUFFIX
+        if self._lookup(key + os.path.splitext(file_path)[1]) is not None or self._lookup(name) is not None:
+            return
+
+        temp_path = self._temp_path(name)
+        with open(file_path, "rb") as source, open(temp_path, "wb") as target:
+            remaining = self.head_bytes
+            while remaining > 0:
+                chunk = source.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                target.write(chunk)
+                remaining -= len(chunk)
+        os.replace(temp_path, os.path.join(self.cache_dir, name))
+        self._refresh_usage()
+
+    def _copy_to_cache(self, file_path: str) -> None:
+        self._ensure_loaded()
+        name = self._cache_name(file_path)
+        if name is None or self._lookup(name) is not None:
+            return
+
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return
+
+        # 先复制到临时文件，完成后原子替换，读取方不会看到不完整的副本
+        temp_path = self._temp_path(name)
+        shutil.copyfile(file_path, temp_path)
+        os.replace(temp_path, os.path.join(self.cache_dir, name))
+
+        # 已有完整副本，不再需要开头部分
+        try:
+            os.remove(os.path.join(self.cache_dir, os.path.splitext(name)[0] + HEAD_SUFFIX))
+        except OSError:
+            pass
+        self._refresh_usage()
+
+    def _temp_path(self, name: str) -> str:
+        """复制用的临时文件，各进程、线程使用不同的文件"""
+        return os.path.join(self.cache_dir, f"{name}.{os.getpid()}-{threading.get_ident()}.part")
+
+    def _refresh_usage(self) -> None:
+        """写入缓存文件后重新统计整个目录（包括其他进程写入的文件），超过容量时淘汰"""
+        with self._lock:
+            self._sync()
+            self._evict()
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的副本直到不超过容量（调用方需持有锁）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                # 已被其他进程淘汰
+                pass
+            except OSError as e:
+                print(f"删除缓存文件时出错: {name}, 错误: {str(e)}")
+
+    def get_status(self) -> dict:
+        """获取缓存状态（统计整个缓存目录，包括其他进程写入的文件）"""
+        if self.enabled:
+            self._ensure_loaded()
+        with self._lock:
+            if self.enabled:
+                self._sync()
+            return {
+                "enabled": self.enabled,
+                "files": sum(1 for name in self._entries if not name.endswith(HEAD_SUFFIX)),
+                "head_files": sum(1 for name in self._entries if name.endswith(HEAD_SUFFIX)),
+                "used_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "in_progress": len(self._in_progress)
+            }
+
+
+# 创建全局缓存实例
+read_cache = ReadAheadCache(
+    READ_CACHE_DIR,
+    int(READ_CACHE_SIZE_MB * 1024 * 1024),
+    int(PREFETCH_HEAD_MB * 1024 * 1024)
+)
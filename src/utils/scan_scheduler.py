@@ -0,0 +1,236 @@
+"""
+音乐库扫描调度
+
+每个音乐库目录可以在config.json的library_scan_policies中单独配置扫描策略，
+未配置的项使用default_scan_policy，再缺省时使用DEFAULT_POLICY：
+
+    "library_scan_policies": {
+        "/mnt/nas/music": {
+            "priority": -10,               # 优先级，数值大的先扫描（本地SSD可设为正数）
+            "files_per_sec": 200,          # 每秒最多处理的文件数（stat和读取元数据各算一次），0或null表示不限制
+            "playback_files_per_sec": 20,  # 同一设备上有文件正在播放时的速率上限
+            "concurrency": 1,              # 同时读取元数据的线程数
+            "interval": 3600               # 定期重新扫描的间隔（秒），null表示只在目录变化或缓存过期时扫描
+        }
+    },
+    "scan_workers": 2                      # 同时扫描的音乐库目录数
+
+位于同一设备上的目录总是按优先级依次扫描，慢速的U盘或NAS不会拖慢其他磁盘上的目录。
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.config.settings import SCAN_WORKERS
+from src.config.settings_manager import get_config_value
+from src.utils.library_index import library_index
+
+# 默认扫描策略
+DEFAULT_POLICY: Dict[str, Any] = {
+    "priority": 0,
+    "files_per_sec": None,
+    "playback_files_per_sec": 50,
+    "concurrency": 1,
+    "interval": None
+}
+
+# 重新检查播放中文件所在设备的间隔（秒）
+_PLAYBACK_CHECK_INTERVAL = 1.0
+
+class ScanPolicy:
+    """单个音乐库目录的扫描策略"""
+
+    __slots__ = ("priority", "files_per_sec", "playback_files_per_sec", "concurrency", "interval")
+
+    def __init__(self, values: Dict[str, Any]):
+        self.priority = int(values.get("priority") or 0)
+        self.files_per_sec = float(values["files_per_sec"]) if values.get("files_per_sec") else None
+        self.playback_files_per_sec = float(values["playback_files_per_sec"]) if values.get("playback_files_per_sec") else None
+        self.concurrency = max(1, int(values.get("concurrency") or 1))
+        self.interval = float(values["interval"]) if values.get("interval") else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def get_scan_policy(library_dir: str) -> ScanPolicy:
+    """获取音乐库目录的扫描策略（每次从配置读取，修改config.json后下一次扫描生效）"""
+    values = dict(DEFAULT_POLICY)
+    values.update(get_config_value("default_scan_policy", {}) or {})
+    values.update((get_config_value("library_scan_policies", {}) or {}).get(library_dir, {}))
+    return ScanPolicy(values)
+
+class TokenBucket:
+    """令牌桶限速，速率可以在每次取令牌时指定（用于播放时临时降速）"""
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0, rate: Optional[float] = None) -> None:
+        """取出令牌，不足时等待；速率为None时不限制"""
+        rate = rate if rate is not None else self.rate
+        if not rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / rate
+            # 分段等待，降速或恢复时尽快按新速率计算
+            time.sleep(min(wait, 0.5))
+
+# 返回正在播放的文件路径的函数
+_playback_probes: List[Callable[[], Iterable[str]]] = []
+_playing_devices: set = set()
+_playing_checked_at = 0.0
+_playing_lock = threading.Lock()
+
+def register_playback_probe(probe: Callable[[], Iterable[str]]) -> None:
+    """注册查询正在播放的文件的函数，扫描同一设备上的目录时会降速"""
+    if probe not in _playback_probes:
+        _playback_probes.append(probe)
+
+def _device_of(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+def get_playing_devices() -> set:
+    """正在播放的文件所在的设备号（缓存一小段时间，避免每个文件都查询）"""
+    global _playing_devices, _playing_checked_at
+
+    now = time.monotonic()
+    if now - _playing_checked_at < _PLAYBACK_CHECK_INTERVAL:
+        return _playing_devices
+    with _playing_lock:
+        if now - _playing_checked_at >= _PLAYBACK_CHECK_INTERVAL:
+            devices = set()
+            for probe in list(_playback_probes):
+                try:
+                    devices.update(_device_of(path) for path in probe())
+                except Exception as e:
+                    print(f"查询播放状态时出错: {str(e)}")
+            devices.discard(None)
+            _playing_devices = devices
+            _playing_checked_at = now
+    return _playing_devices
+
+class RootThrottle:
+    """一次扫描中单个音乐库目录的限速器"""
+
+    def __init__(self, library_dir: str, policy: ScanPolicy):
+        self.library_dir = library_dir
+        self.policy = policy
+        self.device = _device_of(library_dir)
+        self._bucket = TokenBucket(policy.files_per_sec)
+
+    def wait(self) -> None:
+        """处理一个文件前调用，同一设备上有文件正在播放时使用较低的速率"""
+        rate = self.policy.files_per_sec
+        if self.policy.playback_files_per_sec and self.device is not None and self.device in get_playing_devices():
+            rate = min(rate, self.policy.playback_files_per_sec) if rate else self.policy.playback_files_per_sec
+        self._bucket.acquire(rate=rate)
+
+def run_scheduled(library_dirs: List[str], work: Callable[[str, RootThrottle], None], throttles: Optional[Dict[str, RootThrottle]] = None) -> Dict[str, RootThrottle]:
+    """
+    按扫描策略处理各音乐库目录，全部完成后返回
+
+    同一设备上的目录组成一组，组内按优先级依次处理；各组按最高优先级排队，最多同时处理scan_workers组。
+
+    Args:
+        work: 处理单个目录的函数，参数为 (目录, 限速器)
+        throttles: 沿用之前创建的限速器（同一次扫描的后续阶段共享速率）
+
+    Returns:
+        目录 -> 限速器
+    """
+    throttles = dict(throttles or {})
+    for library_dir in library_dirs:
+        if library_dir not in throttles:
+            throttles[library_dir] = RootThrottle(library_dir, get_scan_policy(library_dir))
+
+    groups: Dict[Any, List[str]] = {}
+    for library_dir in sorted(library_dirs, key=lambda d: -throttles[d].policy.priority):
+        device = throttles[library_dir].device
+        groups.setdefault(device if device is not None else library_dir, []).append(library_dir)
+
+    def run_group(group: List[str]) -> None:
+        for library_dir in group:
+            try:
+                work(library_dir, throttles[library_dir])
+            except Exception as e:
+                print(f"扫描音乐库时出错: {library_dir}, 错误: {str(e)}")
+
+    if len(groups) <= 1:
+        for group in groups.values():
+            run_group(group)
+        return throttles
+
+    # 字典保持插入顺序，即各组最高优先级的顺序
+    with ThreadPoolExecutor(max_workers=max(1, SCAN_WORKERS), thread_name_prefix="library-scan") as executor:
+        for future in [executor.submit(run_group, group) for group in groups.values()]:
+            future.result()
+    return throttles
+
+def map_throttled(throttle: RootThrottle, func: Callable, items: List[Any]) -> List[Any]:
+    """按目录的并发数处理一批文件"""
+    if throttle.policy.concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=throttle.policy.concurrency, thread_name_prefix="library-read") as executor:
+        return list(executor.map(func, items))
+
+def mark_scanned(library_dirs: List[str]) -> None:
+    """记录各目录最近一次完成扫描的时间，供定期扫描判断"""
+    scanned_at = _load_scanned_at()
+    now = time.time()
+    for library_dir in library_dirs:
+        scanned_at[library_dir] = now
+    try:
+        library_index.set_meta("library_scanned_at", json.dumps(scanned_at))
+    except Exception as e:
+        print(f"写入扫描时间时出错: {str(e)}")
+
+def _load_scanned_at() -> Dict[str, float]:
+    try:
+        return json.loads(library_index.get_meta("library_scanned_at") or "{}")
+    except Exception as e:
+        print(f"读取扫描时间时出错: {str(e)}")
+        return {}
+
+def get_due_libraries(library_dirs: List[str]) -> List[str]:
+    """按各目录配置的定期扫描间隔，返回到期需要重新扫描的目录"""
+    scanned_at = _load_scanned_at()
+    now = time.time()
+    due = []
+    for library_dir in library_dirs:
+        interval = get_scan_policy(library_dir).interval
+        if interval and now - scanned_at.get(library_dir, 0) >= interval:
+            due.append(library_dir)
+    return due
+
+def get_schedule_status(library_dirs: List[str]) -> List[Dict[str, Any]]:
+    """各目录的扫描策略、最近扫描时间和所在设备是否正在播放"""
+    scanned_at = _load_scanned_at()
+    playing = get_playing_devices()
+    status = []
+    for library_dir in library_dirs:
+        policy = get_scan_policy(library_dir)
+        status.append({
+            "library_dir": library_dir,
+            "policy": policy.to_dict(),
+            "last_scanned_at": scanned_at.get(library_dir),
+            "playback_throttled": bool(policy.playback_files_per_sec) and _device_of(library_dir) in playing
+        })
+    return status
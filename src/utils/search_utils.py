@@ -2,12 +2,173 @@
 音乐搜索工具
 """
 
-from typing import List, Dict, Any, Optional
+import itertools
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import re
 
-from src.utils.file_utils import get_all_music_files
+from src.utils.file_utils import get_library_snapshot
 
-def search_music(query: str, include_metadata: bool = True, limit: int = 100) -> List[Dict[str, Any]]:
+# 缓存的查询数量
+_MATCH_CACHE_SIZE = 128
+
+# 所有缓存的匹配总数上限，超出时淘汰最久未使用的查询
+_MAX_CACHED_MATCHES = 1000000
+
+# 每检查多少个文件确认一次搜索是否已被取代
+_CANCEL_CHECK_INTERVAL = 2048
+
+# (音乐库版本, 是否包含元数据, 查询) -> 按评分排序的全部匹配 [(评分, 文件)]
+_match_cache: "OrderedDict[Tuple[int, bool, str], List[Tuple[int, Dict[str, Any]]]]" = OrderedDict()
+_cached_match_count = 0
+_match_lock = threading.Lock()
+
+# 客户端ID -> 最新一次搜索的序号，只保存有搜索在进行的客户端
+_client_generations: Dict[str, int] = {}
+_client_lock = threading.Lock()
+
+# 搜索序号（全局递增，登记被删除后再开始的搜索也不会与旧搜索的序号相同）
+_generations = itertools.count(1)
+
+class SearchCancelled(Exception):
+    """搜索已被同一客户端的新请求取代"""
+
+class ClientSearch:
+    """客户端的一次搜索，调用时返回是否已被同一客户端的新搜索取代"""
+
+    __slots__ = ("client_id", "generation")
+
+    def __init__(self, client_id: str, generation: int):
+        self.client_id = client_id
+        self.generation = generation
+
+    def __call__(self) -> bool:
+        return _client_generations.get(self.client_id) != self.generation
+
+def begin_client_search(client_id: Optional[str]) -> Optional[ClientSearch]:
+    """
+    登记客户端的新搜索，同一客户端之前未完成的搜索随之失效，结束后调用end_client_search
+    
+    Returns:
+        检查本次搜索是否已被取代的函数；没有客户端ID时返回None
+    """
+    if not client_id:
+        return None
+    with _client_lock:
+        generation = next(_generations)
+        _client_generations[client_id] = generation
+    return ClientSearch(client_id, generation)
+
+def end_client_search(search: Optional[ClientSearch]) -> None:
+    """搜索结束：没有更新的搜索在进行时删除客户端的登记"""
+    if search is None:
+        return
+    with _client_lock:
+        if _client_generations.get(search.client_id) == search.generation:
+            del _client_generations[search.client_id]
+
+def _score_file(file: Dict[str, Any], query: str) -> Tuple[int, List[str]]:
+    """计算文件与查询的匹配评分和原因"""
+    score = 0
+    match_reasons = []
+    
+    # 文件名匹配
+    if query in file["name"].lower():
+        score += 10
+        match_reasons.append("文件名匹配")
+    
+    # 如果有元数据信息，检查元数据
+    if "metadata" in file:
+        metadata = file["metadata"]
+        
+        # 标题匹配
+        if metadata.get("title") and query in metadata["title"].lower():
+            score += 15
+            match_reasons.append("标题匹配")
+        
+        # 艺术家匹配
+        if metadata.get("artist") and query in metadata["artist"].lower():
+            score += 12
+            match_reasons.append("艺术家匹配")
+        
+        # 专辑匹配
+        if metadata.get("album") and query in metadata["album"].lower():
+            score += 8
+            match_reasons.append("专辑匹配")
+        
+        # 流派匹配
+        if metadata.get("genre") and query in metadata["genre"].lower():
+            score += 5
+            match_reasons.append("流派匹配")
+    
+    return score, match_reasons
+
+def _cached_candidates(version: int, include_metadata: bool, query: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    查找可复用的缓存：已缓存查询是当前查询的子串时（如输入时不断追加字符），
+    当前查询的匹配一定在其匹配之中，只需检查这些文件
+    """
+    best_key = None
+    with _match_lock:
+        for key in _match_cache:
+            cached_version, cached_metadata, cached_query = key
+            if cached_version != version or cached_metadata != include_metadata or cached_query not in query:
+                continue
+            if best_key is None or len(cached_query) > len(best_key[2]):
+                best_key = key
+        if best_key is None:
+            return None
+        _match_cache.move_to_end(best_key)
+        return [file for _, file in _match_cache[best_key]]
+
+def _find_matches(
+    query: str,
+    include_metadata: bool,
+    cancelled: Optional[Callable[[], bool]]
+) -> List[Tuple[int, Dict[str, Any]]]:
+    """获取查询的全部匹配（按评分排序），优先使用缓存"""
+    global _cached_match_count
+    
+    snapshot = get_library_snapshot(include_metadata=include_metadata)
+    key = (snapshot.version, include_metadata, query)
+    with _match_lock:
+        matches = _match_cache.get(key)
+        if matches is not None:
+            _match_cache.move_to_end(key)
+            return matches
+    
+    candidates = _cached_candidates(snapshot.version, include_metadata, query)
+    if candidates is None:
+        candidates = snapshot.files
+    
+    matches = []
+    for i, file in enumerate(candidates):
+        if cancelled is not None and i % _CANCEL_CHECK_INTERVAL == 0 and cancelled():
+            raise SearchCancelled()
+        score, _ = _score_file(file, query)
+        if score > 0:
+            matches.append((score, file))
+    
+    # 按评分排序（稳定排序，同分时保持音乐库中的顺序）
+    matches.sort(key=lambda match: match[0], reverse=True)
+    
+    if len(matches) <= _MAX_CACHED_MATCHES // 4:
+        with _match_lock:
+            if key not in _match_cache:
+                _match_cache[key] = matches
+                _cached_match_count += len(matches)
+            while len(_match_cache) > _MATCH_CACHE_SIZE or _cached_match_count > _MAX_CACHED_MATCHES:
+                _, evicted = _match_cache.popitem(last=False)
+                _cached_match_count -= len(evicted)
+    return matches
+
+def search_music(
+    query: str,
+    include_metadata: bool = True,
+    limit: int = 100,
+    cancelled: Optional[Callable[[], bool]] = None
+) -> List[Dict[str, Any]]:
     """
     搜索音乐文件
     
@@ -15,6 +176,7 @@ def search_music(query: str, include_metadata: bool = True, limit: int = 100) ->
         query: 搜索关键词
         include_metadata: 是否包含元数据
         limit: 最大返回结果数量
+        cancelled: 返回True时中止搜索并抛出SearchCancelled
         
     Returns:
         匹配的音乐文件列表
@@ -25,57 +187,15 @@ def search_music(query: str, include_metadata: bool = True, limit: int = 100) ->
     # 规范化查询字符串
     query = query.lower().strip()
     
-    # 获取所有音乐文件（包含元数据）
-    all_files = get_all_music_files(include_metadata=include_metadata)
-    
-    # 存储搜索结果和评分
+    # 只为返回的结果生成匹配原因
     search_results = []
+    for score, file in _find_matches(query, include_metadata, cancelled)[:limit]:
+        result = file.copy()
+        result["score"] = score
+        result["match_reasons"] = _score_file(file, query)[1]
+        search_results.append(result)
     
-    for file in all_files:
-        score = 0
-        match_reasons = []
-        
-        # 文件名匹配
-        if query in file["name"].lower():
-            score += 10
-            match_reasons.append("文件名匹配")
-        
-        # 如果有元数据信息，检查元数据
-        if "metadata" in file:
-            metadata = file["metadata"]
-            
-            # 标题匹配
-            if metadata.get("title") and query in metadata["title"].lower():
-                score += 15
-                match_reasons.append("标题匹配")
-            
-            # 艺术家匹配
-            if metadata.get("artist") and query in metadata["artist"].lower():
-                score += 12
-                match_reasons.append("艺术家匹配")
-            
-            # 专辑匹配
-            if metadata.get("album") and query in metadata["album"].lower():
-                score += 8
-                match_reasons.append("专辑匹配")
-            
-            # 流派匹配
-            if metadata.get("genre") and query in metadata["genre"].lower():
-                score += 5
-                match_reasons.append("流派匹配")
-        
-        # 如果有匹配，添加到结果中
-        if score > 0:
-            result = file.copy()
-            result["score"] = score
-            result["match_reasons"] = match_reasons
-            search_results.append(result)
-    
-    # 按评分排序
-    search_results.sort(key=lambda x: x["score"], reverse=True)
-    
-    # 限制返回数量
-    return search_results[:limit]
+    return search_results
 
 def filter_music(
     files: List[Dict[str, Any]],
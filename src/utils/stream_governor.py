@@ -0,0 +1,373 @@
+"""
+音乐文件流式传输的资源限制
+
+/library 路由返回的文件流都经过这里：
+- 并发限制：全局同时传输的流数和每个客户端的流数都有上限，超出时排队等待，等待超时返回503
+- 优先级：Range请求（浏览器播放音频时总是使用）或声明为播放的请求优先出队，
+  并为其保留一部分名额，批量下载不会占满全部名额
+- 带宽整形：每个客户端一个令牌桶，所有批量下载另外共享一个令牌桶
+
+客户端以X-Client-Id请求头区分，没有时使用IP地址。状态都在事件循环中修改，不需要加锁。
+
+限制和统计都在进程内：api_workers大于1时每个HTTP工作进程各自计算，
+服务器整体的并发数和带宽上限是设置值乘以工作进程数，同一客户端的请求也可能分到不同进程。
+"""
+
+import asyncio
+import heapq
+import itertools
+import mimetypes
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Message, Receive, Scope, Send
+
+from src.config.settings import (
+    STREAM_MAX_ACTIVE, STREAM_MAX_PER_CLIENT, STREAM_RESERVED_PLAYBACK,
+    STREAM_CLIENT_RATE_KB, STREAM_BULK_RATE_KB, STREAM_QUEUE_TIMEOUT,
+    get_current_music_libraries
+)
+from src.utils.file_utils import decode_filename
+from src.utils.read_cache import read_cache
+
+# 优先级，数值小的先出队
+PRIORITY_PLAYBACK = 0
+PRIORITY_BULK = 1
+
+# 单个范围的Range请求头
+_RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+class StreamRejected(Exception):
+    """排队等待超时"""
+
+class AsyncTokenBucket:
+    """令牌桶（事件循环中使用），令牌不足时先记账再等待，多个流共享时按各自的欠额等待"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate  # 最多积累1秒的令牌
+        self._updated = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+class StreamSlot:
+    """一个已获准传输的文件流"""
+
+    __slots__ = ("governor", "client", "playback", "started_at", "bytes_sent", "_released")
+
+    def __init__(self, governor: "StreamGovernor", client: str, playback: bool):
+        self.governor = governor
+        self.client = client
+        self.playback = playback
+        self.started_at = time.time()
+        self.bytes_sent = 0
+        self._released = False
+
+    async def consume(self, amount: int) -> None:
+        """发送amount字节前调用，按带宽限制等待"""
+        self.bytes_sent += amount
+        self.governor.bytes_sent += amount
+        await self.governor.client_bucket(self.client).consume(amount)
+        if not self.playback:
+            await self.governor.bulk_bucket.consume(amount)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.governor.release(self)
+
+class StreamGovernor:
+    """文件流的并发限制、排队和带宽整形"""
+
+    def __init__(
+        self,
+        max_active: int,
+        max_per_client: int,
+        reserved_playback: int,
+        client_rate: float,
+        bulk_rate: float,
+        queue_timeout: float
+    ):
+        self.max_active = max_active
+        self.max_per_client = max_per_client
+        self.reserved_playback = min(reserved_playback, max_active - 1) if max_active > 1 else 0
+        self.client_rate = client_rate
+        self.queue_timeout = queue_timeout
+        self.bulk_bucket = AsyncTokenBucket(bulk_rate)
+
+        self._active: List[StreamSlot] = []
+        self._per_client: Dict[str, int] = {}
+        self._client_buckets: Dict[str, AsyncTokenBucket] = {}
+        self._waiters: list = []  # 堆：(优先级, 序号, 客户端, future)
+        self._sequence = itertools.count()
+
+        # 统计
+        self.served = 0
+        self.rejected = 0
+        self.bytes_sent = 0
+        self.total_wait = 0.0
+
+    def client_bucket(self, client: str) -> AsyncTokenBucket:
+        bucket = self._client_buckets.get(client)
+        if bucket is None:
+            bucket = self._client_buckets[client] = AsyncTokenBucket(self.client_rate)
+        return bucket
+
+    def _can_start(self, client: str, playback: bool) -> bool:
+        if len(self._active) >= self.max_active:
+            return False
+        if self._per_client.get(client, 0) >= self.max_per_client:
+            return False
+        if not playback:
+            # 批量下载不能占用为播放保留的名额
+            bulk = sum(1 for slot in self._active if not slot.playback)
+            if bulk >= self.max_active - self.reserved_playback:
+                return False
+        return True
+
+    def _start(self, client: str, playback: bool) -> StreamSlot:
+        slot = StreamSlot(self, client, playback)
+        self._active.append(slot)
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self.served += 1
+        return slot
+
+    def _dispatch(self) -> None:
+        """按优先级让能够开始的等待者开始，受每客户端限制的等待者不阻塞后面的其他客户端"""
+        remaining = []
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            priority, _, client, future = entry
+            if future.done():
+                continue
+            if self._can_start(client, priority == PRIORITY_PLAYBACK):
+                future.set_result(self._start(client, priority == PRIORITY_PLAYBACK))
+            else:
+                remaining.append(entry)
+        for entry in remaining:
+            heapq.heappush(self._waiters, entry)
+
+    async def acquire(self, client: str, playback: bool) -> StreamSlot:
+        """
+        获取传输名额，名额不足时排队等待
+
+        Raises:
+            StreamRejected: 等待超过queue_timeout
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        priority = PRIORITY_PLAYBACK if playback else PRIORITY_BULK
+        heapq.heappush(self._waiters, (priority, next(self._sequence), client, future))
+        self._dispatch()
+
+        started = time.monotonic()
+        try:
+            slot = await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时刚好获得了名额
+                slot = future.result()
+            else:
+                future.cancel()
+                self.rejected += 1
+                raise StreamRejected()
+        except asyncio.CancelledError:
+            # 客户端在排队时断开
+            if future.done() and not future.cancelled():
+                future.result().release()
+            else:
+                future.cancel()
+            raise
+        self.total_wait += time.monotonic() - started
+        return slot
+
+    def release(self, slot: StreamSlot) -> None:
+        self._active.remove(slot)
+        count = self._per_client.get(slot.client, 0) - 1
+        if count > 0:
+            self._per_client[slot.client] = count
+        else:
+            self._per_client.pop(slot.client, None)
+            self._client_buckets.pop(slot.client, None)
+        self._dispatch()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """当前的流和排队情况"""
+        waiting = [entry for entry in self._waiters if not entry[3].done()]
+        now = time.time()
+        return {
+            "limits": {
+                "max_active": self.max_active,
+                "max_per_client": self.max_per_client,
+                "reserved_playback": self.reserved_playback,
+                "client_rate_kb": self.client_rate / 1024,
+                "bulk_rate_kb": self.bulk_bucket.rate / 1024,
+                "queue_timeout": self.queue_timeout
+            },
+            "active": len(self._active),
+            "active_playback": sum(1 for slot in self._active if slot.playback),
+            "queued": len(waiting),
+            "queued_playback": sum(1 for entry in waiting if entry[0] == PRIORITY_PLAYBACK),
+            "streams": [
+                {
+                    "client": slot.client,
+                    "playback": slot.playback,
+                    "bytes_sent": slot.bytes_sent,
+                    "duration": round(now - slot.started_at, 3)
+                }
+                for slot in self._active
+            ],
+            "served": self.served,
+            "rejected": self.rejected,
+            "bytes_sent": self.bytes_sent,
+            "average_wait_ms": round(self.total_wait / self.served * 1000, 1) if self.served else 0
+        }
+
+class GovernedFileResponse(FileResponse):
+    """按名额和带宽限制发送的文件响应，发送结束（包括客户端断开）后释放名额"""
+
+    def __init__(self, path: str, slot: StreamSlot, **kwargs):
+        super().__init__(path, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # 不使用pathsend扩展，文件内容由这里分块发送才能整形
+        extensions = {key: value for key, value in scope.get("extensions", {}).items() if key != "http.response.pathsend"}
+        scope = {**scope, "extensions": extensions}
+
+        async def shaped_send(message: Message) -> None:
+            if message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if body:
+                    await self.slot.consume(len(body))
+            await send(message)
+
+        try:
+            await super().__call__(scope, receive, shaped_send)
+        finally:
+            self.slot.release()
+
+class GovernedHeadResponse(Response):
+    """
+    由本地缓存的文件开头部分响应Range请求，发送结束后释放名额
+
+    返回的范围可能比请求的短（206，Content-Range中是完整文件的大小），客户端会继续请求后面的部分
+    """
+
+    def __init__(self, content: bytes, slot: StreamSlot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.slot.consume(len(self.body))
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+def _read_head_range(request: Request, file_path: str) -> Optional[tuple]:
+    """Range请求的起点在已缓存的开头部分中时，读取 (数据, 起点, 终点, 文件大小)，否则返回None"""
+    match = _RANGE_PATTERN.fullmatch(request.headers.get("range", "").strip())
+    if match is None:
+        return None
+    head_path = read_cache.resolve_head(file_path)
+    if head_path is None:
+        return None
+
+    start = int(match.group(1))
+    try:
+        head_size = os.path.getsize(head_path)
+        total = os.path.getsize(file_path)
+        end = head_size - 1 if not match.group(2) else min(int(match.group(2)), head_size - 1)
+        if start > end:
+            return None
+        with open(head_path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1), start, end, total
+    except OSError:
+        # 片段已被淘汰
+        return None
+
+def client_key(request: Request) -> str:
+    """区分客户端：优先使用X-Client-Id请求头，否则使用IP地址"""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "unknown")
+
+def is_playback_request(request: Request) -> bool:
+    """是否为播放请求：X-Stream-Purpose请求头明确声明，或带有Range头（浏览器播放音频时总会发送）"""
+    purpose = request.headers.get("X-Stream-Purpose")
+    if purpose:
+        return purpose == "playback"
+    return "range" in request.headers
+
+def resolve_library_file(library_name: str, path: str) -> str:
+    """把 /library/{音乐库名}/{相对路径} 解析为文件路径，找不到时抛出404"""
+    library_name = decode_filename(library_name)
+    path = decode_filename(path)
+
+    # 多个音乐库目录可能同名，依次查找直到找到文件
+    found_library = False
+    for library_dir in get_current_music_libraries():
+        if os.path.basename(library_dir) == library_name:
+            found_library = True
+            file_path = os.path.join(library_dir, path)
+            if os.path.exists(file_path) and os.path.isfile(file_path):
+                return file_path
+
+    if found_library:
+        raise HTTPException(status_code=404, detail=f"文件不存在: {path}")
+    raise HTTPException(status_code=404, detail=f"未找到音乐库: {library_name}")
+
+async def stream_library_file(request: Request, library_name: str, path: str) -> Response:
+    """两个 /library 路由共用：解析文件路径，获取传输名额后返回受限速的文件响应"""
+    # 路径解析和预读缓存查找都要访问文件系统（可能是网络共享），放到线程池中执行
+    file_path = await run_in_threadpool(resolve_library_file, library_name, path)
+    try:
+        slot = await stream_governor.acquire(client_key(request), is_playback_request(request))
+    except StreamRejected:
+        raise HTTPException(
+            status_code=503,
+            detail="同时传输的文件过多，请稍后重试",
+            headers={"Retry-After": str(max(1, int(stream_governor.queue_timeout)))}
+        )
+
+    try:
+        # 优先读取本地预读缓存；只缓存了开头部分时，开头的Range请求由本地片段响应
+        local_path = await run_in_threadpool(read_cache.resolve, file_path)
+        if local_path == file_path:
+            head = await run_in_threadpool(_read_head_range, request, file_path)
+            if head is not None:
+                content, start, end, total = head
+                return GovernedHeadResponse(
+                    content,
+                    slot,
+                    status_code=206,
+                    headers={"Content-Range": f"bytes {start}-{end}/{total}", "Accept-Ranges": "bytes"},
+                    media_type=mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+                )
+        return GovernedFileResponse(local_path, slot)
+    except Exception:
+        slot.release()
+        raise
+
+# 创建全局实例
+stream_governor = StreamGovernor(
+    max_active=STREAM_MAX_ACTIVE,
+    max_per_client=STREAM_MAX_PER_CLIENT,
+    reserved_playback=STREAM_RESERVED_PLAYBACK,
+    client_rate=STREAM_CLIENT_RATE_KB * 1024,
+    bulk_rate=STREAM_BULK_RATE_KB * 1024,
+    queue_timeout=STREAM_QUEUE_TIMEOUT
+)
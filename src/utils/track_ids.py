@@ -0,0 +1,235 @@
+"""
+稳定的曲目ID
+
+在索引中持久保存 路径 -> ID 的登记，已知路径直接复用ID，不再每次扫描都计算哈希。
+新出现的路径先与本次扫描中消失的登记匹配：(设备号, inode)和大小相同视为重命名或移动，
+文件名、大小和修改时间相同视为音乐库换了挂载位置，两种情况都沿用原来的ID。
+先复制后删除的移动会在两次扫描中分别得到两个ID，此时删除旧登记，并把旧ID记为新ID的别名。
+其余消失的登记在所在音乐库目录被完整遍历后删除，避免登记无限增长，以及inode被重用时新文件继承已删除曲目的ID。
+与所有登记的inode和文件名都不相同的新路径不可能是重命名，扫描遍历时即可分配ID（assign_new）。
+"""
+
+import os
+import threading
+from typing import List, Dict, Optional, Tuple
+
+from src.utils.library_index import library_index
+
+class TrackIdRegistry:
+    """路径与曲目ID的登记表"""
+
+    def __init__(self):
+        self._records: Dict[str, list] = {}  # ID -> [full_path, dev, inode, size, mtime_ns]
+        self._by_path: Dict[str, str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._rename_keys: Optional[set] = None  # 所有登记的重命名匹配键，assign_new使用
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        """首次使用时从索引读取登记；旧版本的索引没有登记时，沿用已有曲目的ID"""
+        if self._loaded:
+            return
+
+        rows = library_index.load_track_ids()
+        if not rows:
+            rows = [(file_id, full_path, None, None, None, None) for file_id, full_path in library_index.load_track_paths()]
+        for file_id, full_path, dev, inode, size, mtime_ns in rows:
+            self._records[file_id] = [full_path, dev, inode, size, mtime_ns]
+            self._by_path[full_path] = file_id
+        self._aliases = library_index.load_id_aliases()
+        self._loaded = True
+
+    def assign(
+        self,
+        entries: List[Tuple[str, os.stat_result]],
+        scope: Optional[List[str]] = None,
+        roots: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        为一次完整扫描得到的文件分配ID
+
+        Args:
+            entries: (文件路径, stat结果) 列表
+            scope: 只扫描了部分目录时，只有这些目录中的登记会被视为消失
+            roots: 本次完整遍历过的音乐库目录，其中消失且不是重命名或移动的登记会被删除
+
+        Returns:
+            与entries顺序一致的ID列表
+        """
+        from src.utils.file_utils import generate_file_id
+
+        with self._lock:
+            self._ensure_loaded()
+
+            seen_paths = {path for path, _ in entries}
+            prefixes = tuple(os.path.join(directory, "") for directory in scope) if scope is not None else None
+            missing = {
+                file_id: record for file_id, record in self._records.items()
+                if record[0] not in seen_paths and (prefixes is None or record[0].startswith(prefixes))
+            }
+            missing_by_inode = {
+                (record[1], record[2], record[3]): file_id
+                for file_id, record in missing.items() if record[2] is not None
+            }
+            missing_by_name = {
+                (os.path.basename(record[0]), record[3], record[4]): file_id
+                for file_id, record in missing.items() if record[3] is not None
+            }
+
+            changed: Dict[str, list] = {}
+            ids = []
+            for path, stat in entries:
+                record = [path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+                file_id = self._by_path.get(path)
+
+                if file_id is None:
+                    # 重命名/移动，或音乐库换了挂载位置
+                    file_id = missing_by_inode.pop((stat.st_dev, stat.st_ino, stat.st_size), None)
+                    if file_id is None:
+                        file_id = missing_by_name.pop((os.path.basename(path), stat.st_size, stat.st_mtime_ns), None)
+                    if file_id is not None and file_id in missing:
+                        del missing[file_id]
+                        self._by_path.pop(self._records[file_id][0], None)
+                    else:
+                        file_id = self._new_id(path, stat, generate_file_id)
+
+                if self._records.get(file_id) != record:
+                    self._records[file_id] = record
+                    self._by_path[path] = file_id
+                    changed[file_id] = record
+                ids.append(file_id)
+
+            # 先复制后删除的移动：消失的登记与某个现存文件是同一个inode，或文件名、大小和修改时间相同
+            present_by_inode = {}
+            present_by_name = {}
+            for (path, stat), file_id in zip(entries, ids):
+                present_by_inode[(stat.st_dev, stat.st_ino, stat.st_size)] = file_id
+                present_by_name[(os.path.basename(path), stat.st_size, stat.st_mtime_ns)] = file_id
+            merged = []
+            aliases: Dict[str, str] = {}
+            for file_id, record in missing.items():
+                target = None
+                if record[2] is not None:
+                    target = present_by_inode.get((record[1], record[2], record[3]))
+                if target is None and record[3] is not None:
+                    target = present_by_name.get((os.path.basename(record[0]), record[3], record[4]))
+                if target is not None:
+                    merged.append(file_id)
+                    aliases.update(self._set_alias(file_id, target))
+            for file_id in merged:
+                self._by_path.pop(self._records.pop(file_id)[0], None)
+
+            # 已删除的文件：只删除完整遍历过的目录中的登记，未挂载等原因没有遍历的目录保留登记
+            pruned = []
+            if roots:
+                merged_ids = set(merged)
+                root_prefixes = tuple(os.path.join(directory, "") for directory in roots)
+                pruned = [
+                    file_id for file_id, record in missing.items()
+                    if file_id not in merged_ids and record[0].startswith(root_prefixes)
+                ]
+                for file_id in pruned:
+                    self._by_path.pop(self._records.pop(file_id)[0], None)
+                if pruned:
+                    pruned_ids = set(pruned)
+                    self._aliases = {alias: target for alias, target in self._aliases.items() if target not in pruned_ids}
+
+            if changed or merged or pruned:
+                self._rename_keys = None
+                try:
+                    library_index.save_track_ids(
+                        [(file_id, *record) for file_id, record in changed.items()],
+                        merged + pruned,
+                        aliases
+                    )
+                except Exception as e:
+                    print(f"写入曲目ID登记时出错: {str(e)}")
+            return ids
+
+    def assign_new(self, entries: List[Tuple[str, os.stat_result]]) -> List[Optional[str]]:
+        """
+        扫描遍历过程中为一批文件分配ID，不等待遍历结束
+
+        已登记的路径返回登记的ID；新路径与任何登记的(设备号, inode, 大小)和(文件名, 大小, 修改时间)都不相同时，
+        不可能是重命名或移动，直接分配新ID并写入登记；可能是重命名的路径返回None，由遍历结束后的assign处理。
+
+        Returns:
+            与entries顺序一致的ID列表
+        """
+        from src.utils.file_utils import generate_file_id
+
+        with self._lock:
+            self._ensure_loaded()
+            if self._rename_keys is None:
+                self._rename_keys = set()
+                for record in self._records.values():
+                    self._rename_keys.update(_rename_keys(record))
+
+            added = []
+            ids = []
+            for path, stat in entries:
+                file_id = self._by_path.get(path)
+                if file_id is None:
+                    record = [path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+                    keys = _rename_keys(record)
+                    if not self._rename_keys.isdisjoint(keys):
+                        ids.append(None)
+                        continue
+                    file_id = self._new_id(path, stat, generate_file_id)
+                    self._records[file_id] = record
+                    self._by_path[path] = file_id
+                    self._rename_keys.update(keys)
+                    added.append((file_id, *record))
+                ids.append(file_id)
+
+            if added:
+                try:
+                    library_index.save_track_ids(added, [], {})
+                except Exception as e:
+                    print(f"写入曲目ID登记时出错: {str(e)}")
+            return ids
+
+    def _new_id(self, path: str, stat: os.stat_result, generate) -> str:
+        """生成不与现有ID和别名冲突的新ID"""
+        file_id = generate(path, stat)
+        salt = 0
+        while file_id in self._records or file_id in self._aliases:
+            salt += 1
+            file_id = generate(f"{path}#{salt}", stat)
+        return file_id
+
+    def _set_alias(self, alias: str, target: str) -> Dict[str, str]:
+        """记录别名，并让指向alias的旧别名直接指向target，返回有变化的别名"""
+        updated = {key: target for key, value in self._aliases.items() if value == alias}
+        updated[alias] = target
+        self._aliases.update(updated)
+        return updated
+
+    def reload(self) -> None:
+        """丢弃内存中的登记，下次使用时重新从索引读取（索引被导入等方式写入后调用）"""
+        with self._lock:
+            self._records = {}
+            self._by_path = {}
+            self._aliases = {}
+            self._rename_keys = None
+            self._loaded = False
+
+    def resolve_alias(self, file_id: str) -> Optional[str]:
+        """根据旧ID查询当前ID"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._aliases.get(file_id)
+
+
+def _rename_keys(record: list) -> List[tuple]:
+    """登记 [full_path, dev, inode, size, mtime_ns] 用于识别重命名和换挂载位置的键，与assign中的匹配方式一致"""
+    keys = []
+    if record[2] is not None:
+        keys.append(("inode", record[1], record[2], record[3]))
+    if record[3] is not None:
+        keys.append(("name", os.path.basename(record[0]), record[3], record[4]))
+    return keys
+
+# 创建全局登记实例
+track_ids = TrackIdRegistry()
@@ -0,0 +1,461 @@
+"""
+分块上传音乐文件
+
+客户端先创建上传会话（目标音乐库、相对路径、大小和SHA-256），再按偏移量依次上传各块，
+中断后查询会话得到已接收的字节数即可继续。全部上传后校验SHA-256，通过后原子地移入音乐库目录，
+只把这些文件交给扫描进程加入索引并提取元数据，不需要重新扫描整个音乐库。
+
+会话信息和已接收的数据保存在upload_dir中（<会话ID>.json 和 <会话ID>.part），
+多进程部署时各HTTP工作进程共享，由扫描进程定期处理已移入音乐库的文件。
+写入、完成和取消前先对.part文件加文件锁（flock），不同工作进程不会同时写入同一会话。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows没有flock，只在本进程内互斥
+    fcntl = None
+
+import aiofiles
+from starlette.concurrency import run_in_threadpool
+
+from src.config.settings import (
+    SUPPORTED_FORMATS, INDEX_MODE, UPLOAD_DIR, UPLOAD_MAX_SIZE_MB, UPLOAD_SESSION_TTL
+)
+from src.config.settings_manager import get_music_libraries
+
+# 会话状态：uploading（接收数据）、stored（已移入音乐库，等待加入索引）、indexed（已加入索引）、failed
+STATUS_UPLOADING = "uploading"
+STATUS_STORED = "stored"
+STATUS_INDEXED = "indexed"
+STATUS_FAILED = "failed"
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class UploadOffsetMismatch(Exception):
+    """上传块的偏移量与已接收的字节数不一致"""
+
+    def __init__(self, received: int):
+        super().__init__(f"已接收{received}字节")
+        self.received = received
+
+class UploadBusy(Exception):
+    """会话的数据正在被其他请求写入或校验"""
+
+class UploadManager:
+    """上传会话的创建、分块写入、校验和移入音乐库"""
+
+    def __init__(self, upload_dir: str, max_bytes: int, session_ttl: float):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.session_ttl = session_ttl
+        self._lock = threading.Lock()
+        self._busy = set()  # 没有flock时本进程中正在处理的会话
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{upload_id}.json")
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{upload_id}.part")
+
+    def _acquire(self, upload_id: str, fd: int, blocking: bool = False) -> None:
+        """
+        独占会话的数据文件，多进程部署时各工作进程之间也互斥；flock在文件关闭时自动释放
+
+        Raises:
+            BlockingIOError: 不等待时文件已被其他请求占用
+        """
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return
+        with self._lock:
+            if upload_id in self._busy:
+                raise BlockingIOError(upload_id)
+            self._busy.add(upload_id)
+
+    def _release(self, upload_id: str, fd: int) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return
+        with self._lock:
+            self._busy.discard(upload_id)
+
+    def _is_current_data(self, upload_id: str, fd: int) -> bool:
+        """打开的文件是否仍是会话的数据文件（完成上传时数据文件会被移入音乐库）"""
+        try:
+            return os.stat(self._data_path(upload_id)).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _ended(self, upload_id: str) -> Exception:
+        """数据文件已不存在时的错误：会话已结束或已被删除"""
+        session = self._load(upload_id)
+        if session is not None and session["status"] != STATUS_UPLOADING:
+            return ValueError(f"上传已结束: {session['status']}")
+        return KeyError(upload_id)
+
+    def _load(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            return None
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, session: Dict[str, Any]) -> None:
+        """先写临时文件再替换，其他进程不会读到写了一半的会话"""
+        session["updated_at"] = time.time()
+        path = self._meta_path(session["id"])
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(session, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _received(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self._data_path(upload_id))
+        except OSError:
+            return 0
+
+    def _public(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """返回给客户端的会话信息"""
+        result = {key: session.get(key) for key in (
+            "id", "library", "path", "size", "sha256", "status", "file_id", "error", "created_at", "updated_at"
+        )}
+        result["offset"] = session["size"] if session["status"] != STATUS_UPLOADING else self._received(session["id"])
+        return result
+
+    @staticmethod
+    def _resolve_target(library: str, path: str) -> tuple:
+        """
+        把音乐库（目录或目录名）和相对路径解析为 (音乐库目录, 目标文件路径)
+
+        Raises:
+            ValueError: 音乐库不存在、路径越出音乐库目录或格式不支持
+        """
+        library_dir = next(
+            (d for d in get_music_libraries() if d == library or os.path.basename(d) == library),
+            None
+        )
+        if library_dir is None:
+            raise ValueError(f"未找到音乐库: {library}")
+
+        relative = os.path.normpath(path.replace("\\", "/")) if path else ""
+        if not relative or relative == "." or os.path.isabs(relative) or relative.split(os.sep)[0] == "..":
+            raise ValueError(f"无效的路径: {path}")
+        if any(part.startswith(".") for part in relative.split(os.sep)):
+            raise ValueError(f"路径不能包含隐藏文件或目录: {path}")
+        if not any(relative.lower().endswith(fmt) for fmt in SUPPORTED_FORMATS):
+            raise ValueError(f"不支持的文件格式: {path}")
+        return library_dir, os.path.join(library_dir, relative)
+
+    def create(self, library: str, path: str, size: int, sha256: str) -> Dict[str, Any]:
+        """
+        创建上传会话
+
+        Raises:
+            ValueError: 参数无效或文件过大
+            FileExistsError: 目标文件已存在
+        """
+        library_dir, target = self._resolve_target(library, path)
+        sha256 = (sha256 or "").lower()
+        if not _SHA256_PATTERN.match(sha256):
+            raise ValueError("sha256必须是64位十六进制字符串")
+        if size <= 0 or size > self.max_bytes:
+            raise ValueError(f"文件大小必须在1到{self.max_bytes}字节之间")
+        if os.path.exists(target):
+            raise FileExistsError(target)
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.cleanup_expired()
+
+        now = time.time()
+        session = {
+            "id": uuid.uuid4().hex,
+            "library": library_dir,
+            "path": os.path.relpath(target, library_dir),
+            "target": target,
+            "size": size,
+            "sha256": sha256,
+            "status": STATUS_UPLOADING,
+            "file_id": None,
+            "error": None,
+            "created_at": now
+        }
+        open(self._data_path(session["id"]), "wb").close()
+        self._save(session)
+        return self._public(session)
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话信息，offset为已接收的字节数（续传时从这里开始）"""
+        session = self._load(upload_id)
+        return self._public(session) if session is not None else None
+
+    async def write_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        从offset开始写入一块数据，边接收边写入磁盘
+
+        连接中途断开时已写入的部分保留，客户端查询会话后从新的offset继续。
+
+        Raises:
+            KeyError: 会话或其数据文件不存在
+            ValueError: 会话不在接收状态，或数据超出声明的大小
+            UploadOffsetMismatch: offset与已接收的字节数不一致，或上一块还在接收
+        """
+        session = self._load(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+        if session["status"] != STATUS_UPLOADING:
+            raise ValueError(f"上传已结束: {session['status']}")
+
+        try:
+            f = await aiofiles.open(self._data_path(upload_id), "r+b")
+        except FileNotFoundError:
+            raise self._ended(upload_id)
+        try:
+            # 同一会话的块不能并发写入，文件被锁定说明上一块还在接收（可能在其他工作进程中）
+            try:
+                self._acquire(upload_id, f.fileno())
+            except BlockingIOError:
+                raise UploadOffsetMismatch(self._received(upload_id))
+            try:
+                # 打开文件后、加锁前上传可能已完成，数据文件已移入音乐库
+                if not self._is_current_data(upload_id, f.fileno()):
+                    raise self._ended(upload_id)
+
+                received = os.fstat(f.fileno()).st_size
+                if offset != received:
+                    raise UploadOffsetMismatch(received)
+
+                await f.seek(offset)
+                try:
+                    async for chunk in chunks:
+                        if not chunk:
+                            continue
+                        if received + len(chunk) > session["size"]:
+                            raise ValueError(f"数据超出声明的大小: {session['size']}")
+                        await f.write(chunk)
+                        received += len(chunk)
+                finally:
+                    await f.flush()
+                    await f.truncate(received)
+                # 更新会话时间，接收中的上传不会被当作过期清理
+                self._save(session)
+                return self._public(session)
+            finally:
+                self._release(upload_id, f.fileno())
+        finally:
+            await f.close()
+
+    async def complete(self, upload_id: str) -> Dict[str, Any]:
+        """
+        校验SHA-256并移入音乐库，然后交给扫描进程加入索引
+
+        校验失败时丢弃已接收的数据，会话回到offset为0的接收状态。
+
+        Raises:
+            KeyError: 会话或其数据文件不存在
+            ValueError: 数据不完整或校验失败
+            FileExistsError: 目标文件已存在
+            UploadBusy: 还有数据块在接收，或其他完成请求正在校验
+        """
+        session = self._load(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+        if session["status"] != STATUS_UPLOADING:
+            # 重复的完成请求直接返回当前状态
+            return self._public(session)
+
+        data_path = self._data_path(upload_id)
+        try:
+            f = open(data_path, "r+b")
+        except FileNotFoundError:
+            session = self._load(upload_id)
+            if session is not None and session["status"] != STATUS_UPLOADING:
+                return self._public(session)
+            raise KeyError(upload_id)
+        with f:
+            try:
+                self._acquire(upload_id, f.fileno())
+            except BlockingIOError:
+                raise UploadBusy(upload_id)
+            try:
+                # 加锁前其他请求可能已完成上传
+                session = self._load(upload_id)
+                if session is None:
+                    raise KeyError(upload_id)
+                if session["status"] != STATUS_UPLOADING or not self._is_current_data(upload_id, f.fileno()):
+                    return self._public(session)
+
+                received = os.fstat(f.fileno()).st_size
+                if received != session["size"]:
+                    raise ValueError(f"数据不完整: 已接收{received}字节，共{session['size']}字节")
+
+                digest = await run_in_threadpool(_sha256_file, data_path)
+                if digest != session["sha256"]:
+                    f.truncate(0)
+                    raise ValueError(f"SHA-256校验失败: {digest}")
+
+                await run_in_threadpool(_move_into_place, data_path, session["target"], upload_id)
+                session["status"] = STATUS_STORED
+                self._save(session)
+            finally:
+                self._release(upload_id, f.fileno())
+
+        self._schedule_indexing()
+        return self._public(session)
+
+    async def cancel(self, upload_id: str) -> bool:
+        """取消上传并删除已接收的数据（已移入音乐库的文件不受影响）"""
+        if self._load(upload_id) is None:
+            return False
+        await run_in_threadpool(self._remove_locked, upload_id)
+        return True
+
+    def _remove_locked(self, upload_id: str) -> None:
+        """等待正在写入或校验的请求结束后删除会话"""
+        try:
+            f = open(self._data_path(upload_id), "rb")
+        except FileNotFoundError:
+            self._remove(upload_id)
+            return
+        with f:
+            if fcntl is not None:
+                self._acquire(upload_id, f.fileno(), blocking=True)
+            self._remove(upload_id)
+
+    def _remove(self, upload_id: str) -> None:
+        for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _sessions(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.upload_dir):
+            return []
+        sessions = []
+        for name in os.listdir(self.upload_dir):
+            if name.endswith(".json"):
+                try:
+                    session = self._load(name[:-5])
+                except (OSError, ValueError) as e:
+                    print(f"读取上传会话时出错: {name}, 错误: {str(e)}")
+                    continue
+                if session is not None:
+                    sessions.append(session)
+        return sessions
+
+    def cleanup_expired(self) -> None:
+        """删除长时间没有更新的会话和未完成的数据"""
+        now = time.time()
+        for session in self._sessions():
+            if now - session.get("updated_at", session["created_at"]) > self.session_ttl:
+                self._remove(session["id"])
+
+    def _schedule_indexing(self) -> None:
+        """扫描进程中唤醒后台线程加入索引；只读工作进程由扫描进程定期调用index_stored"""
+        if INDEX_MODE == "reader":
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._indexing_loop, name="upload-index", daemon=True)
+                self._worker.start()
+        self._wake.set()
+
+    def _indexing_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.index_stored()
+            except Exception as e:
+                print(f"上传文件加入索引时出错: {str(e)}")
+
+    def index_stored(self) -> int:
+        """
+        把已移入音乐库、还未加入索引的上传文件一次性加入索引并提取元数据（扫描进程使用）
+
+        Returns:
+            处理的会话数
+        """
+        from src.utils.file_utils import add_music_files
+
+        sessions = [session for session in self._sessions() if session["status"] == STATUS_STORED]
+        if not sessions:
+            return 0
+
+        file_ids = add_music_files([session["target"] for session in sessions])
+        for session in sessions:
+            file_id = file_ids.get(session["target"])
+            if file_id is not None:
+                session.update(status=STATUS_INDEXED, file_id=file_id)
+            else:
+                session.update(status=STATUS_FAILED, error="未能加入音乐库索引")
+            self._save(session)
+        print(f"上传的文件已加入索引: {len(file_ids)}/{len(sessions)}")
+        return len(sessions)
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _move_into_place(source: str, target: str, upload_id: str) -> None:
+    """
+    把上传的数据原子地移动到目标路径，目标已存在时不覆盖
+
+    上传目录与音乐库不在同一文件系统时，先复制到目标目录中的临时文件再改名，
+    扫描不会看到写了一半的音频文件。
+
+    Raises:
+        FileExistsError: 目标文件已存在
+    """
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+
+    temp_path = None
+    if os.stat(source).st_dev != os.stat(directory).st_dev:
+        # 临时文件名不以音频扩展名结尾，扫描时会被忽略
+        temp_path = os.path.join(directory, f".{os.path.basename(target)}.{upload_id}.part")
+        shutil.copyfile(source, temp_path)
+
+    moving = temp_path or source
+    try:
+        try:
+            # 硬链接在目标已存在时失败，不会覆盖其他文件
+            os.link(moving, target)
+            linked = True
+        except FileExistsError:
+            raise
+        except OSError:
+            # 文件系统不支持硬链接（如部分网络存储），退回到先检查再改名
+            if os.path.exists(target):
+                raise FileExistsError(target)
+            os.replace(moving, target)
+            linked = False
+        if linked:
+            os.remove(moving)
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+    if os.path.exists(source):
+        os.remove(source)
+
+# 创建全局实例
+upload_manager = UploadManager(UPLOAD_DIR, UPLOAD_MAX_SIZE_MB * 1024 * 1024, UPLOAD_SESSION_TTL)
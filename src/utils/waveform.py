@@ -0,0 +1,213 @@
+"""
+波形峰值生成与缓存
+
+对整首曲目解码一次，得到最细一级的每段最小/最大值，再逐级两两合并成多分辨率金字塔，
+以int8紧凑地保存到磁盘。缓存文件名由文件路径、大小和修改时间计算，文件变化后自动失效。
+"""
+
+import asyncio
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.config.settings import BASE_DIR, ANALYSIS_WORKERS
+
+# 缓存目录
+WAVEFORM_CACHE_DIR = os.path.join(BASE_DIR, "waveform_cache")
+
+# 最细一级的分段数，以及最粗一级的分段数
+BASE_BUCKETS = 8192
+MIN_BUCKETS = 16
+
+_MAGIC = b"WFP1"
+
+# 内存中保留的金字塔数量
+_MEMORY_CACHE_SIZE = 64
+_memory_cache: "OrderedDict[str, List[Any]]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# 正在生成中的波形，避免同一文件被并发请求重复计算
+_pending: Dict[str, "asyncio.Future"] = {}
+
+def waveform_cache_key(file_path: str) -> Optional[str]:
+    """根据文件路径、大小和修改时间计算缓存键，文件不存在时返回None"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    raw = f"{file_path}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _cache_file(key: str) -> str:
+    return os.path.join(WAVEFORM_CACHE_DIR, key + ".bin")
+
+def compute_peaks(file_path: str, buckets: int = BASE_BUCKETS):
+    """
+    解码音频并计算每段的最小/最大值
+
+    Returns:
+        形状为 (buckets, 2) 的int8数组，取值范围 -127~127
+    """
+    import numpy as np
+    import soundfile as sf
+
+    total = sf.info(file_path).frames
+    mins = np.full(buckets, np.inf, dtype=np.float32)
+    maxs = np.full(buckets, -np.inf, dtype=np.float32)
+
+    position = 0
+    for chunk in sf.blocks(file_path, blocksize=1 << 16, dtype="float32", always_2d=True):
+        if len(chunk) == 0:
+            continue
+        mono = chunk.mean(axis=1)
+        # 每个采样所属的分段；部分格式的总帧数只是估计值，需要截断
+        bucket_index = np.minimum(
+            np.arange(position, position + len(mono), dtype=np.int64) * buckets // max(total, 1),
+            buckets - 1
+        )
+        starts = np.flatnonzero(np.r_[True, bucket_index[1:] != bucket_index[:-1]])
+        ids = bucket_index[starts]
+        np.minimum.at(mins, ids, np.minimum.reduceat(mono, starts))
+        np.maximum.at(maxs, ids, np.maximum.reduceat(mono, starts))
+        position += len(mono)
+
+    # 没有采样的分段置0
+    empty = ~np.isfinite(mins)
+    mins[empty] = 0
+    maxs[empty] = 0
+
+    peaks = np.stack([mins, maxs], axis=1)
+    return np.clip(np.round(peaks * 127), -127, 127).astype(np.int8)
+
+def build_pyramid(peaks) -> List[Any]:
+    """由最细一级逐级两两合并，直到不少于MIN_BUCKETS段"""
+    import numpy as np
+
+    levels = [peaks]
+    while len(levels[-1]) >= MIN_BUCKETS * 2:
+        level = levels[-1]
+        even = level[: len(level) // 2 * 2].reshape(-1, 2, 2)
+        levels.append(np.stack([even[:, :, 0].min(axis=1), even[:, :, 1].max(axis=1)], axis=1))
+    return levels
+
+def _save_pyramid(path: str, levels: List[Any]) -> None:
+    """以紧凑的二进制格式保存金字塔：魔数、级数、每级长度和int8数据"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<H", len(levels)))
+        for level in levels:
+            f.write(struct.pack("<I", len(level)))
+        for level in levels:
+            f.write(level.tobytes())
+    os.replace(temp_path, path)
+
+def _load_pyramid(path: str) -> Optional[List[Any]]:
+    import numpy as np
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:4] != _MAGIC:
+        return None
+
+    (num_levels,) = struct.unpack_from("<H", data, 4)
+    lengths = struct.unpack_from(f"<{num_levels}I", data, 6)
+    offset = 6 + 4 * num_levels
+    levels = []
+    for length in lengths:
+        levels.append(np.frombuffer(data, dtype=np.int8, count=length * 2, offset=offset).reshape(length, 2))
+        offset += length * 2
+    return levels
+
+def generate_waveform(file_path: str, key: str) -> None:
+    """进程池任务：计算并保存波形金字塔"""
+    _save_pyramid(_cache_file(key), build_pyramid(compute_peaks(file_path)))
+
+def _remember(key: str, levels: List[Any]) -> None:
+    with _memory_lock:
+        _memory_cache[key] = levels
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > _MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def get_cached_pyramid(key: str) -> Optional[List[Any]]:
+    """从内存或磁盘读取已生成的金字塔"""
+    with _memory_lock:
+        levels = _memory_cache.get(key)
+        if levels is not None:
+            _memory_cache.move_to_end(key)
+            return levels
+
+    levels = _load_pyramid(_cache_file(key))
+    if levels is not None:
+        _remember(key, levels)
+    return levels
+
+def get_executor() -> ProcessPoolExecutor:
+    """波形生成使用的进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS)
+        return _executor
+
+async def load_waveform(file_path: str) -> Tuple[Optional[str], Optional[List[Any]]]:
+    """
+    获取文件的波形金字塔，首次访问时在进程池中生成
+
+    Returns:
+        (缓存键, 金字塔)；文件不存在时均为None
+    """
+    key = waveform_cache_key(file_path)
+    if key is None:
+        return None, None
+
+    levels = get_cached_pyramid(key)
+    if levels is not None:
+        return key, levels
+
+    future = _pending.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = asyncio.ensure_future(loop.run_in_executor(get_executor(), generate_waveform, file_path, key))
+        _pending[key] = future
+        future.add_done_callback(lambda _: _pending.pop(key, None))
+
+    await asyncio.shield(future)
+    return key, get_cached_pyramid(key)
+
+def sample_pyramid(levels: List[Any], points: int) -> Dict[str, Any]:
+    """
+    从金字塔中取指定点数的波形
+
+    选择不少于points段的最粗一级，再按区间合并到正好points段
+    """
+    import numpy as np
+
+    level = levels[0]
+    for candidate in reversed(levels):
+        if len(candidate) >= points:
+            level = candidate
+            break
+
+    points = min(points, len(level))
+    starts = np.linspace(0, len(level), points, endpoint=False).astype(np.int64)
+    mins = np.minimum.reduceat(level[:, 0], starts)
+    maxs = np.maximum.reduceat(level[:, 1], starts)
+    return {
+        "points": points,
+        "scale": 127,
+        "min": mins.tolist(),
+        "max": maxs.tolist()
+    }
@@ -0,0 +1,14 @@
+from src.utils.fuzzy_search import FuzzySearchIndex
+
+def _index(names):
+    return FuzzySearchIndex([{"id": str(i), "name": name, "metadata": {}} for i, name in enumerate(names)], 1)
+
+def test_returns_up_to_requested_limit():
+    index = _index([f"love song {i}.mp3" for i in range(300)])
+    assert len(index.search("love song", 200)) == 200
+
+def test_exact_matches_are_not_cut_before_scoring():
+    # 大量部分命中的曲目不会挤掉完全包含查询的曲目
+    names = [f"love songs of summer {i}.mp3" for i in range(500)] + ["lovesong.mp3"]
+    results = _index(names).search("lovesong", 5)
+    assert results[0]["name"] == "lovesong.mp3"
@@ -0,0 +1,91 @@
+import io
+import threading
+
+import pytest
+
+from src.utils import library_transfer
+from src.utils.library_index import LibraryIndex
+
+def _track(file_id, name, **metadata):
+    return {
+        "id": file_id,
+        "name": name,
+        "full_path": f"/music/{name}",
+        "add_time": 1700000000.0,
+        "metadata": dict(metadata, title=name.rsplit(".", 1)[0])
+    }
+
+@pytest.fixture
+def source(tmp_path):
+    index = LibraryIndex(str(tmp_path / "source.db"))
+    index.replace_all([_track("a", "一.flac", artist="甲"), _track("b", "two.mp3")], version=7, include_metadata=True)
+    index.save_track_ids([("a", "/music/一.flac", 1, 10, 100, 5), ("b", "/music/two.mp3", 1, 11, 200, 6)], [], {"old-a": "a"})
+    index.save_analysis([{"id": "a", "signature": "s1", "integrated_lufs": -14.5, "peak": 0.9, "gain_db": -3.5}])
+    index.save_fingerprints([{"id": "b", "signature": "s2", "payload_hash": "h", "fingerprint": b"\x00\x01\xff"}])
+    return index
+
+def _dump(index):
+    return {
+        "tracks": sorted(index.load_all(), key=lambda track: track["id"]),
+        "track_ids": sorted(index.load_track_ids()),
+        "aliases": index.load_id_aliases(),
+        "analysis": index.get_analysis_batch(["a", "b"]),
+        "fingerprints": index.get_fingerprints(["a", "b"]),
+        "include_metadata": index.get_meta("include_metadata")
+    }
+
+@pytest.mark.parametrize("fmt", ["ndjson", "binary"])
+def test_export_import_round_trip(source, tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(library_transfer, "library_index", source)
+    exported = b"".join(library_transfer.encode_records(library_transfer.iter_export_records(), fmt))
+
+    target = LibraryIndex(str(tmp_path / "target.db"))
+    monkeypatch.setattr(library_transfer, "library_index", target)
+    # 批大小为2，覆盖多个事务
+    counts = library_transfer.import_records(library_transfer.decode_records(io.BytesIO(exported), fmt), batch_size=2)
+
+    assert counts == {"tracks": 2, "aliases": 1, "analysis": 1, "fingerprints": 1, "skipped": 0}
+    assert _dump(target) == _dump(source)
+
+def test_import_rejects_truncated_binary(source, monkeypatch):
+    monkeypatch.setattr(library_transfer, "library_index", source)
+    exported = b"".join(library_transfer.encode_records(library_transfer.iter_export_records(), "binary"))
+
+    with pytest.raises(ValueError):
+        list(library_transfer.decode_records(io.BytesIO(exported[:-3]), "binary"))
+
+def test_pop_job_request_hands_out_each_job_once(tmp_path):
+    path = str(tmp_path / "index.db")
+    LibraryIndex(path).connection()  # 先建好表结构
+    producer = LibraryIndex(path)
+    for n in range(200):
+        producer.enqueue_job("import", n=n)
+
+    # 每个消费者使用独立的实例（相当于不同的进程）
+    popped = []
+    popped_lock = threading.Lock()
+
+    def consume():
+        consumer = LibraryIndex(path)
+        while True:
+            job = consumer.pop_job_request("import")
+            if job is None:
+                return
+            with popped_lock:
+                popped.append(job["n"])
+
+    threads = [threading.Thread(target=consume) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert sorted(popped) == list(range(200))
+
+def test_request_job_coalesces(tmp_path):
+    index = LibraryIndex(str(tmp_path / "index.db"))
+    index.request_job("analysis", n=1)
+    index.request_job("analysis", n=2)
+
+    assert index.pop_job_request("analysis")["n"] == 2
+    assert index.pop_job_request("analysis") is None
@@ -0,0 +1,32 @@
+import threading
+
+from src.models.player_commands import PlayerCommandQueue
+
+def _blocked_queue():
+    """返回 (命令队列, 放行事件, 执行记录)，队列的第一条命令会阻塞到事件被设置"""
+    commands = PlayerCommandQueue(thread_name="audio-test")
+    release = threading.Event()
+    executed = []
+    commands.submit(release.wait)
+    return commands, release, executed
+
+def test_coalesces_consecutive_commands():
+    commands, release, executed = _blocked_queue()
+    first = commands.submit(lambda p: executed.append(("seek", p)), 10, coalesce_key="seek")
+    second = commands.submit(lambda p: executed.append(("seek", p)), 20, coalesce_key="seek")
+    release.set()
+    second.result(timeout=5)
+
+    assert first is second
+    assert executed == [("seek", 20)]
+
+def test_does_not_coalesce_across_other_commands():
+    commands, release, executed = _blocked_queue()
+    commands.submit(lambda p: executed.append(("seek", p)), 10, coalesce_key="seek")
+    commands.submit(lambda name: executed.append(("play", name)), "new")
+    commands.submit(lambda p: executed.append(("seek", p)), 20, coalesce_key="seek")
+    last = commands.submit(lambda p: executed.append(("seek", p)), 30, coalesce_key="seek")
+    release.set()
+    last.result(timeout=5)
+
+    assert executed == [("seek", 10), ("play", "new"), ("seek", 30)]
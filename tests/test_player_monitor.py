@@ -0,0 +1,110 @@
+import threading
+import time
+
+import src.models.player as player_module
+from src.models.player import MusicPlayer
+
+class FakePlayback:
+    """模拟just_playback.Playback，load_file阻塞到gate被设置"""
+
+    gate = None
+
+    def __init__(self):
+        self.active = False
+        self.playing = False
+        self.paused = False
+        self.loops_at_end = False
+        self.curr_pos = 0.0
+        self.duration = 1.0
+        self.path = None
+
+    def load_file(self, path):
+        if FakePlayback.gate is not None:
+            FakePlayback.gate.wait(timeout=5)
+        self.path = path
+
+    def play(self):
+        self.active = self.playing = True
+
+    def stop(self):
+        self.active = self.playing = False
+
+    def pause(self):
+        self.playing, self.paused = False, True
+
+    def resume(self):
+        self.playing, self.paused = True, False
+
+    def set_volume(self, volume):
+        pass
+
+    def loop_at_end(self, loop):
+        self.loops_at_end = loop
+
+def _player(monkeypatch):
+    monkeypatch.setattr(player_module, "_new_playback", FakePlayback)
+    monkeypatch.setattr(player_module.read_cache, "resolve", lambda path: path)
+    monkeypatch.setattr(player_module.read_cache, "prefetch", lambda paths: None)
+    monkeypatch.setattr(player_module.playlist_store, "log_play", lambda track_id: None)
+    monkeypatch.setattr(MusicPlayer, "_gain_for", staticmethod(lambda path: 1.0))
+    monkeypatch.setattr(MusicPlayer, "_schedule_preload", lambda self: None)
+    monkeypatch.setattr(FakePlayback, "gate", None)
+    return MusicPlayer()
+
+def _entry(name):
+    return {"id": name, "name": name, "file_path": f"/music/{name}.mp3"}
+
+def test_monitor_parks_while_stopped(monkeypatch):
+    player = _player(monkeypatch)
+    player.load_file("/music/a.mp3")
+    player.play()
+    player.stop()
+
+    deadline = time.time() + 5
+    while player._monitor_wake.is_set() and time.time() < deadline:
+        time.sleep(0.01)
+    assert not player._monitor_wake.is_set()
+
+    player.load_file("/music/b.mp3")
+    player.play()
+    assert player._monitor_wake.is_set()
+
+def test_advance_loads_outside_lock(monkeypatch):
+    player = _player(monkeypatch)
+    player.enqueue([_entry("a"), _entry("b")])
+    gate = threading.Event()
+    FakePlayback.gate = gate
+
+    result = {}
+    skipping = threading.Thread(target=lambda: result.setdefault("entry", player.skip()))
+    skipping.start()
+    time.sleep(0.05)
+
+    # 加载期间其他播放控制不会被阻塞
+    assert player._lock.acquire(timeout=1)
+    player._lock.release()
+    assert [entry["name"] for entry in player.get_queue()] == ["b"]
+
+    gate.set()
+    skipping.join(timeout=5)
+    assert result["entry"]["name"] == "a"
+    assert player.current_song == "a"
+    assert player.playback.path == "/music/a.mp3"
+
+def test_stop_during_load_cancels_switch(monkeypatch):
+    player = _player(monkeypatch)
+    player.enqueue([_entry("a")])
+    gate = threading.Event()
+    FakePlayback.gate = gate
+
+    result = {}
+    skipping = threading.Thread(target=lambda: result.setdefault("entry", player.skip()))
+    skipping.start()
+    time.sleep(0.05)
+    player.stop()
+    gate.set()
+    skipping.join(timeout=5)
+
+    assert result["entry"] is None
+    assert not player.is_playing
+    assert player.current_song is None
@@ -0,0 +1,27 @@
+from src.utils import search_utils
+from src.utils.search_utils import begin_client_search, end_client_search
+
+def test_newer_search_supersedes_older():
+    first = begin_client_search("client-a")
+    second = begin_client_search("client-a")
+
+    assert first()
+    assert not second()
+
+    end_client_search(first)
+    assert not second()
+    end_client_search(second)
+
+def test_finished_searches_are_forgotten():
+    first = begin_client_search("client-b")
+    second = begin_client_search("client-b")
+    end_client_search(second)
+    assert "client-b" not in search_utils._client_generations
+
+    # 被取代后仍在执行的旧搜索不会因为新登记而恢复
+    third = begin_client_search("client-b")
+    assert first()
+    assert not third()
+    end_client_search(first)
+    end_client_search(third)
+    assert "client-b" not in search_utils._client_generations
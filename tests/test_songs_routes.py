@@ -0,0 +1,64 @@
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.routes import songs
+from src.utils import file_utils
+
+SONGS = [{"id": "a", "name": "a.mp3"}, {"id": "b", "name": "b.mp3"}, {"id": "c", "name": "c.mp3"}]
+
+@pytest.fixture
+def library(monkeypatch):
+    """替换当前快照和变更记录，返回可修改的快照"""
+    snapshot = SimpleNamespace(files=SONGS, version=12, include_metadata=False)
+    monkeypatch.setattr(songs, "get_library_snapshot", lambda force_refresh=False, include_metadata=False: snapshot)
+    monkeypatch.setattr(songs, "get_all_music_files", lambda include_metadata=False: snapshot.files)
+    monkeypatch.setattr(file_utils, "_library_version", 12)
+    monkeypatch.setattr(file_utils, "_change_log", deque([
+        {"version": 11, "added": ["a", "x"], "removed": [], "updated": []},
+        {"version": 12, "added": [], "removed": ["x", "z"], "updated": ["b"]},
+    ]))
+    return snapshot
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(songs.router)
+    return TestClient(app)
+
+def test_songs_not_modified(library, client):
+    first = client.get("/api/songs")
+    assert first.status_code == 200
+    assert first.headers["X-Library-Version"] == "12"
+    etag = first.headers["ETag"]
+
+    cached = client.get("/api/songs", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    library.version = 13
+    changed = client.get("/api/songs", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_songs_without_metadata_yet(library, client):
+    response = client.get("/api/songs", params={"include_metadata": True})
+    assert response.status_code == 202
+    assert "ETag" not in response.headers
+
+def test_song_changes_merges_log(library, client):
+    response = client.get("/api/songs/changes", params={"since": 10})
+    assert response.json() == {
+        "version": 12,
+        "full_resync": False,
+        "added": [SONGS[0]],
+        "removed": ["z"],
+        "updated": [SONGS[1]]
+    }
+
+    assert client.get("/api/songs/changes", params={"since": 12}).json()["added"] == []
+    assert client.get("/api/songs/changes", params={"since": 5}).json()["full_resync"] is True
@@ -0,0 +1,96 @@
+import os
+import shutil
+
+import pytest
+
+from src.utils import track_ids as track_ids_module
+from src.utils.library_index import LibraryIndex
+from src.utils.track_ids import TrackIdRegistry
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(track_ids_module, "library_index", LibraryIndex(str(tmp_path / "index.db")))
+    return TrackIdRegistry()
+
+def _write(path, content=b"audio"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+def _scan(registry, paths, roots):
+    """模拟一次完整扫描，返回 路径 -> ID"""
+    paths = list(paths)
+    ids = registry.assign([(path, os.stat(path)) for path in paths], roots=roots)
+    return dict(zip(paths, ids))
+
+def test_rename_keeps_id(registry, tmp_path):
+    root = str(tmp_path / "lib")
+    old = _write(tmp_path / "lib" / "a.flac")
+    first = _scan(registry, [old], [root])
+
+    new = str(tmp_path / "lib" / "b.flac")
+    os.rename(old, new)
+    second = _scan(registry, [new], [root])
+
+    assert second[new] == first[old]
+
+def test_remount_keeps_id(registry, tmp_path):
+    old = _write(tmp_path / "mnt1" / "lib" / "a.flac")
+    first = _scan(registry, [old], [str(tmp_path / "mnt1" / "lib")])
+
+    # 音乐库换了挂载位置：文件名、大小和修改时间相同，inode不同
+    new = str(tmp_path / "mnt2" / "lib" / "a.flac")
+    os.makedirs(os.path.dirname(new))
+    shutil.copy2(old, new)
+    os.remove(old)
+    second = _scan(registry, [new], [str(tmp_path / "mnt2" / "lib")])
+
+    assert second[new] == first[old]
+
+def test_copy_then_delete_aliases_old_id(registry, tmp_path):
+    root = str(tmp_path / "lib")
+    old = _write(tmp_path / "lib" / "a" / "x.flac")
+    first = _scan(registry, [old], [root])
+
+    new = str(tmp_path / "lib" / "b" / "x.flac")
+    os.makedirs(os.path.dirname(new))
+    shutil.copy2(old, new)
+    second = _scan(registry, [old, new], [root])
+    assert second[old] == first[old]
+    assert second[new] != first[old]
+
+    os.remove(old)
+    _scan(registry, [new], [root])
+    assert registry.resolve_alias(first[old]) == second[new]
+
+def test_deleted_file_is_pruned(registry, tmp_path):
+    root = str(tmp_path / "lib")
+    kept = _write(tmp_path / "lib" / "keep.flac", b"keep")
+    deleted = _write(tmp_path / "lib" / "gone.flac", b"gone")
+    first = _scan(registry, [kept, deleted], [root])
+    stat = os.stat(deleted)
+
+    os.remove(deleted)
+    _scan(registry, [kept], [root])
+    assert deleted not in registry._by_path
+    assert first[deleted] not in registry._records
+
+    # 之后出现的无关文件即使文件名、大小和修改时间与已删除的文件相同，也不会继承其ID
+    unrelated = _write(tmp_path / "lib" / "other" / "gone.flac", b"gone")
+    os.utime(unrelated, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    third = _scan(registry, [kept, unrelated], [root])
+    assert third[unrelated] != first[deleted]
+
+    # 登记的删除已写入索引
+    assert TrackIdRegistry().assign([(kept, os.stat(kept))]) == [first[kept]]
+    assert first[deleted] not in {row[0] for row in track_ids_module.library_index.load_track_ids()}
+
+def test_unwalked_root_keeps_records(registry, tmp_path):
+    root = str(tmp_path / "lib")
+    path = _write(tmp_path / "lib" / "a.flac")
+    first = _scan(registry, [path], [root])
+
+    # 目录没有遍历到任何文件（如未挂载）时不删除登记
+    _scan(registry, [], [])
+    assert registry._by_path.get(path) == first[path]
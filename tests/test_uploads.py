@@ -0,0 +1,62 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+
+import pytest
+
+from src.utils import uploads
+from src.utils.uploads import UploadManager, UploadOffsetMismatch
+
+DATA = b"0123456789" * 100
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    monkeypatch.setattr(uploads, "get_music_libraries", lambda: [str(library)])
+    monkeypatch.setattr(UploadManager, "_schedule_indexing", lambda self: None)
+    return UploadManager(str(tmp_path / "uploads"), 1024 * 1024, 3600)
+
+def _create(manager):
+    return manager.create("library", "a.flac", len(DATA), hashlib.sha256(DATA).hexdigest())["id"]
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+def test_upload_and_complete(manager, tmp_path):
+    upload_id = _create(manager)
+    asyncio.run(manager.write_chunk(upload_id, 0, _chunks(DATA[:300])))
+    asyncio.run(manager.write_chunk(upload_id, 300, _chunks(DATA[300:])))
+    result = asyncio.run(manager.complete(upload_id))
+
+    assert result["status"] == uploads.STATUS_STORED
+    assert (tmp_path / "library" / "a.flac").read_bytes() == DATA
+
+def test_chunk_rejected_while_another_worker_holds_the_file(manager):
+    upload_id = _create(manager)
+    # 模拟其他工作进程正在写入同一会话
+    with open(manager._data_path(upload_id), "r+b") as other:
+        fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+        with pytest.raises(UploadOffsetMismatch):
+            asyncio.run(manager.write_chunk(upload_id, 0, _chunks(DATA)))
+        with pytest.raises(uploads.UploadBusy):
+            asyncio.run(manager.complete(upload_id))
+    assert manager.get(upload_id)["offset"] == 0
+
+def test_missing_data_file_is_not_found(manager):
+    upload_id = _create(manager)
+    os.remove(manager._data_path(upload_id))
+    with pytest.raises(KeyError):
+        asyncio.run(manager.write_chunk(upload_id, 0, _chunks(DATA)))
+    with pytest.raises(KeyError):
+        asyncio.run(manager.complete(upload_id))
+
+def test_chunk_after_complete_is_rejected(manager, tmp_path):
+    upload_id = _create(manager)
+    asyncio.run(manager.write_chunk(upload_id, 0, _chunks(DATA)))
+    asyncio.run(manager.complete(upload_id))
+    with pytest.raises(ValueError):
+        asyncio.run(manager.write_chunk(upload_id, len(DATA), _chunks(b"x")))
+    assert (tmp_path / "library" / "a.flac").read_bytes() == DATA